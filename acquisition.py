@@ -0,0 +1,235 @@
+import random
+import struct
+import time
+
+import numpy as np
+import serial
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+
+from instrumentation import profiler
+
+
+class SampleSource(QObject):
+    """Base class for everything that feeds EEG samples into the acquisition path."""
+    # Signal with sample timestamps (epoch seconds) and frames (samples x channels)
+    samples_ready = pyqtSignal(object, object)
+    finished = pyqtSignal()
+    remote = False  # True when detection and dosing for these samples already run elsewhere
+    event_driven = False  # True when samples are pushed from the I/O loop and poll() must not be called
+
+    def __init__(self):
+        super().__init__()
+        # Sources poll on their own timer unless a SessionManager polls many of them from one timer
+        self.shared_polling = False
+        self.timer = QTimer()
+        self.timer.timeout.connect(self.poll)
+
+    def start_polling(self, interval_ms):
+        if not self.shared_polling:
+            self.timer.start(interval_ms)
+
+    def start(self):
+        raise NotImplementedError
+
+    def stop(self):
+        raise NotImplementedError
+
+    def poll(self):
+        """Emit whatever samples have become available since the last poll."""
+        raise NotImplementedError
+
+
+class SimulatedSource(SampleSource):
+    """Random single-channel data, generated at the configured sample rate."""
+
+    def __init__(self, sample_rate_hz=10, tick_ms=100):
+        super().__init__()
+        self.sample_rate_hz = sample_rate_hz
+        self.pending_samples = 0.0  # Fractional samples carried between polls
+        self.last_poll = None
+        self.tick_ms = tick_ms
+
+    def set_sample_rate(self, sample_rate_hz):
+        self.sample_rate_hz = sample_rate_hz
+
+    def start(self):
+        self.pending_samples = 0.0
+        self.last_poll = time.monotonic()
+        self.start_polling(self.tick_ms)
+
+    def stop(self):
+        self.timer.stop()
+        self.last_poll = None
+
+    def poll(self):
+        if self.last_poll is None:
+            return
+        # Generate as many samples as the configured rate produced since the last poll
+        now = time.monotonic()
+        self.pending_samples += self.sample_rate_hz * (now - self.last_poll)
+        self.last_poll = now
+        sample_count = int(self.pending_samples)
+        if not sample_count:
+            return
+        self.pending_samples -= sample_count
+        now = time.time()
+        timestamps = now - np.arange(sample_count - 1, -1, -1) / self.sample_rate_hz
+        frames = np.array([[random.uniform(-1, 1)] for _ in range(sample_count)])  # Simulate EEG data
+        self.samples_ready.emit(timestamps, frames)
+
+
+# Serial frame layout: sync word, channel count, sequence number, float32 samples, checksum
+FRAME_SYNC = b'\xa5\x5a'
+FRAME_HEADER = struct.Struct('<2sHI')
+MAX_CHANNELS = 256
+
+
+def encode_frame(sequence, values):
+    """Encode one multi-channel sample as a serial frame."""
+    payload = FRAME_HEADER.pack(FRAME_SYNC, len(values), sequence & 0xFFFFFFFF) + np.asarray(values, dtype='<f4').tobytes()
+    return payload + bytes([sum(payload[2:]) & 0xFF])
+
+
+class FrameDecoder:
+    """Incremental decoder for serial frames that resynchronises after framing errors."""
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.last_sequence = None
+        self.frames_decoded = 0
+        self.framing_errors = 0
+        self.dropped_frames = 0  # Gaps in the sequence numbers
+
+    def feed(self, data):
+        """Decode all complete frames; returns (sequences, frames) arrays."""
+        self.buffer += data
+        buffer = bytes(self.buffer)
+        sequences = []
+        frames = []
+        position = 0
+        while len(buffer) - position >= FRAME_HEADER.size:
+            if buffer[position:position + 2] != FRAME_SYNC:
+                # Lost sync: skip to the next sync word
+                next_sync = buffer.find(FRAME_SYNC, position + 1)
+                self.framing_errors += 1
+                if next_sync < 0:
+                    position = len(buffer) - 1
+                    break
+                position = next_sync
+                continue
+            _, channel_count, _ = FRAME_HEADER.unpack_from(buffer, position)
+            if not 0 < channel_count <= MAX_CHANNELS:
+                self.framing_errors += 1
+                position += 1
+                continue
+            frame_size = FRAME_HEADER.size + 4 * channel_count + 1
+            # Decode the run of same-sized frames at once
+            count = (len(buffer) - position) // frame_size
+            if not count:
+                break
+            rows = np.frombuffer(buffer, dtype=np.uint8, count=count * frame_size, offset=position).reshape(count, frame_size)
+            valid = (
+                (rows[:, 0] == FRAME_SYNC[0]) & (rows[:, 1] == FRAME_SYNC[1]) &
+                (rows[:, 2] == (channel_count & 0xFF)) & (rows[:, 3] == (channel_count >> 8)) &
+                ((rows[:, 2:-1].sum(axis=1, dtype=np.uint32) & 0xFF) == rows[:, -1])
+            )
+            good = count if valid.all() else int(np.argmin(valid))
+            if good:
+                run = rows[:good]
+                sequences.append(run[:, 4:8].copy().view('<u4').ravel().astype(np.int64))
+                frames.append(run[:, FRAME_HEADER.size:-1].copy().view('<f4').astype(float))
+                position += good * frame_size
+            if good < count:
+                # Corrupt frame: resynchronise from the byte after its sync word
+                self.framing_errors += 1
+                position += 1
+        self.buffer = bytearray(buffer[position:])
+        if not sequences:
+            return np.empty(0, dtype=np.int64), np.empty((0, 0))
+        if len({chunk.shape[1] for chunk in frames}) > 1:
+            # Channel count changed mid-stream; keep the latest layout
+            sequences, frames = sequences[-1:], frames[-1:]
+        sequences = np.concatenate(sequences)
+        frames = np.concatenate(frames)
+        self.count_gaps(sequences)
+        self.frames_decoded += len(sequences)
+        return sequences, frames
+
+    def count_gaps(self, sequences):
+        previous = np.concatenate([[self.last_sequence], sequences[:-1]]) if self.last_sequence is not None else sequences[:-1]
+        current = sequences if self.last_sequence is not None else sequences[1:]
+        gaps = (current - previous - 1) & 0xFFFFFFFF
+        # Ignore resets and reordering, which show up as huge wrapped gaps
+        self.dropped_frames += int(gaps[gaps < 0x80000000].sum())
+        self.last_sequence = int(sequences[-1])
+
+
+class SerialSource(SampleSource):
+    """Reads framed multi-channel samples from a serial port (or pseudo-terminal) with pyserial."""
+
+    def __init__(self, port, sample_rate_hz, baudrate=921600, poll_ms=10):
+        super().__init__()
+        self.port = port
+        self.sample_rate_hz = sample_rate_hz
+        self.baudrate = baudrate
+        self.serial_port = None
+        self.decoder = FrameDecoder()
+        self.poll_ms = poll_ms
+
+    def set_sample_rate(self, sample_rate_hz):
+        self.sample_rate_hz = sample_rate_hz
+
+    def start(self):
+        self.open_port()
+        self.start_polling(self.poll_ms)
+
+    def stop(self):
+        self.timer.stop()
+        self.close_port()
+
+    def open_port(self):
+        if self.serial_port is None or not self.serial_port.is_open:
+            self.serial_port = serial.serial_for_url(self.port, baudrate=self.baudrate, timeout=0)
+        self.decoder = FrameDecoder()
+        self.first_sequence = None
+        self.first_time = None
+        print(f"Reading EEG frames from {self.port}.")
+
+    def close_port(self):
+        if self.serial_port is not None and self.serial_port.is_open:
+            self.serial_port.close()
+            print(f"Closed {self.port}: {self.decoder.frames_decoded} frames, "
+                  f"{self.decoder.dropped_frames} dropped, {self.decoder.framing_errors} framing errors.")
+
+    def poll(self):
+        if self.serial_port is None or not self.serial_port.is_open:
+            return
+        try:
+            # Drain everything the port has buffered since the last poll
+            data = bytearray()
+            while True:
+                chunk = self.serial_port.read(max(self.serial_port.in_waiting, 1))
+                data += chunk
+                if not chunk or not self.serial_port.in_waiting:
+                    break
+        except serial.SerialException as e:
+            print(f"Serial read from {self.port} failed: {e}")
+            self.stop()
+            self.finished.emit()
+            return
+        if not data:
+            return
+        dropped_before = self.decoder.dropped_frames
+        errors_before = self.decoder.framing_errors
+        sequences, frames = self.decoder.feed(data)
+        profiler.count('dropped_samples', self.decoder.dropped_frames - dropped_before)
+        profiler.count('framing_errors', self.decoder.framing_errors - errors_before)
+        if not len(sequences):
+            return
+        if self.first_sequence is None:
+            self.first_sequence = int(sequences[0])
+            self.first_time = time.time()
+        # Timestamps follow the device's sample clock, so dropped frames leave gaps
+        elapsed_samples = (sequences - self.first_sequence) & 0xFFFFFFFF
+        timestamps = self.first_time + elapsed_samples / self.sample_rate_hz
+        self.samples_ready.emit(timestamps, frames)
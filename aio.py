@@ -0,0 +1,260 @@
+import asyncio
+import concurrent.futures
+import io
+import json
+import sqlite3
+import threading
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+from acquisition import SerialSource
+from journal import EventJournal
+
+HTTP_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 500: 'Internal Server Error'}
+
+
+class IOLoop:
+    """An asyncio event loop on its own thread, shared by serial devices, the journal and exports.
+
+    Qt keeps the GUI thread; everything that waits on a file descriptor waits here instead,
+    so one thread serves any number of devices. Results reach Qt objects through signals,
+    which Qt queues onto the receiver's thread.
+    """
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.run, name='io-loop', daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+        self.loop.close()
+
+    def in_loop_thread(self):
+        return threading.current_thread() is self.thread
+
+    def submit(self, coroutine):
+        """Schedule a coroutine from any thread; returns a concurrent.futures.Future."""
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    def call_soon(self, function, *args):
+        self.loop.call_soon_threadsafe(function, *args)
+
+    def call(self, function, *args, timeout=5):
+        """Run function on the loop thread and wait for its result."""
+        if self.in_loop_thread() or not self.thread.is_alive():
+            return function(*args)
+        future = concurrent.futures.Future()
+
+        def run():
+            try:
+                future.set_result(function(*args))
+            except Exception as e:
+                future.set_exception(e)
+        self.loop.call_soon_threadsafe(run)
+        return future.result(timeout)
+
+    def stop(self, timeout=5):
+        if not self.thread.is_alive():
+            return
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout)
+
+
+class AsyncSerialSource(SerialSource):
+    """SerialSource driven by readiness of the port's file descriptor on the I/O loop instead of a timer."""
+    event_driven = True
+
+    def __init__(self, io_loop, port, sample_rate_hz, baudrate=921600, poll_ms=10):
+        super().__init__(port, sample_rate_hz, baudrate, poll_ms)
+        self.io_loop = io_loop
+        self.fd = None
+
+    def start(self):
+        self.open_port()
+        try:
+            self.fd = self.serial_port.fileno()
+        except (AttributeError, io.UnsupportedOperation):
+            # No selectable descriptor (e.g. Windows or socket:// URLs): fall back to polling
+            self.event_driven = False
+            self.start_polling(self.poll_ms)
+            return
+        self.io_loop.call(self.io_loop.loop.add_reader, self.fd, self.poll)
+
+    def stop(self):
+        if self.fd is not None:
+            # Once the reader is removed poll() never runs again; this is safe from inside poll() too
+            self.io_loop.call(self.io_loop.loop.remove_reader, self.fd)
+            self.fd = None
+        elif not self.event_driven:
+            self.timer.stop()
+        self.close_port()
+
+
+class AsyncJournal:
+    """EventJournal fed from any thread; writes and fsyncs happen off the caller's thread, in order.
+
+    Events queued while a write is in flight are written together, with one fsync per file,
+    so bursts cost one disk flush rather than one per event.
+    """
+
+    def __init__(self, io_loop, fsync_policy='batch', batch_size=32, indexes=()):
+        self.io_loop = io_loop
+        self.journal = EventJournal(fsync_policy, batch_size)
+        # Derived stores (EventDatabase, SeizureAnalytics) told about each write, on the writer thread
+        self.indexes = list(indexes)
+        # A single writer thread keeps records in submission order
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='journal')
+        self.queue = io_loop.call(asyncio.Queue)
+        self.writer_task = io_loop.call(io_loop.loop.create_task, self.write_events())
+
+    @property
+    def unsynced(self):
+        return self.journal.unsynced
+
+    def queued(self):
+        return self.queue.qsize()
+
+    def append(self, filename, event):
+        self.io_loop.call_soon(self.queue.put_nowait, (filename, event))
+
+    def append_batch(self, filename, events):
+        # One hop to the loop thread for a whole block of records, e.g. streamed samples
+        self.io_loop.call_soon(self.enqueue, filename, events)
+
+    def close_file(self, filename):
+        # Queued behind the file's pending records, so they are written before the handle closes
+        self.io_loop.call_soon(self.queue.put_nowait, (filename, None))
+
+    def enqueue(self, filename, events):
+        for event in events:
+            self.queue.put_nowait((filename, event))
+
+    async def write_events(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            while not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            await loop.run_in_executor(self.writer, self.write_batch, batch)
+            for _ in batch:
+                self.queue.task_done()
+
+    def write_batch(self, batch):
+        events_by_file = {}
+        closing = []
+        for filename, event in batch:
+            if event is None:  # close_file() marker
+                closing.append(filename)
+                continue
+            events_by_file.setdefault(filename, []).append(event)
+        for filename, events in events_by_file.items():
+            try:
+                offsets = self.journal.append_batch(filename, events)
+            except OSError as e:
+                print(f"Journal write to {filename} failed: {e}")
+                continue  # Indexes only hold what the journal holds, so a rebuild gives the same rows
+            for index in self.indexes:
+                try:
+                    index.index_events(filename, events, offsets=offsets)
+                except (sqlite3.Error, OSError) as e:  # The journal stays authoritative; rebuild to repair an index
+                    print(f"Indexing {filename} events failed: {e}")
+        for filename in closing:
+            try:
+                self.journal.close_file(filename)
+            except OSError as e:
+                print(f"Closing {filename} failed: {e}")
+
+    def flush(self, timeout=10):
+        """Wait until every queued event has been handed to the OS."""
+        self.io_loop.submit(self.queue.join()).result(timeout)
+
+    def set_fsync_policy(self, policy):
+        if policy not in EventJournal.FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy: {policy}")
+        self.writer.submit(self.journal.set_fsync_policy, policy)
+
+    def sync(self):
+        self.flush()
+        self.writer.submit(self.journal.sync).result()
+
+    def close(self):
+        self.flush()
+        self.io_loop.call(self.writer_task.cancel)
+        self.writer.submit(self.journal.close).result()
+        self.writer.shutdown()
+
+
+class ExportServer:
+    """Read-only HTTP endpoint on localhost serving JSON exports from the I/O loop.
+
+    routes maps a path to a callable taking the query parameters and returning JSON-serialisable data.
+    Route callables run on a worker thread so slow reads never stall device I/O.
+    """
+
+    def __init__(self, io_loop, routes, host='127.0.0.1', port=8765):
+        self.io_loop = io_loop
+        self.routes = routes
+        self.host = host
+        self.port = port
+        self.server = None
+
+    def start(self):
+        self.server = self.io_loop.submit(asyncio.start_server(self.handle, self.host, self.port)).result(5)
+        self.port = self.server.sockets[0].getsockname()[1]
+        print(f"Export endpoint listening on http://{self.host}:{self.port}/")
+
+    def stop(self):
+        if self.server is None:
+            return
+        self.io_loop.call(self.server.close)
+        self.server = None
+
+    async def handle(self, reader, writer):
+        try:
+            request_line = (await reader.readline()).decode('latin-1').split()
+            while (await reader.readline()).strip():
+                pass  # Headers are not used
+            status, body = await self.respond(request_line)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            writer.close()
+            return
+        payload = json.dumps(body).encode()
+        writer.write(f"HTTP/1.0 {status} {HTTP_REASONS[status]}\r\n"
+                     f"Content-Type: application/json\r\n"
+                     f"Content-Length: {len(payload)}\r\n\r\n".encode() + payload)
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def respond(self, request_line):
+        if len(request_line) < 2:
+            return 400, {'error': 'Malformed request'}
+        method, target = request_line[0], request_line[1]
+        if method != 'GET':
+            return 405, {'error': 'Only GET is supported'}
+        url = urllib.parse.urlsplit(target)
+        route = self.routes.get(url.path)
+        if route is None:
+            return 404, {'error': f"Unknown export {url.path}", 'exports': sorted(self.routes)}
+        params = dict(urllib.parse.parse_qsl(url.query))
+        try:
+            return 200, await asyncio.get_running_loop().run_in_executor(None, route, params)
+        except (ValueError, KeyError) as e:
+            return 400, {'error': str(e)}
+        except Exception as e:
+            return 500, {'error': str(e)}
+
+
+def read_journal(filename, limit=None):
+    """Events recorded in a JSON-lines journal file, newest last."""
+    try:
+        with open(filename, 'r') as f:
+            events = [json.loads(line) for line in f if line.strip()]
+    except FileNotFoundError:
+        return []
+    return events[-limit:] if limit else events
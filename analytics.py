@@ -0,0 +1,280 @@
+import datetime
+import json
+import os
+import threading
+
+from PyQt5.QtCore import QObject, pyqtSignal
+
+from journal import encode_record
+from protocols import EPISODE_GAP_S
+from replay import parse_timestamp
+
+ANALYTICS_FILE = "seizure_analytics.json"
+RESPONSE_WINDOW_S = 600  # A dose "responded" when its episode ended within this long
+JOURNAL_FILES = ('seizure_events.json', 'medication_log.json')
+
+
+class RunningStats:
+    """Count, mean, min and max of a series without keeping the series."""
+
+    def __init__(self, state=None):
+        state = state or {}
+        self.count = state.get('count', 0)
+        self.total = state.get('total', 0.0)
+        self.minimum = state.get('minimum')
+        self.maximum = state.get('maximum')
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        self.minimum = value if self.minimum is None else min(self.minimum, value)
+        self.maximum = value if self.maximum is None else max(self.maximum, value)
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    def state(self):
+        return {'count': self.count, 'total': self.total, 'minimum': self.minimum, 'maximum': self.maximum}
+
+
+class PatientStats:
+    """Precomputed episode and dose aggregates for one patient, updated one event at a time."""
+
+    def __init__(self, state=None):
+        state = state or {}
+        self.durations = RunningStats(state.get('durations'))
+        self.inter_ictal = RunningStats(state.get('inter_ictal'))
+        self.hour_histogram = state.get('hour_histogram', [0] * 24)  # Episode starts by hour of day
+        self.episodes_per_day = state.get('episodes_per_day', {})
+        self.medications = {name: dict(stats, latency=RunningStats(stats['latency']))
+                            for name, stats in state.get('medications', {}).items()}
+        self.open_episode = state.get('open_episode')  # {'start', 'last_seen', 'manual', 'doses'}
+        self.last_episode_end = state.get('last_episode_end')
+
+    def medication(self, name):
+        stats = self.medications.get(name)
+        if stats is None:
+            stats = self.medications[name] = {
+                'doses': 0, 'total_mg': 0.0, 'during_episode': 0, 'responded': 0, 'latency': RunningStats()
+            }
+        return stats
+
+    def on_seizure_event(self, time, event, duration_s=None):
+        episode = self.open_episode
+        if event == 'Seizure Ended':
+            # Journalled an episode gap after the last detection, with the detected duration
+            if episode is not None:
+                self.close_episode(episode['start'] + duration_s if duration_s is not None else episode['last_seen'])
+            return
+        # Older journals have a detection per detector tick and no 'Seizure Ended'; the protocol
+        # selector's gap splits them into the same episodes the dosing acted on
+        if episode is not None and not episode['manual'] and time - episode['last_seen'] > EPISODE_GAP_S:
+            self.close_episode(episode['last_seen'])
+            episode = None
+        if event == 'Seizure Stop':
+            if episode is not None:
+                self.close_episode(time)
+            return
+        if episode is None:
+            self.open_episode = {'start': time, 'last_seen': time, 'manual': event == 'Seizure Start', 'doses': []}
+        else:
+            episode['last_seen'] = time
+
+    def on_dose(self, time, medication, dose_mg):
+        stats = self.medication(medication)
+        stats['doses'] += 1
+        stats['total_mg'] += dose_mg
+        episode = self.open_episode
+        if episode is not None:  # Detected episodes stay open until 'Seizure Ended' or the next one starts
+            stats['during_episode'] += 1
+            episode['doses'].append([medication, time])
+
+    def close_episode(self, end):
+        episode = self.open_episode
+        self.open_episode = None
+        start = episode['start']
+        self.durations.add(end - start)
+        if self.last_episode_end is not None:
+            self.inter_ictal.add(start - self.last_episode_end)
+        self.last_episode_end = end
+        started = datetime.datetime.fromtimestamp(start)
+        self.hour_histogram[started.hour] += 1
+        day = started.strftime('%Y-%m-%d')
+        self.episodes_per_day[day] = self.episodes_per_day.get(day, 0) + 1
+        # Dose response: how long after each dose the episode ended
+        for medication, dose_time in episode['doses']:
+            stats = self.medication(medication)
+            latency = max(0.0, end - dose_time)
+            stats['latency'].add(latency)
+            if latency <= RESPONSE_WINDOW_S:
+                stats['responded'] += 1
+
+    def summary(self):
+        return {
+            'episodes': self.durations.count,
+            'episode_open': self.open_episode is not None,
+            'mean_duration_s': self.durations.mean,
+            'max_duration_s': self.durations.maximum,
+            'total_duration_s': self.durations.total,
+            'mean_inter_ictal_s': self.inter_ictal.mean,
+            'min_inter_ictal_s': self.inter_ictal.minimum,
+            'last_episode_end': self.last_episode_end,
+            'hour_histogram': list(self.hour_histogram),
+            'days_with_episodes': len(self.episodes_per_day),
+            'medications': {name: {
+                'doses': stats['doses'],
+                'total_mg': stats['total_mg'],
+                'during_episode': stats['during_episode'],
+                'responded': stats['responded'],
+                'mean_time_to_end_s': stats['latency'].mean,
+            } for name, stats in sorted(self.medications.items())},
+        }
+
+    def state(self):
+        return {
+            'durations': self.durations.state(),
+            'inter_ictal': self.inter_ictal.state(),
+            'hour_histogram': self.hour_histogram,
+            'episodes_per_day': self.episodes_per_day,
+            'medications': {name: dict(stats, latency=stats['latency'].state())
+                            for name, stats in self.medications.items()},
+            'open_episode': self.open_episode,
+            'last_episode_end': self.last_episode_end,
+        }
+
+
+class SeizureAnalytics(QObject):
+    """Per-patient seizure statistics maintained incrementally from the event journals.
+
+    Aggregates and the journal offsets they cover are persisted together, so startup only
+    reads journal lines written since the last run.
+    """
+    updated = pyqtSignal(str)  # Signal with the patient id whose statistics changed
+
+    def __init__(self, path=ANALYTICS_FILE, journal_files=JOURNAL_FILES):
+        super().__init__()
+        self.path = path
+        self.journal_files = journal_files
+        self.lock = threading.Lock()  # Updated by the journal writer thread, read by the GUI
+        self.patients = {}
+        self.offsets = {}
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r') as f:
+                state = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Could not read {self.path}: {e}. Rebuilding seizure statistics.")
+            return
+        if state.get('episode_gap_s') != EPISODE_GAP_S:
+            print(f"{self.path} was built with another episode gap. Rebuilding seizure statistics.")
+            return
+        self.offsets = state.get('offsets', {})
+        self.patients = {patient_id: PatientStats(stats) for patient_id, stats in state.get('patients', {}).items()}
+
+    def save(self):
+        with self.lock:
+            state = {
+                'episode_gap_s': EPISODE_GAP_S,
+                'offsets': dict(self.offsets),
+                'patients': {patient_id: stats.state() for patient_id, stats in self.patients.items()},
+            }
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.path)
+
+    def catch_up(self):
+        """Apply journal lines written since the saved offsets; rebuilds if a journal was truncated."""
+        if any(os.path.exists(name) and os.path.getsize(name) < self.offsets.get(name, 0) for name in self.journal_files):
+            print("Event journal is shorter than when statistics were saved; rebuilding seizure statistics.")
+            with self.lock:
+                self.patients = {}
+                self.offsets = {}
+        records = []
+        offsets = {}
+        for name in self.journal_files:
+            if not os.path.exists(name):
+                continue
+            offset = self.offsets.get(name, 0)
+            with open(name, 'rb') as f:
+                f.seek(offset)
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        break  # Another process is still writing this record; it is read next time
+                    offset += len(line)
+                    if line.strip():
+                        try:
+                            records.append((name, json.loads(line)))
+                        except json.JSONDecodeError:
+                            continue
+            offsets[name] = offset
+        # The two journals interleave in time; apply them in one time order
+        records.sort(key=lambda record: event_time(record[1]) or 0.0)
+        with self.lock:
+            changed = {self.apply(name, event) for name, event in records}
+            self.offsets.update(offsets)
+        changed.discard(None)
+        if records:
+            self.save()
+        return changed
+
+    def index_events(self, filename, events, offsets=None):
+        """Journal listener: called on the journal writer thread after events reach the file.
+
+        The batch is applied directly only if it starts where the applied records end. Otherwise
+        another process (the daemon) appended in between, and everything new is read from the file.
+        """
+        if filename not in self.journal_files or not events:
+            return
+        if offsets is None or offsets[0] != self.offsets.get(filename, 0):
+            changed = self.catch_up()
+        else:
+            with self.lock:
+                changed = {self.apply(filename, event) for event in events}
+                self.offsets[filename] = offsets[-1] + len(encode_record(events[-1]))
+            changed.discard(None)
+        for patient_id in changed:
+            self.updated.emit(patient_id)
+
+    def apply(self, filename, event):
+        time = event_time(event)
+        if time is None:
+            return None
+        if filename != 'seizure_events.json':
+            try:
+                dose_mg = float(event.get('dose_mg', 0))
+            except (TypeError, ValueError):
+                return None
+        patient_id = event.get('patient_id') or ''
+        stats = self.patients.get(patient_id)
+        if stats is None:
+            stats = self.patients[patient_id] = PatientStats()
+        if filename == 'seizure_events.json':
+            stats.on_seizure_event(time, event.get('event', ''), event.get('duration_s'))
+        elif 'medication' in event:
+            stats.on_dose(time, str(event['medication']), dose_mg)
+        return patient_id
+
+    def close(self):
+        self.save()
+
+    def patient_ids(self):
+        with self.lock:
+            return sorted(self.patients)
+
+    def summary(self, patient_id):
+        with self.lock:
+            stats = self.patients.get(patient_id)
+            return stats.summary() if stats else PatientStats().summary()
+
+
+def event_time(event):
+    try:
+        return parse_timestamp(event['timestamp'])
+    except (KeyError, ValueError, TypeError):
+        return None
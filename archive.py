@@ -0,0 +1,306 @@
+import argparse
+import bisect
+import datetime
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from replay import load_event_timeline, load_recording, parse_timestamp
+
+ARCHIVE_DIR = "archive"
+BLOCK_SAMPLES = 4096  # Samples per compressed block; a query decompresses whole blocks only
+BLOCK_HEADER = struct.Struct('<IHB')  # Sample count, channel count, bytes per stored sample value (4 or 8)
+LEGACY_BLOCK_HEADER = struct.Struct('<IHdq')  # Codec 1: sample count, channel count, quantum, first timestamp (us)
+CODEC = 2  # Catalog entries without a codec hold codec 1 blocks, which were quantised
+COMPRESSION_LEVEL = 1  # zlib's fastest level; XOR coding and shuffling do most of the work
+
+
+def shuffle_bytes(values):
+    # Group the n-th byte of every value together so the mostly-zero high bytes compress to nothing
+    return values.view(np.uint8).reshape(-1, values.itemsize).T.tobytes()
+
+
+def unshuffle_bytes(data, dtype, count):
+    itemsize = np.dtype(dtype).itemsize
+    return np.frombuffer(data, dtype=np.uint8, count=count * itemsize).reshape(itemsize, count).T.copy().view(dtype).ravel()
+
+
+def xor_encode(values, bits_dtype):
+    # Each value's bit pattern XORed with the previous one along axis 0: slowly changing values
+    # share sign, exponent and high mantissa bits, which become zero bytes
+    bits = np.ascontiguousarray(values).view(bits_dtype)
+    coded = bits.copy()
+    coded[1:] ^= bits[:-1]
+    return coded
+
+
+def encode_block(timestamps, frames):
+    """Compress a run of samples losslessly: XOR-coded float bit patterns, byte-shuffled and deflated.
+
+    Channels are stored as float32 when every value survives the conversion exactly, otherwise as
+    float64. Non-finite samples (NaN marks a gap) round-trip unchanged; timestamps must be finite.
+    """
+    timestamps = np.asarray(timestamps, dtype='<f8')
+    frames = np.asarray(frames, dtype='<f8')
+    if not np.all(np.isfinite(timestamps)):
+        raise ValueError("Cannot archive samples with non-finite timestamps")
+    count, channel_count = frames.shape
+    narrow = frames.astype('<f4')
+    if np.array_equal(narrow.astype('<f8'), frames, equal_nan=True):
+        frames, bits_dtype = narrow, '<u4'
+    else:
+        bits_dtype = '<u8'
+    header = BLOCK_HEADER.pack(count, channel_count, frames.itemsize)
+    return zlib.compress(header + shuffle_bytes(xor_encode(timestamps, '<u8'))
+                         + shuffle_bytes(xor_encode(frames, bits_dtype).ravel()), COMPRESSION_LEVEL)
+
+
+def decode_block(payload, codec=CODEC):
+    if codec == 1:
+        return decode_quantised_block(payload)
+    data = zlib.decompress(payload)
+    count, channel_count, itemsize = BLOCK_HEADER.unpack_from(data)
+    offset = BLOCK_HEADER.size
+    timestamp_bits = unshuffle_bytes(data[offset:offset + 8 * count], '<u8', count)
+    offset += 8 * count
+    bits_dtype, float_dtype = ('<u4', '<f4') if itemsize == 4 else ('<u8', '<f8')
+    frame_bits = unshuffle_bytes(data[offset:], bits_dtype, count * channel_count).reshape(count, channel_count)
+    timestamps = np.bitwise_xor.accumulate(timestamp_bits).view('<f8')
+    frames = np.bitwise_xor.accumulate(frame_bits, axis=0).view(float_dtype).astype(np.float64)
+    return timestamps, frames
+
+
+def decode_quantised_block(payload):
+    # Blocks archived before the codec was lossless: microsecond timestamps, values on a fixed quantum
+    data = zlib.decompress(payload)
+    count, channel_count, quantum, first_us = LEGACY_BLOCK_HEADER.unpack_from(data)
+    offset = LEGACY_BLOCK_HEADER.size
+    timestamp_deltas = unshuffle_bytes(data[offset:offset + 8 * (count - 1)], '<i8', count - 1)
+    offset += 8 * (count - 1)
+    level_deltas = unshuffle_bytes(data[offset:], '<i4', count * channel_count).reshape(count, channel_count)
+    timestamps = np.concatenate(([first_us], first_us + np.cumsum(timestamp_deltas))) / 1e6
+    frames = np.cumsum(level_deltas, axis=0, dtype=np.int64) * quantum
+    return timestamps, frames
+
+
+class EEGArchive:
+    """Per-patient store of compressed sessions with a catalog for time-range queries and retention."""
+
+    def __init__(self, root=ARCHIVE_DIR):
+        self.root = root
+        self.lock = threading.Lock()  # Archiving runs on worker threads
+
+    def patient_dir(self, patient_id):
+        # Keep patient IDs from escaping the archive directory
+        safe_id = "".join(c if c.isalnum() or c in "-_." else "_" for c in str(patient_id)) or "unknown"
+        return os.path.join(self.root, safe_id)
+
+    def catalog_path(self, patient_id):
+        return os.path.join(self.patient_dir(patient_id), "catalog.json")
+
+    def load_catalog(self, patient_id):
+        path = self.catalog_path(patient_id)
+        if not os.path.exists(path):
+            return {'patient_id': patient_id, 'patient': None, 'sessions': []}
+        with open(path, 'r') as f:
+            return json.load(f)
+
+    def save_catalog(self, patient_id, catalog):
+        path = self.catalog_path(patient_id)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(catalog, f, indent=4)
+        os.replace(tmp_path, path)
+
+    def patients(self):
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(name for name in os.listdir(self.root)
+                      if os.path.exists(os.path.join(self.root, name, "catalog.json")))
+
+    def archive_session(self, recording_path, patient_id, events_paths=('seizure_events.json', 'medication_log.json'),
+                        remove_source=False):
+        """Compress a finished recording into the patient's archive; returns the catalog entry."""
+        timestamps, frames = load_recording(recording_path)
+        start, end = float(timestamps[0]), float(timestamps[-1])
+        session_id = os.path.splitext(os.path.basename(recording_path))[0]
+        directory = self.patient_dir(patient_id)
+        os.makedirs(directory, exist_ok=True)
+        data_file = session_id + ".eegz"
+
+        blocks = []
+        offset = 0
+        with open(os.path.join(directory, data_file), 'wb') as f:
+            for position in range(0, len(timestamps), BLOCK_SAMPLES):
+                block_timestamps = timestamps[position:position + BLOCK_SAMPLES]
+                payload = encode_block(block_timestamps, frames[position:position + BLOCK_SAMPLES])
+                f.write(payload)
+                blocks.append([float(block_timestamps[0]), float(block_timestamps[-1]), offset, len(payload)])
+                offset += len(payload)
+            f.flush()
+            os.fsync(f.fileno())
+
+        # Events shared by all beds carry a patient_id; untagged ones belong to the single-bed window
+        events = []
+        for events_path in events_paths:
+            for _, event in load_event_timeline(events_path, start, end):
+                if event.get('patient_id', patient_id) == patient_id:
+                    events.append(event)
+
+        entry = {
+            'session_id': session_id,
+            'data_file': data_file,
+            'codec': CODEC,
+            'start': start,
+            'end': end,
+            'samples': len(timestamps),
+            'channels': frames.shape[1],
+            'bytes': offset,
+            'source_bytes': os.path.getsize(recording_path),
+            'archived_at': time.time(),
+            'blocks': blocks,
+            'events': events,
+        }
+        with self.lock:
+            catalog = self.load_catalog(patient_id)
+            patient_file = f"Patient_Data_{patient_id}.json"
+            if os.path.exists(patient_file):
+                with open(patient_file, 'r') as f:
+                    catalog['patient'] = json.load(f)
+            catalog['sessions'] = [s for s in catalog['sessions'] if s['session_id'] != session_id] + [entry]
+            catalog['sessions'].sort(key=lambda s: s['start'])
+            self.save_catalog(patient_id, catalog)
+        if remove_source:
+            os.remove(recording_path)
+        print(f"Archived {recording_path} for patient {patient_id}: "
+              f"{entry['source_bytes']} -> {entry['bytes']} bytes in {len(blocks)} blocks.")
+        return entry
+
+    def query(self, patient_id, start, end):
+        """Samples of a patient between start and end (epoch seconds), reading only the overlapping blocks.
+
+        Returns (timestamps, frames, events); sessions with different channel counts are not mixed.
+        """
+        catalog = self.load_catalog(patient_id)
+        parts, events = [], []
+        directory = self.patient_dir(patient_id)
+        for session in catalog['sessions']:
+            if session['end'] < start or session['start'] > end:
+                continue
+            blocks = session['blocks']
+            first = bisect.bisect_left([block[1] for block in blocks], start)
+            with open(os.path.join(directory, session['data_file']), 'rb') as f:
+                for block_start, _, offset, length in blocks[first:]:
+                    if block_start > end:
+                        break
+                    f.seek(offset)
+                    timestamps, frames = decode_block(f.read(length), session.get('codec', 1))
+                    keep = (timestamps >= start) & (timestamps <= end)
+                    parts.append((timestamps[keep], frames[keep]))
+            events.extend(e for e in session['events'] if start <= parse_timestamp(e['timestamp']) <= end)
+        if not parts:
+            return np.empty(0), np.empty((0, 1)), events
+        channel_count = max(frames.shape[1] for _, frames in parts)
+        parts = [(timestamps, frames) for timestamps, frames in parts if frames.shape[1] == channel_count]
+        return np.concatenate([t for t, _ in parts]), np.concatenate([f for _, f in parts]), events
+
+    def usage(self, patient_id=None):
+        patients = [patient_id] if patient_id else self.patients()
+        return sum(s['bytes'] for p in patients for s in self.load_catalog(p)['sessions'])
+
+    def enforce_retention(self, max_age_days=0, patient_quota_mb=0):
+        """Delete sessions older than max_age_days and the oldest sessions of patients over quota (0 = no limit)."""
+        removed = []
+        cutoff = time.time() - max_age_days * 86400
+        quota = patient_quota_mb * 1024 * 1024
+        with self.lock:
+            for patient_id in self.patients():
+                catalog = self.load_catalog(patient_id)
+                kept = [s for s in catalog['sessions'] if not max_age_days or s['end'] >= cutoff]
+                # Oldest sessions go first until the patient fits the quota; the newest is always kept
+                while quota and len(kept) > 1 and sum(s['bytes'] for s in kept) > quota:
+                    kept.pop(0)
+                dropped = [s for s in catalog['sessions'] if s not in kept]
+                if not dropped:
+                    continue
+                for session in dropped:
+                    data_path = os.path.join(self.patient_dir(patient_id), session['data_file'])
+                    if os.path.exists(data_path):
+                        os.remove(data_path)
+                    removed.append((patient_id, session['session_id']))
+                catalog['sessions'] = kept
+                self.save_catalog(patient_id, catalog)
+        for patient_id, session_id in removed:
+            print(f"Retention removed {session_id} of patient {patient_id}.")
+        return removed
+
+
+def write_recording(path, timestamps, frames):
+    # Same layout as EEG_Data_*.json, so exports can be replayed or re-archived
+    entries = []
+    for timestamp, frame in zip(timestamps, frames):
+        entry = {
+            'timestamp': datetime.datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S.%f'),
+            'value': float(frame[0])
+        }
+        if len(frame) > 1:
+            entry['channels'] = frame.tolist()
+        entries.append(entry)
+    with open(path, 'w') as f:
+        json.dump(entries, f)
+
+
+def local_time(date, clock):
+    return datetime.datetime.strptime(f"{date} {clock}", '%Y-%m-%d %H:%M').timestamp()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compressed per-patient EEG archive.")
+    parser.add_argument('--root', default=ARCHIVE_DIR)
+    commands = parser.add_subparsers(dest='command', required=True)
+    add = commands.add_parser('add', help="archive finished recordings")
+    add.add_argument('recordings', nargs='+')
+    add.add_argument('--patient', required=True)
+    add.add_argument('--remove', action='store_true', help="delete each recording once archived")
+    query = commands.add_parser('query', help="samples of a patient in a time range")
+    query.add_argument('patient')
+    query.add_argument('--date', required=True, help="YYYY-MM-DD")
+    query.add_argument('--from', dest='start', required=True, help="HH:MM")
+    query.add_argument('--to', dest='end', required=True, help="HH:MM")
+    query.add_argument('--output', help="write the samples as an EEG_Data JSON recording")
+    listing = commands.add_parser('list', help="archived sessions")
+    listing.add_argument('patient', nargs='?')
+    prune = commands.add_parser('prune', help="apply retention limits")
+    prune.add_argument('--max-age-days', type=int, default=0)
+    prune.add_argument('--patient-quota-mb', type=int, default=0)
+    args = parser.parse_args()
+
+    archive = EEGArchive(args.root)
+    if args.command == 'add':
+        for recording in args.recordings:
+            archive.archive_session(recording, args.patient, remove_source=args.remove)
+    elif args.command == 'query':
+        started = time.perf_counter()
+        timestamps, frames, events = archive.query(args.patient, local_time(args.date, args.start),
+                                                   local_time(args.date, args.end))
+        print(f"{len(timestamps)} samples, {len(events)} events in {time.perf_counter() - started:.3f} s")
+        if args.output:
+            write_recording(args.output, timestamps, frames)
+            print(f"Written to {args.output}")
+        for event in events:
+            print(json.dumps(event))
+    elif args.command == 'list':
+        for patient_id in [args.patient] if args.patient else archive.patients():
+            for session in archive.load_catalog(patient_id)['sessions']:
+                start = datetime.datetime.fromtimestamp(session['start']).strftime('%Y-%m-%d %H:%M:%S')
+                end = datetime.datetime.fromtimestamp(session['end']).strftime('%H:%M:%S')
+                print(f"{patient_id}  {session['session_id']}  {start} - {end}  "
+                      f"{session['samples']} samples  {session['bytes'] / 1024:.1f} KiB")
+    elif args.command == 'prune':
+        removed = archive.enforce_retention(args.max_age_days, args.patient_quota_mb)
+        print(f"Removed {len(removed)} sessions.")
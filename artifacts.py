@@ -0,0 +1,133 @@
+import numpy as np
+
+EPOCH_S = 0.25  # Artifacts are judged per epoch; the detector sees samples one epoch late
+MIN_EPOCH_SAMPLES = 8
+ARTIFACT_KINDS = ('flatline', 'clipping', 'pop', 'motion')
+
+
+class ArtifactDetector:
+    """Streaming detector of flatlines, clipping, electrode pops and motion bursts in raw samples.
+
+    Samples are held back until their epoch is complete, then released together with a per-sample,
+    per-channel mask of contaminated samples, so the seizure detector never sees an artifact it has
+    not been warned about. Thresholds are relative to each channel's running baseline of clean epochs.
+    """
+
+    def __init__(self, sample_rate_hz, epoch_s=EPOCH_S, flat_ratio=0.05, clip_run=3, pop_ratio=15.0,
+                 motion_ratio=20.0, motion_channel_fraction=0.5, warmup_epochs=8, quality_epochs=40):
+        self.epoch_s = epoch_s
+        self.flat_ratio = flat_ratio  # Std below this fraction of baseline is a flatline
+        self.clip_run = clip_run  # Consecutive samples stuck at the epoch's extreme value
+        self.pop_ratio = pop_ratio  # Sample-to-sample jump relative to the baseline jump size
+        self.motion_ratio = motion_ratio  # Std relative to baseline, far above seizure activity
+        self.motion_channel_fraction = motion_channel_fraction  # Motion moves most channels at once
+        self.warmup_epochs = warmup_epochs
+        self.quality_epochs = quality_epochs  # Epochs averaged into the signal quality index
+        self.configure(sample_rate_hz)
+
+    def configure(self, sample_rate_hz):
+        self.epoch_samples = max(MIN_EPOCH_SAMPLES, int(round(sample_rate_hz * self.epoch_s)))
+        self.reset()
+
+    def reset(self):
+        self.channel_count = None
+        self.pending = None  # (timestamps, raw, filtered) not yet filling an epoch
+        self.previous_sample = None  # Last raw sample classified, so jumps across epoch boundaries count
+        self.epochs_seen = 0
+        self.baseline_std = None
+        self.baseline_step = None
+        self.signal_quality = None  # Per channel: recent fraction of clean epochs, 0-1
+        self.last_artifacts = {}  # Channel -> kind of artifact in the latest epoch
+        self.artifact_counts = dict.fromkeys(ARTIFACT_KINDS, 0)
+
+    def start_channels(self, channel_count):
+        self.reset()
+        self.channel_count = channel_count
+        self.signal_quality = np.ones(channel_count)
+
+    def process(self, timestamps, raw, filtered):
+        """Queue a block; returns (timestamps, filtered, mask) for the samples of completed epochs."""
+        timestamps = np.asarray(timestamps, dtype=float)
+        raw = np.asarray(raw, dtype=float).reshape(len(timestamps), -1)
+        filtered = np.asarray(filtered, dtype=float).reshape(len(timestamps), -1)
+        if raw.shape[1] != self.channel_count:
+            self.start_channels(raw.shape[1])
+        if self.pending is not None:
+            timestamps, raw, filtered = (np.concatenate([held, new]) for held, new
+                                         in zip(self.pending, (timestamps, raw, filtered)))
+        ready = len(timestamps) - len(timestamps) % self.epoch_samples
+        self.pending = (timestamps[ready:], raw[ready:], filtered[ready:])
+        epochs = raw[:ready].reshape(-1, self.epoch_samples, self.channel_count)
+        mask = np.repeat(self.classify(epochs), self.epoch_samples, axis=0)
+        return timestamps[:ready], filtered[:ready], mask
+
+    def classify(self, epochs):
+        """Contaminated channels of each epoch (epochs x channels), updating baselines and quality."""
+        flagged = np.zeros((len(epochs), self.channel_count), dtype=bool)
+        if not len(epochs):
+            return flagged
+        # Statistics of every epoch and channel at once
+        std = epochs.std(axis=1)
+        peak_to_peak = np.ptp(epochs, axis=1)
+        previous = np.concatenate([epochs[:1, :1] if self.previous_sample is None else self.previous_sample[None],
+                                   epochs[:-1, -1:]])
+        steps = np.diff(np.concatenate([previous, epochs], axis=1), axis=1)
+        self.previous_sample = epochs[-1, -1:].copy()
+        step = np.abs(steps).max(axis=1)
+        step_std = steps.std(axis=1)
+        at_extreme = (epochs == epochs.max(axis=1, keepdims=True)) | (epochs == epochs.min(axis=1, keepdims=True))
+        # Length-clip_run window sums of at_extreme via a cumulative sum
+        totals = np.cumsum(at_extreme, axis=1, dtype=np.int32)
+        runs = np.concatenate([totals[:, self.clip_run - 1:self.clip_run],
+                               totals[:, self.clip_run:] - totals[:, :-self.clip_run]], axis=1)
+        clipped = (runs >= self.clip_run).any(axis=1) & (peak_to_peak > 0)
+
+        for index in range(len(epochs)):
+            kinds = {}
+            flat = peak_to_peak[index] == 0
+            if self.baseline_std is not None:
+                flat |= std[index] < self.flat_ratio * self.baseline_std
+            for channel in np.flatnonzero(flat):
+                kinds[channel] = 'flatline'
+            for channel in np.flatnonzero(clipped[index] & ~flat):
+                kinds[channel] = 'clipping'
+            if self.epochs_seen >= self.warmup_epochs:
+                # Seizures spread over many channels; a pop is a jump confined to a few
+                popped = step[index] > self.pop_ratio * self.baseline_step
+                if self.channel_count >= 4 and popped.sum() > max(1, self.channel_count // 4):
+                    popped[:] = False
+                for channel in np.flatnonzero(popped):
+                    kinds.setdefault(channel, 'pop')
+                moving = std[index] > self.motion_ratio * self.baseline_std
+                if moving.sum() >= max(1, self.motion_channel_fraction * self.channel_count):
+                    for channel in range(self.channel_count):
+                        kinds.setdefault(channel, 'motion')
+            flagged[index, list(kinds)] = True
+            for kind in kinds.values():
+                self.artifact_counts[kind] += 1
+            self.last_artifacts = kinds
+            self.update_baseline(std[index], step_std[index], flagged[index])
+            self.signal_quality += (~flagged[index] - self.signal_quality) / self.quality_epochs
+        return flagged
+
+    def update_baseline(self, std, step_std, flagged):
+        self.epochs_seen += 1
+        if self.baseline_std is None:
+            self.baseline_std = std.copy()
+            self.baseline_step = np.maximum(step_std, 1e-12)
+            return
+        # Only clean epochs near the baseline update it, so artifacts and seizures do not inflate it
+        clean = ~flagged & ((std < 3 * self.baseline_std) | (self.epochs_seen <= self.warmup_epochs))
+        rate = 1 / min(self.epochs_seen, 120)
+        self.baseline_std[clean] += (std[clean] - self.baseline_std[clean]) * rate
+        self.baseline_step[clean] += (np.maximum(step_std[clean], 1e-12) - self.baseline_step[clean]) * rate
+
+    def quality_summary(self):
+        """One line for the UI: worst channel quality and the artifacts in the latest epoch."""
+        if self.signal_quality is None:
+            return "Signal quality: -"
+        text = f"Signal quality: {100 * self.signal_quality.min():.0f}%"
+        if self.last_artifacts:
+            text += " (" + ", ".join(f"ch {channel + 1}: {kind}" for channel, kind
+                                     in sorted(self.last_artifacts.items())) + ")"
+        return text
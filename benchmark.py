@@ -0,0 +1,242 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')  # Run headless unless a platform is forced
+
+import numpy as np
+from PyQt5.QtWidgets import QApplication
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+BASELINE_FILE = os.path.join(BENCHMARK_DIR, 'benchmark_baseline.json')
+DURATIONS = {'1min': 60, '1h': 3600, '12h': 12 * 3600}
+
+
+def timed(function, repeat=1):
+    """Run function repeat times and return the per-call durations in seconds."""
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def metric(value, unit, better):
+    return {'value': value, 'unit': unit, 'better': better}
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def synthetic_eeg(duration_s, sample_rate_hz, channel_count, onset_s=None, seed=0):
+    """Background noise and alpha rhythm, with 3 Hz spike-wave activity from onset_s onwards."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(duration_s * sample_rate_hz)) / sample_rate_hz
+    frames = 0.5 * np.sin(2 * np.pi * 10 * t)[:, None] + rng.normal(0, 0.2, (len(t), channel_count))
+    if onset_s is not None:
+        burst = t >= onset_s
+        spike_wave = 16 * np.sin(2 * np.pi * 3 * t[burst]) ** 15 + 5 * np.sin(2 * np.pi * 3 * t[burst])
+        frames[burst] += spike_wave[:, None]
+    return t, frames
+
+
+def eeg_entries(duration_s, sample_rate_hz):
+    # Recorded entries in the same shape MainWindow.ingest_samples produces
+    start = datetime.datetime(2024, 1, 1)
+    values = np.random.default_rng(0).uniform(-1, 1, int(duration_s * sample_rate_hz))
+    return [
+        {'timestamp': (start + datetime.timedelta(seconds=i / sample_rate_hz)).strftime('%Y-%m-%d %H:%M:%S.%f'), 'value': float(value)}
+        for i, value in enumerate(values)
+    ]
+
+
+def bench_ingest(window, seconds=2.0, block_size=64, channel_count=8):
+    # Samples/sec through the common acquisition path with recording and detection active
+    window.is_recording = True
+    window.recording_file = 'EEG_Data_benchmark.jsonl'  # Run from the benchmark's temporary directory
+    window.seizure_detector.start_detection(window.settings.get('detector_interval_ms'))
+    window.seizure_detector.timer.stop()
+    sample_rate = window.settings.get('sample_rate_hz')
+    _, frames = synthetic_eeg(block_size / sample_rate, sample_rate, channel_count)
+    samples = 0
+    start = time.perf_counter()
+    next_time = time.time()
+    while time.perf_counter() - start < seconds:
+        timestamps = next_time + np.arange(block_size) / sample_rate
+        next_time = timestamps[-1] + 1 / sample_rate
+        window.ingest_samples(timestamps, frames)
+        samples += block_size
+    elapsed = time.perf_counter() - start
+    window.seizure_detector.stop_detection()
+    window.is_recording = False
+    window.journal.close_file(window.recording_file)  # As toggle_recording does when a recording stops
+    window.recording_file = None
+    window.eeg_data.clear()
+    return {'ingest_samples_per_s': metric(samples / elapsed, 'samples/s', 'higher')}
+
+
+def bench_plot(app, window, frames=200):
+    # update_eeg_plot plus the repaint it triggers
+    ring = window.sample_ring
+    ring.write(np.arange(ring.capacity, dtype=float), np.random.default_rng(0).uniform(-1, 1, (ring.capacity, ring.channel_count)))
+    window.show()
+    app.processEvents()
+
+    def frame():
+        window.update_eeg_plot()
+        app.processEvents()
+
+    durations = timed(frame, frames)
+    return {
+        'plot_frame_ms_median': metric(statistics.median(durations) * 1000, 'ms', 'lower'),
+        'plot_frame_ms_p95': metric(percentile(durations, 0.95) * 1000, 'ms', 'lower'),
+    }
+
+
+def bench_detector(sample_rate_hz=256, channel_count=8, onset_s=120.0, duration_s=180.0):
+    # Detection latency on sample time, and the processing cost of feeding the detector
+    from detection import SeizureDetector
+    detector = SeizureDetector()
+    detections = []
+    detector.seizure_detected.connect(lambda: detections.append(detector.detection_time))
+    detector.start_detection(1000)
+    detector.timer.stop()
+    t, frames = synthetic_eeg(duration_s, sample_rate_hz, channel_count, onset_s=onset_s)
+    block_size = sample_rate_hz // 10
+    start = time.perf_counter()
+    for position in range(0, len(t), block_size):
+        detector.push_samples(t[position:position + block_size], frames[position:position + block_size])
+    elapsed = time.perf_counter() - start
+    detector.stop_detection()
+    after_onset = [d for d in detections if d >= onset_s]
+    results = {
+        'detector_cost_ms_per_s_of_data': metric(elapsed * 1000 / duration_s, 'ms', 'lower'),
+        'detector_false_detections': metric(len(detections) - len(after_onset), 'count', 'lower'),
+    }
+    if after_onset:
+        results['detector_latency_s'] = metric(after_onset[0] - onset_s, 's', 'lower')
+    return results
+
+
+def bench_journal(directory, events=5000):
+    # Event journal write throughput under each fsync policy
+    from journal import EventJournal
+    results = {}
+    for policy in EventJournal.FSYNC_POLICIES:
+        journal = EventJournal(policy)
+        path = os.path.join(directory, f'journal_{policy}.json')
+        event = {'timestamp': '2024-01-01 00:00:00', 'dose_mg': 5.0, 'medication': 'Levetiracetam (Keppra)', 'protocol': 'Default Protocol'}
+        count = events if policy != 'always' else events // 10
+        start = time.perf_counter()
+        for _ in range(count):
+            journal.append(path, event)
+        journal.close()
+        results[f'journal_events_per_s_{policy}'] = metric(count / (time.perf_counter() - start), 'events/s', 'higher')
+    return results
+
+
+def bench_session_size(window, directory, label, duration_s):
+    # PatientDataPopup open time and save_eeg_data cost for a session of the given length
+    from main import PatientDataPopup
+    # The window keeps bounded histories; a whole session stands in for them while timing
+    eeg_data, medication_logs = window.eeg_data, window.medication_logs
+    window.eeg_data = eeg_entries(duration_s, window.settings.get('sample_rate_hz'))
+    window.medication_logs = ["2024-01-01 00:00:00: Administered 5 mg of Levetiracetam (Keppra)." for _ in range(int(duration_s // 600))]
+    popup_time = timed(lambda: PatientDataPopup(window, window.collect_patient_data()).deleteLater())[0]
+    save_time = timed(lambda: window.write_eeg_data(os.path.join(directory, f'EEG_Data_{label}.json')))[0]
+    window.eeg_data, window.medication_logs = eeg_data, medication_logs
+    return {
+        f'popup_open_s_{label}': metric(popup_time, 's', 'lower'),
+        f'save_eeg_data_s_{label}': metric(save_time, 's', 'lower'),
+    }
+
+
+def run_benchmarks(durations):
+    app = QApplication.instance() or QApplication(sys.argv)
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        # Keep settings and journals written by MainWindow out of the working directory
+        previous_directory = os.getcwd()
+        os.chdir(directory)
+        try:
+            from main import MainWindow
+            window = MainWindow()
+            results.update(bench_ingest(window))
+            results.update(bench_plot(app, window))
+            results.update(bench_detector())
+            results.update(bench_journal(directory))
+            for label in durations:
+                results.update(bench_session_size(window, directory, label, DURATIONS[label]))
+            window.close()
+        finally:
+            os.chdir(previous_directory)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Return a list of regressions beyond tolerance (a fraction) relative to the baseline."""
+    regressions = []
+    for name, entry in results.items():
+        if name not in baseline:
+            continue
+        reference = baseline[name]['value']
+        value = entry['value']
+        if entry['better'] == 'lower':
+            worse = value > reference * (1 + tolerance) and value - reference > 1e-3
+        else:
+            worse = value < reference * (1 - tolerance)
+        if worse:
+            regressions.append(f"{name}: {value:.4g} {entry['unit']} vs baseline {reference:.4g} {entry['unit']}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark acquisition, detection, plotting and persistence.")
+    parser.add_argument('--durations', nargs='+', choices=list(DURATIONS), default=list(DURATIONS),
+                        help="session lengths for the popup and save benchmarks")
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--baseline', default=BASELINE_FILE)
+    parser.add_argument('--tolerance', type=float, default=0.25, help="allowed regression as a fraction of the baseline")
+    parser.add_argument('--update-baseline', action='store_true', help="store these results as the new baseline")
+    args = parser.parse_args()
+
+    output_path = os.path.abspath(args.output)
+    baseline_path = os.path.abspath(args.baseline)
+    results = run_benchmarks(args.durations)
+    report = {
+        'timestamp': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'platform': platform.platform(),
+        'python': platform.python_version(),
+        'metrics': results,
+    }
+    with open(output_path, 'w') as f:
+        json.dump(report, f, indent=4)
+    for name, entry in results.items():
+        print(f"{name}: {entry['value']:.4g} {entry['unit']}")
+    print(f"Results written to {output_path}")
+
+    if args.update_baseline:
+        with open(baseline_path, 'w') as f:
+            json.dump(report, f, indent=4)
+        print(f"Baseline updated at {baseline_path}")
+    elif os.path.exists(baseline_path):
+        with open(baseline_path, 'r') as f:
+            baseline = json.load(f)['metrics']
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("Regressions against baseline:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print("No regressions against baseline.")
+    else:
+        print(f"No baseline at {baseline_path}; run with --update-baseline to create one.")
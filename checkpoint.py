@@ -0,0 +1,82 @@
+import json
+import mmap
+import os
+import struct
+import zlib
+
+CHECKPOINT_FILE = "monitor_state.bin"
+CHECKPOINT_INTERVAL_MS = 1000  # Periodic writes cover recording cursors; protocol changes are written at once
+CHECKPOINT_SIZE = 64 * 1024  # Two slots of 32 KB; run state is a few hundred bytes
+CHECKPOINT_MAGIC = b'SZCKPT01'
+# Slot header: magic, sequence number, payload length, CRC-32 of the payload
+SLOT_HEADER = struct.Struct('<8sQII')
+
+
+class StateCheckpoint:
+    """Small memory-mapped file holding the latest run state as JSON, safe against crashes mid-write.
+
+    The file has two slots written alternately, each with a sequence number and a checksum,
+    so a write torn by a crash leaves the previous slot intact. Writes go to the page cache
+    through the mapping and survive the process; sync() also forces them to disk.
+    """
+
+    def __init__(self, path=CHECKPOINT_FILE, size=CHECKPOINT_SIZE):
+        self.path = path
+        self.slot_size = size // 2
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(fd).st_size != size:
+                os.ftruncate(fd, size)
+            self.map = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        self.sequence, self.last_payload = self.latest()
+
+    def latest(self):
+        # The valid slot with the highest sequence number
+        best = (0, None)
+        for slot in range(2):
+            offset = slot * self.slot_size
+            magic, sequence, length, checksum = SLOT_HEADER.unpack_from(self.map, offset)
+            if magic != CHECKPOINT_MAGIC or length > self.slot_size - SLOT_HEADER.size:
+                continue
+            start = offset + SLOT_HEADER.size
+            payload = bytes(self.map[start:start + length])
+            if zlib.crc32(payload) == checksum and sequence > best[0]:
+                best = (sequence, payload)
+        return best
+
+    def read(self):
+        """The last state written, or None when there is none."""
+        if self.last_payload is None:
+            return None
+        try:
+            return json.loads(self.last_payload)
+        except ValueError:
+            return None
+
+    def write(self, state, sync=False):
+        """Store state; returns False when it is unchanged and nothing was written."""
+        payload = json.dumps(state, sort_keys=True).encode()
+        if payload == self.last_payload:
+            return False
+        if len(payload) > self.slot_size - SLOT_HEADER.size:
+            raise ValueError(f"Checkpoint state of {len(payload)} bytes does not fit in {self.path}")
+        self.sequence += 1
+        offset = (self.sequence % 2) * self.slot_size
+        # Payload first, header last: a slot is only valid once its header matches the payload
+        self.map[offset + SLOT_HEADER.size:offset + SLOT_HEADER.size + len(payload)] = payload
+        SLOT_HEADER.pack_into(self.map, offset, CHECKPOINT_MAGIC, self.sequence, len(payload), zlib.crc32(payload))
+        self.last_payload = payload
+        if sync:
+            self.sync()
+        return True
+
+    def sync(self):
+        self.map.flush()
+
+    def close(self):
+        if self.map.closed:
+            return
+        self.sync()
+        self.map.close()
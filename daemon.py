@@ -0,0 +1,444 @@
+import argparse
+import json
+import signal
+import sys
+
+import numpy as np
+from PyQt5.QtCore import QCoreApplication, QObject, QTimer, pyqtSignal
+from PyQt5.QtNetwork import QLocalServer, QLocalSocket
+
+from acquisition import SampleSource
+from aio import AsyncJournal, IOLoop
+from checkpoint import CHECKPOINT_INTERVAL_MS, StateCheckpoint
+from database import EventDatabase
+from filters import filter_options
+from instrumentation import profiler, tracer
+from ledger import DoseLedger
+from ring import SampleRing
+from sessions import SOURCE_KINDS, SessionManager, create_source
+from settings import Settings
+
+DAEMON_SERVER_NAME = "seizure-monitor"
+DAEMON_CHECKPOINT_FILE = "daemon_state.bin"
+MAX_PENDING_BYTES = 1 << 20  # Per-viewer output backlog beyond which sample messages are skipped
+
+
+def encode_message(message):
+    # Messages are JSON objects, one per line, in both directions
+    return (json.dumps(message) + '\n').encode()
+
+
+def describe_session(session):
+    return {
+        'session_id': session.session_id,
+        'patient_name': session.patient_name,
+        'patient_id': session.patient_id,
+        'auto_mode': session.auto_mode,
+        'seizure_active': session.seizure_active,
+        'seizure_duration_s': session.protocol_selector.duration(),
+        'protocol': session.protocol_manager.current_protocol['name'] if session.protocol_manager.current_protocol else None,
+        'samples_received': session.samples_received,
+        'recording': session.recording_file,
+        'recorded_samples': session.recorded_samples,
+        'ring_name': session.sample_ring.name,
+        'signal_quality': session.artifact_detector.quality_summary(),
+    }
+
+
+class MonitorDaemon(QObject):
+    """Runs acquisition, detection, dosing, journaling and recording without a GUI and serves viewers over a local socket.
+
+    Viewers only start and stop a bed's recording; it is written by the daemon, so a viewer closing
+    or crashing never ends it.
+    """
+
+    def __init__(self, settings, server_name=DAEMON_SERVER_NAME):
+        super().__init__()
+        self.settings = settings
+        # One I/O thread reads every serial bed and writes the journal
+        self.io_loop = IOLoop()
+        self.io_loop.start()
+        dose_ledger = DoseLedger()
+        dose_ledger.enabled = settings.get('enforce_dose_limits')
+        dose_ledger.rebuild()
+        self.session_manager = SessionManager(
+            journal=AsyncJournal(self.io_loop, settings.get('journal_fsync'), indexes=[EventDatabase()]),
+            sample_rate_hz=settings.get('sample_rate_hz'),
+            buffer_retention_s=settings.get('buffer_retention_s'),
+            detector_interval_ms=settings.get('detector_interval_ms'),
+            io_loop=self.io_loop,
+            filter_options=filter_options(settings),
+            dose_ledger=dose_ledger
+        )
+        self.session_manager.session_added.connect(self.on_session_added)
+        self.session_manager.session_removed.connect(lambda _: self.broadcast_sessions())
+        self.viewers = {}  # Socket -> {subscribed session id: whether samples go over the socket}
+        self.read_buffers = {}  # Socket -> partial line received so far
+
+        self.server = QLocalServer()
+        # A previous daemon that crashed leaves its socket file behind
+        QLocalServer.removeServer(server_name)
+        if not self.server.listen(server_name):
+            raise OSError(f"Could not listen on {server_name}: {self.server.errorString()}")
+        self.server.newConnection.connect(self.accept_viewers)
+        profiler.add_gauge('viewers', lambda: len(self.viewers))
+        tracer.set_budget('end_to_end', settings.get('latency_budget_ms') / 1000)
+        tracer.budget_exceeded.connect(self.on_latency_budget_exceeded)
+        # Protocols and recordings running when the daemon stopped resume when their patient's bed is added again
+        self.checkpoint = StateCheckpoint(DAEMON_CHECKPOINT_FILE)
+        state = self.checkpoint.read() or {}
+        self.resume_states = state.get('protocols', {})
+        self.resume_recordings = state.get('recordings', {})
+        self.checkpoint_timer = QTimer()
+        self.checkpoint_timer.timeout.connect(self.save_checkpoint)
+        self.checkpoint_timer.start(CHECKPOINT_INTERVAL_MS)
+        print(f"Daemon listening on {self.server.fullServerName()}")
+
+    def add_bed(self, patient_name, patient_id, kind, path=None, channel_count=8):
+        source, emulator = create_source(kind, self.settings.get('sample_rate_hz'), path=path,
+                                         channel_count=channel_count, io_loop=self.io_loop)
+        session = self.session_manager.add_session(patient_name, patient_id, source, emulator)
+        session.set_auto_mode(self.settings.get('auto_mode'))
+        session.protocol_manager.run_state_changed.connect(lambda: self.save_checkpoint(sync=True))
+        state = self.resume_states.pop(patient_id, None)
+        if state is not None:
+            session.protocol_manager.resume(state)
+        recording = self.resume_recordings.pop(patient_id, None)
+        if recording is not None:
+            session.start_recording(recording['file'], recording['samples'])
+        return session
+
+    def save_checkpoint(self, sync=False):
+        protocols = dict(self.resume_states)  # Beds not added again yet keep their state
+        recordings = dict(self.resume_recordings)
+        for session in self.session_manager.sessions.values():
+            state = session.protocol_manager.run_state()
+            if state is not None:
+                protocols[session.patient_id] = state
+            if session.recording_file is not None:
+                recordings[session.patient_id] = {'file': session.recording_file, 'samples': session.recorded_samples}
+        try:
+            self.checkpoint.write({'protocols': protocols, 'recordings': recordings}, sync)
+        except (OSError, ValueError) as e:
+            print(f"Could not write checkpoint: {e}")
+
+    def on_session_added(self, session_id):
+        session = self.session_manager.sessions[session_id]
+        session.source.samples_ready.connect(
+            lambda timestamps, frames: self.publish_samples(session_id, timestamps, frames))
+        session.status_changed.connect(self.publish_status)
+        session.log_entry.connect(self.publish_log)
+        self.broadcast_sessions()
+
+    def accept_viewers(self):
+        while self.server.hasPendingConnections():
+            socket = self.server.nextPendingConnection()
+            self.viewers[socket] = {}
+            self.read_buffers[socket] = b''
+            socket.readyRead.connect(lambda socket=socket: self.read_commands(socket))
+            socket.disconnected.connect(lambda socket=socket: self.drop_viewer(socket))
+            self.send(socket, {'type': 'sessions', 'sessions': self.session_list()})
+            print(f"Viewer attached ({len(self.viewers)} connected).")
+
+    def drop_viewer(self, socket):
+        # A viewer going away never touches acquisition, detection or dosing
+        if self.viewers.pop(socket, None) is None:
+            return
+        self.read_buffers.pop(socket, None)
+        socket.deleteLater()
+        print(f"Viewer detached ({len(self.viewers)} connected).")
+
+    def read_commands(self, socket):
+        data = self.read_buffers.get(socket, b'') + bytes(socket.readAll())
+        *lines, self.read_buffers[socket] = data.split(b'\n')
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                reply = self.handle_command(socket, json.loads(line))
+            except (ValueError, KeyError, OSError) as e:
+                reply = {'type': 'error', 'message': str(e)}
+            if reply is not None:
+                self.send(socket, reply)
+
+    def handle_command(self, socket, command):
+        action = command['command']
+        sessions = self.session_manager.sessions
+        if action == 'list':
+            return {'type': 'sessions', 'sessions': self.session_list()}
+        if action == 'subscribe':
+            if command['session_id'] not in sessions:
+                raise KeyError(f"Unknown session: {command['session_id']}")
+            # Viewers reading the shared-memory ring only need status and log messages
+            self.viewers[socket][command['session_id']] = command.get('samples', True)
+            return {'type': 'status', 'session': describe_session(sessions[command['session_id']])}
+        if action == 'unsubscribe':
+            self.viewers[socket].pop(command['session_id'], None)
+            return None
+        if action == 'add_session':
+            kind = command.get('source', 'Simulated')
+            if kind not in SOURCE_KINDS:
+                raise ValueError(f"Unknown source kind: {kind}")
+            session = self.add_bed(command['patient_name'], command['patient_id'], kind,
+                                   command.get('path'), command.get('channel_count', 8))
+            return {'type': 'status', 'session': describe_session(session)}
+        if action == 'remove_session':
+            self.session_manager.remove_session(command['session_id'])
+            return None
+        if action == 'set_auto_mode':
+            sessions[command['session_id']].set_auto_mode(bool(command['enabled']))
+            return None
+        if action == 'start_protocol':
+            sessions[command['session_id']].protocol_manager.start_protocol(command['protocol_id'])
+            return None
+        if action == 'start_recording':
+            sessions[command['session_id']].start_recording()
+            self.save_checkpoint(sync=True)
+            return None
+        if action == 'stop_recording':
+            sessions[command['session_id']].stop_recording()
+            self.save_checkpoint(sync=True)
+            return None
+        raise ValueError(f"Unknown command: {action}")
+
+    def session_list(self):
+        return [describe_session(session) for session in self.session_manager.sessions.values()]
+
+    def send(self, socket, message):
+        socket.write(encode_message(message))
+
+    def broadcast_sessions(self):
+        message = encode_message({'type': 'sessions', 'sessions': self.session_list()})
+        for socket in self.viewers:
+            socket.write(message)
+
+    def publish_samples(self, session_id, timestamps, frames):
+        subscribers = [socket for socket, subscribed in self.viewers.items() if subscribed.get(session_id)]
+        if not subscribers:
+            return
+        message = encode_message({
+            'type': 'samples',
+            'session_id': session_id,
+            'timestamps': np.asarray(timestamps).tolist(),
+            'frames': np.asarray(frames, dtype=float).reshape(len(timestamps), -1).tolist(),
+        })
+        for socket in subscribers:
+            # A stalled viewer loses samples rather than growing the daemon's memory
+            if socket.bytesToWrite() > MAX_PENDING_BYTES:
+                profiler.count('viewer_dropped_samples', len(timestamps))
+                continue
+            socket.write(message)
+
+    def publish_status(self, session_id):
+        session = self.session_manager.sessions.get(session_id)
+        if session is None:
+            return
+        message = encode_message({'type': 'status', 'session': describe_session(session)})
+        for socket, subscribed in self.viewers.items():
+            if session_id in subscribed:
+                socket.write(message)
+
+    def publish_log(self, session_id, log_entry):
+        print(f"[{session_id}] {log_entry}")
+        message = encode_message({'type': 'log', 'session_id': session_id, 'entry': log_entry})
+        for socket, subscribed in self.viewers.items():
+            if session_id in subscribed:
+                socket.write(message)
+
+    def on_latency_budget_exceeded(self, trace, span, seconds):
+        session_id = trace['args'].get('session_id')
+        log_entry = (f"Latency budget exceeded: {span} took {seconds * 1000:.0f} ms "
+                     f"(budget {tracer.budgets[span] * 1000:.0f} ms, trace {trace['id']}).")
+        if session_id in self.session_manager.sessions:
+            self.publish_log(session_id, log_entry)
+        else:
+            print(log_entry)
+
+    def close(self):
+        # Before the sessions stop their protocols
+        self.checkpoint_timer.stop()
+        self.save_checkpoint()
+        self.checkpoint.close()
+        self.server.close()
+        for socket in list(self.viewers):
+            socket.disconnectFromServer()
+        self.session_manager.close()
+        self.session_manager.journal.close()
+        for index in self.session_manager.journal.indexes:
+            index.close()
+        self.io_loop.stop()
+
+
+class DaemonClient(QObject):
+    """Viewer-side connection to a running MonitorDaemon."""
+    sessions_received = pyqtSignal(list)  # Signal with session descriptions
+    samples_received = pyqtSignal(str, object, object)  # Signal with session id, timestamps and frames
+    status_received = pyqtSignal(dict)  # Signal with a session description
+    log_received = pyqtSignal(str, str)  # Signal with session id and log entry
+    error_received = pyqtSignal(str)
+    disconnected = pyqtSignal()
+
+    def __init__(self, server_name=DAEMON_SERVER_NAME):
+        super().__init__()
+        self.server_name = server_name
+        self.sessions = []
+        self.read_buffer = b''
+        self.socket = QLocalSocket()
+        self.socket.readyRead.connect(self.read_messages)
+        self.socket.disconnected.connect(self.disconnected.emit)
+
+    def connect_to_daemon(self, timeout_ms=1000):
+        self.socket.connectToServer(self.server_name)
+        if not self.socket.waitForConnected(timeout_ms):
+            raise ConnectionError(f"No daemon on {self.server_name}: {self.socket.errorString()}")
+        # The daemon greets every viewer with its session list
+        while not self.sessions and self.socket.waitForReadyRead(timeout_ms):
+            self.read_messages()
+        return self.sessions
+
+    def disconnect_from_daemon(self):
+        self.socket.disconnectFromServer()
+
+    def send(self, command, **arguments):
+        self.socket.write(encode_message(dict(arguments, command=command)))
+        self.socket.flush()
+
+    def read_messages(self):
+        data = self.read_buffer + bytes(self.socket.readAll())
+        *lines, self.read_buffer = data.split(b'\n')
+        for line in lines:
+            message = json.loads(line)
+            kind = message['type']
+            if kind == 'samples':
+                self.samples_received.emit(message['session_id'], np.array(message['timestamps']),
+                                           np.array(message['frames']))
+            elif kind == 'sessions':
+                self.sessions = message['sessions']
+                self.sessions_received.emit(self.sessions)
+            elif kind == 'status':
+                self.status_received.emit(message['session'])
+            elif kind == 'log':
+                self.log_received.emit(message['session_id'], message['entry'])
+            elif kind == 'error':
+                self.error_received.emit(message['message'])
+
+
+class DaemonSource(SampleSource):
+    """Samples of one daemon session, for display only; the daemon already runs detection and dosing.
+
+    Samples are read straight from the session's shared-memory ring when it can be attached,
+    and otherwise arrive as socket messages.
+    """
+    remote = True
+
+    def __init__(self, client, session_id, poll_ms=20):
+        super().__init__()
+        self.client = client
+        self.session_id = session_id
+        self.poll_ms = poll_ms
+        self.ring = None
+        self.reader = None
+        self.recording = None  # The daemon's recording file for this bed, from its status updates
+        self.client.samples_received.connect(self.on_samples)
+        self.client.status_received.connect(self.on_status)
+        self.client.disconnected.connect(self.finished.emit)
+        self.running = False
+
+    def start(self):
+        self.running = True
+        session = next((s for s in self.client.sessions if s['session_id'] == self.session_id), {})
+        self.recording = session.get('recording')
+        self.attach_ring(session.get('ring_name'))
+        self.client.send('subscribe', session_id=self.session_id, samples=self.ring is None)
+        if self.ring is not None:
+            self.start_polling(self.poll_ms)
+
+    def stop(self):
+        if self.running and self.client.socket.state() == QLocalSocket.ConnectedState:
+            self.client.send('unsubscribe', session_id=self.session_id)
+        self.running = False
+        self.timer.stop()
+        self.detach_ring()
+
+    def attach_ring(self, ring_name):
+        self.detach_ring()
+        if not ring_name:
+            return
+        try:
+            self.ring = SampleRing.attach(ring_name)
+        except (OSError, ValueError) as e:  # Different host user, no /dev/shm, ...
+            print(f"Shared-memory ring unavailable, receiving samples over the socket: {e}")
+            return
+        self.reader = self.ring.reader()
+
+    def detach_ring(self):
+        if self.ring is not None:
+            self.reader = None
+            self.ring.close()
+            self.ring = None
+
+    def poll(self):
+        if self.ring is None or self.ring.closed:
+            return  # The daemon replaced the ring; the status update carries the new one
+        timestamps, frames = self.reader.read()
+        if len(timestamps):
+            self.samples_ready.emit(timestamps, frames)
+        if self.reader.overrun_samples:
+            profiler.count('dropped_samples', self.reader.overrun_samples)
+            self.reader.overrun_samples = 0
+
+    def set_recording(self, enabled):
+        # The daemon records the bed; its status update confirms the change
+        self.client.send('start_recording' if enabled else 'stop_recording', session_id=self.session_id)
+
+    def on_status(self, session):
+        if session['session_id'] != self.session_id:
+            return
+        self.recording = session.get('recording')
+        if self.running and self.ring is not None and session['ring_name'] != self.ring.name:
+            self.attach_ring(session['ring_name'])
+
+    def on_samples(self, session_id, timestamps, frames):
+        if self.running and session_id == self.session_id:
+            self.samples_ready.emit(timestamps, frames)
+
+
+def parse_bed(text):
+    # NAME:ID[:SOURCE[:PATH]], e.g. "Jane Doe:P-001:Built-in Emulator"
+    parts = text.split(':', 3)
+    if len(parts) < 2:
+        raise argparse.ArgumentTypeError("expected NAME:ID[:SOURCE[:PATH]]")
+    kind = parts[2] if len(parts) > 2 else "Simulated"
+    if kind not in SOURCE_KINDS:
+        raise argparse.ArgumentTypeError(f"source must be one of {', '.join(SOURCE_KINDS)}")
+    return parts[0], parts[1], kind, parts[3] if len(parts) > 3 else None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run acquisition, detection and dosing without a GUI.")
+    parser.add_argument('--bed', type=parse_bed, action='append', default=[], metavar='NAME:ID[:SOURCE[:PATH]]',
+                        help="bed to monitor at startup; repeat for several beds")
+    parser.add_argument('--server-name', default=DAEMON_SERVER_NAME, help="local socket viewers connect to")
+    parser.add_argument('--auto', action='store_true', help="enable auto mode regardless of settings.json")
+    parser.add_argument('--trace', metavar='FILE', help="write seizure handling traces (Chrome trace format) on exit")
+    args = parser.parse_args()
+
+    app = QCoreApplication(sys.argv)
+    settings = Settings()
+    if args.auto:
+        settings.values['auto_mode'] = True
+    daemon = MonitorDaemon(settings, args.server_name)
+    for patient_name, patient_id, kind, path in args.bed:
+        daemon.add_bed(patient_name, patient_id, kind, path)
+
+    # Stop cleanly on Ctrl+C or SIGTERM; the timer lets Python run its signal handlers
+    signal.signal(signal.SIGINT, lambda *_: app.quit())
+    signal.signal(signal.SIGTERM, lambda *_: app.quit())
+    signal_timer = QTimer()
+    signal_timer.timeout.connect(lambda: None)
+    signal_timer.start(200)
+    app.exec_()
+    daemon.close()
+    if args.trace:
+        tracer.export_chrome_trace(args.trace)
+        print(f"Seizure handling trace saved to {args.trace}")
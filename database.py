@@ -0,0 +1,230 @@
+import argparse
+import datetime
+import glob
+import json
+import os
+import sqlite3
+import threading
+
+from replay import parse_timestamp
+
+DATABASE_FILE = "monitor.db"
+SCHEMA_VERSION = 1  # PRAGMA user_version; 1: medication events keyed by their true journal offset
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS patients (
+    patient_id TEXT PRIMARY KEY,
+    name TEXT,
+    age TEXT,
+    updated_at REAL
+);
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    patient_id TEXT,
+    session_id TEXT NOT NULL,
+    start REAL NOT NULL,
+    end REAL NOT NULL,
+    samples INTEGER,
+    channels INTEGER,
+    archive_file TEXT,
+    UNIQUE (patient_id, session_id)
+);
+CREATE TABLE IF NOT EXISTS seizure_events (
+    id INTEGER PRIMARY KEY,
+    patient_id TEXT NOT NULL,
+    time REAL NOT NULL,
+    timestamp TEXT NOT NULL,
+    event TEXT NOT NULL,
+    UNIQUE (patient_id, time, event)
+);
+CREATE TABLE IF NOT EXISTS medication_events (
+    id INTEGER PRIMARY KEY,
+    patient_id TEXT NOT NULL,
+    time REAL NOT NULL,
+    timestamp TEXT NOT NULL,
+    medication TEXT NOT NULL,
+    dose_mg REAL NOT NULL,
+    protocol TEXT,
+    journal_offset INTEGER,
+    -- Identical doses in the same second are distinct records; their journal lines tell them apart
+    UNIQUE (journal_offset, patient_id, time, medication, dose_mg)
+);
+CREATE INDEX IF NOT EXISTS sessions_patient_time ON sessions (patient_id, start);
+CREATE INDEX IF NOT EXISTS seizure_events_patient_time ON seizure_events (patient_id, time);
+CREATE INDEX IF NOT EXISTS medication_events_patient_time ON medication_events (patient_id, time);
+"""
+
+# Journal file -> (table, columns taken from each event besides patient and time)
+JOURNAL_TABLES = {
+    'seizure_events.json': ('seizure_events', ('event',)),
+    'medication_log.json': ('medication_events', ('medication', 'dose_mg', 'protocol')),
+}
+
+
+class EventDatabase:
+    """Indexed SQLite store of patients, sessions, seizure events and medication events."""
+
+    def __init__(self, path=DATABASE_FILE):
+        self.path = path
+        # Written from the GUI thread, the journal writer and the worker pool; one connection, one lock
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        rebuild = self.drop_outdated_tables()
+        self.connection.executescript(SCHEMA)
+        self.connection.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+        for filename in rebuild:
+            self.import_journal(filename)
+
+    def drop_outdated_tables(self):
+        # Medication events indexed without their journal offset, or with an offset taken from a
+        # process's own file position while another process also appended, are rebuilt from the journal
+        columns = [row['name'] for row in self.connection.execute("PRAGMA table_info(medication_events)")]
+        version = self.connection.execute("PRAGMA user_version").fetchone()[0]
+        if not columns or version >= SCHEMA_VERSION:
+            return []
+        print("Rebuilding the medication event index from the journal.")
+        with self.connection:
+            self.connection.execute("DROP TABLE medication_events")
+        return ['medication_log.json']
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+    def upsert_patient(self, patient_id, name=None, age=None):
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT INTO patients (patient_id, name, age, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (patient_id) DO UPDATE SET name = excluded.name, age = excluded.age, "
+                "updated_at = excluded.updated_at",
+                (patient_id, name, age, datetime.datetime.now().timestamp()))
+
+    def add_session(self, patient_id, session):
+        """Index an archived session (an EEGArchive catalog entry)."""
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO sessions (patient_id, session_id, start, end, samples, channels, archive_file) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (patient_id, session['session_id'], session['start'], session['end'], session['samples'],
+                 session['channels'], session['data_file']))
+
+    def index_events(self, filename, events, default_patient_id=None, offsets=None):
+        """Insert journal records in one transaction; records already present are skipped.
+
+        offsets are the records' byte offsets in the journal, which identify medication events.
+        """
+        if filename not in JOURNAL_TABLES:
+            return 0
+        table, columns = JOURNAL_TABLES[filename]
+        if table == 'medication_events':
+            columns = columns + ('journal_offset',)
+        if offsets is None:
+            offsets = [None] * len(events)
+        rows = []
+        for event, offset in zip(events, offsets):
+            try:
+                time = parse_timestamp(event['timestamp'])
+            except (KeyError, ValueError):
+                continue
+            # '' marks records journalled before patient IDs were recorded
+            patient_id = event.get('patient_id') or default_patient_id or ''
+            rows.append((patient_id, time, event['timestamp'])
+                        + tuple(offset if column == 'journal_offset' else event.get(column) for column in columns))
+        placeholders = ", ".join("?" * (3 + len(columns)))
+        with self.lock, self.connection:
+            before = self.connection.total_changes
+            self.connection.executemany(
+                f"INSERT OR IGNORE INTO {table} (patient_id, time, timestamp, {', '.join(columns)}) "
+                f"VALUES ({placeholders})", rows)
+            return self.connection.total_changes - before
+
+    def import_journal(self, filename, directory=".", default_patient_id=None):
+        """Index every record of a JSON-lines journal; returns the number of new records."""
+        path = os.path.join(directory, filename)
+        if not os.path.exists(path):
+            return 0
+        events = []
+        offsets = []
+        with open(path, 'rb') as f:
+            offset = 0
+            for line in f:
+                if line.strip():
+                    try:
+                        events.append(json.loads(line))
+                        offsets.append(offset)
+                    except json.JSONDecodeError:
+                        print(f"Skipping malformed line in {path}")
+                offset += len(line)
+        return self.index_events(filename, events, default_patient_id, offsets)
+
+    def query(self, sql, parameters=()):
+        with self.lock:
+            return [dict(row) for row in self.connection.execute(sql, parameters)]
+
+    def patient(self, patient_id):
+        rows = self.query("SELECT * FROM patients WHERE patient_id = ?", (patient_id,))
+        return rows[0] if rows else None
+
+    def medications_for(self, patient_id, start=None, end=None):
+        return self.query(
+            "SELECT * FROM medication_events WHERE patient_id = ? AND time BETWEEN ? AND ? ORDER BY time",
+            (patient_id, start if start is not None else float('-inf'), end if end is not None else float('inf')))
+
+    def seizures_for(self, patient_id, start=None, end=None):
+        return self.query(
+            "SELECT * FROM seizure_events WHERE patient_id = ? AND time BETWEEN ? AND ? ORDER BY time",
+            (patient_id, start if start is not None else float('-inf'), end if end is not None else float('inf')))
+
+    def sessions_for(self, patient_id):
+        return self.query("SELECT * FROM sessions WHERE patient_id = ? ORDER BY start", (patient_id,))
+
+    def import_files(self, directory=".", default_patient_id=None, archive_root=None):
+        """Migrate Patient_Data_*.json, the JSON-lines journals and archive catalogs; safe to run repeatedly."""
+        counts = {'patients': 0, 'seizure_events': 0, 'medication_events': 0, 'sessions': 0}
+        for path in sorted(glob.glob(os.path.join(directory, "Patient_Data_*.json"))):
+            with open(path, 'r') as f:
+                patient = json.load(f)
+            self.upsert_patient(patient.get('id'), patient.get('name'), patient.get('age'))
+            counts['patients'] += 1
+        for filename, (table, _) in JOURNAL_TABLES.items():
+            counts[table] += self.import_journal(filename, directory, default_patient_id)
+        if archive_root is not None:
+            from archive import EEGArchive
+            archive = EEGArchive(archive_root)
+            for patient_dir in archive.patients():
+                catalog = archive.load_catalog(patient_dir)
+                for session in catalog['sessions']:
+                    self.add_session(catalog['patient_id'], session)
+                    counts['sessions'] += 1
+        return counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Patient and event index.")
+    parser.add_argument('--database', default=DATABASE_FILE)
+    commands = parser.add_subparsers(dest='command', required=True)
+    migrate = commands.add_parser('import', help="import existing JSON and JSON-lines files")
+    migrate.add_argument('--directory', default=".")
+    migrate.add_argument('--default-patient', help="patient ID for records written before IDs were recorded")
+    migrate.add_argument('--archive', default="archive", help="archive directory whose sessions to index")
+    doses = commands.add_parser('doses', help="medication events of one patient")
+    doses.add_argument('patient')
+    seizures = commands.add_parser('seizures', help="seizure events of one patient")
+    seizures.add_argument('patient')
+    args = parser.parse_args()
+
+    database = EventDatabase(args.database)
+    if args.command == 'import':
+        counts = database.import_files(args.directory, args.default_patient, args.archive)
+        print(f"Imported {counts['patients']} patients, {counts['seizure_events']} new seizure events, "
+              f"{counts['medication_events']} new medication events and {counts['sessions']} sessions.")
+    elif args.command == 'doses':
+        for row in database.medications_for(args.patient):
+            print(f"{row['timestamp']}  {row['dose_mg']} mg {row['medication']}  ({row['protocol']})")
+    elif args.command == 'seizures':
+        for row in database.seizures_for(args.patient):
+            print(f"{row['timestamp']}  {row['event']}")
+    database.close()
@@ -0,0 +1,121 @@
+import random
+
+import numpy as np
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+
+from instrumentation import timed_stage
+
+
+class SeizureDetector(QObject):
+    seizure_detected = pyqtSignal()
+
+    def __init__(self, threshold_ratio=3.0, baseline_windows=10):
+        super().__init__()
+        self.timer = QTimer()
+        self.timer.timeout.connect(self.detect_seizure)
+        # Start detection only when auto mode is enabled
+        self.running = False
+        self.interval_s = 1.0
+        self.threshold_ratio = threshold_ratio  # Line length above baseline that counts as a seizure
+        self.baseline_windows = baseline_windows  # Windows averaged before detection is armed
+        self.reset()
+
+    def reset(self):
+        self.window = []  # Samples of the window being evaluated
+        self.window_mask = []  # Matching artifact mask: True where a channel's sample is contaminated
+        self.window_start = None
+        self.previous_frame = None
+        self.previous_mask = None
+        self.masked_windows = 0  # Windows skipped because every channel carried an artifact
+        self.baseline = None
+        self.windows_seen = 0
+        self.receiving_samples = False
+        self.detection_time = None  # Sample time at the end of the last window flagged as a seizure
+        self.onset_time = None  # Sample time at the start of that window
+
+    def start_detection(self, interval_ms=1000):
+        self.interval_s = interval_ms / 1000
+        self.running = True
+        self.reset()
+        self.timer.start(interval_ms)  # Check every second by default
+        print("Seizure detection started.")
+
+    def stop_detection(self):
+        self.running = False
+        self.timer.stop()
+        print("Seizure detection stopped.")
+
+    def set_interval(self, interval_ms):
+        self.interval_s = interval_ms / 1000
+        self.timer.setInterval(interval_ms)
+
+    @timed_stage('detection')
+    def push_samples(self, timestamps, frames, mask=None):
+        """Feed acquired samples; windows are evaluated on sample time, not wall time.
+
+        mask (samples x channels, optional) marks artifact samples, which are left out of the line length.
+        """
+        if not self.running or not len(timestamps):
+            return
+        self.receiving_samples = True
+        timestamps = np.asarray(timestamps, dtype=float)
+        frames = np.asarray(frames, dtype=float).reshape(len(timestamps), -1)
+        if mask is None:
+            mask = np.zeros(frames.shape, dtype=bool)
+        start = 0
+        while start < len(timestamps):
+            if self.window_start is None:
+                self.window_start = timestamps[start]
+            # First sample that belongs to the next window
+            end = start + np.searchsorted(timestamps[start:], self.window_start + self.interval_s)
+            self.window.append(frames[start:end])
+            self.window_mask.append(mask[start:end])
+            if end >= len(timestamps):
+                break
+            self.evaluate_window()
+            self.window_start = timestamps[end]
+            start = end
+
+    def evaluate_window(self):
+        frames = np.concatenate(self.window)
+        mask = np.concatenate(self.window_mask)
+        if self.previous_frame is not None and self.previous_frame.shape[1] == frames.shape[1]:
+            frames = np.concatenate([self.previous_frame, frames])
+            mask = np.concatenate([self.previous_mask, mask])
+        self.window = []
+        self.window_mask = []
+        if len(frames) < 2:
+            return
+        self.previous_frame = frames[-1:]
+        self.previous_mask = mask[-1:]
+        # Mean line length per sample, summed over channels, counting only steps between clean samples
+        clean = ~(mask[1:] | mask[:-1])
+        clean_steps = clean.sum(axis=0)
+        usable = clean_steps >= len(clean) / 2  # Channels with at least half the window clean
+        if not usable.any():
+            self.masked_windows += 1
+            return
+        steps = np.where(clean, np.abs(np.diff(frames, axis=0)), 0.0)
+        # Scale up to all channels so the value stays comparable with the baseline
+        line_length = (steps.sum(axis=0)[usable] / clean_steps[usable]).sum() * len(usable) / usable.sum()
+        if self.windows_seen >= self.baseline_windows and 0 < self.threshold_ratio * self.baseline < line_length:
+            # Do not update the baseline during seizure activity
+            self.detection_time = self.window_start + self.interval_s
+            self.onset_time = self.window_start
+            self.seizure_detected.emit()
+            return
+        self.windows_seen += 1
+        if self.baseline is None:
+            self.baseline = line_length
+        else:
+            self.baseline += (line_length - self.baseline) / min(self.windows_seen, 60)
+
+    def detect_seizure(self):
+        if self.receiving_samples:
+            # Real samples drive detection through push_samples
+            return
+        # Randomly simulate seizure detection
+        if random.randint(0, 100) < 5:  # 5% chance every second
+            self.detection_time = self.onset_time = None  # No samples, so no sample times
+            self.seizure_detected.emit()
+            # Do not stop the timer to allow continuous detection
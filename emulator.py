@@ -0,0 +1,176 @@
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+import tty
+
+import numpy as np
+from PyQt5.QtCore import QCoreApplication, QTimer
+
+from acquisition import SerialSource, encode_frame
+
+
+class SerialEmulator:
+    """Streams synthetic multi-channel EEG frames through a pseudo-terminal.
+
+    The slave end (``port``) behaves like a serial device for pyserial. Frames the
+    reader has not yet taken wait in a bounded device FIFO; when the FIFO is full,
+    new frames are dropped the way a device overflow would drop them.
+    """
+
+    def __init__(self, sample_rate_hz=256, channel_count=8, noise=0.2, burst_interval_s=60.0,
+                 burst_duration_s=10.0, framing_error_rate=0.0, tick_ms=2, fifo_bytes=65536, seed=None):
+        self.sample_rate_hz = sample_rate_hz
+        self.channel_count = channel_count
+        self.noise = noise  # Standard deviation of the background noise
+        self.burst_interval_s = burst_interval_s  # 0 disables seizure-like bursts
+        self.burst_duration_s = burst_duration_s
+        self.framing_error_rate = framing_error_rate  # Fraction of frames corrupted on the wire
+        self.tick_ms = tick_ms
+        self.fifo_bytes = fifo_bytes
+        self.fifo = bytearray()  # Encoded bytes not yet accepted by the terminal
+        self.rng = np.random.default_rng(seed)
+        self.random = random.Random(seed)
+        self.sequence = 0
+        self.frames_sent = 0
+        self.frames_dropped = 0  # Frames lost because the reader did not keep up
+        self.frames_corrupted = 0
+        self.running = False
+        self.thread = None
+        self.master_fd, self.slave_fd = os.openpty()
+        tty.setraw(self.slave_fd)  # No echo or newline translation on binary frames
+        os.set_blocking(self.master_fd, False)
+        self.port = os.ttyname(self.slave_fd)
+        # Per-channel phase and alpha amplitude so channels are not identical
+        self.phases = self.rng.uniform(0, 2 * np.pi, channel_count)
+        self.amplitudes = self.rng.uniform(0.5, 1.0, channel_count)
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        print(f"Serial emulator streaming {self.channel_count} channels at {self.sample_rate_hz} Hz on {self.port}.")
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def close(self):
+        self.stop()
+        os.close(self.master_fd)
+        os.close(self.slave_fd)
+
+    def synthesize(self, sequences):
+        # Background alpha rhythm plus noise, with spike-wave bursts mimicking seizures
+        t = sequences[:, None] / self.sample_rate_hz
+        signal = self.amplitudes * np.sin(2 * np.pi * 10 * t + self.phases)
+        signal = signal + self.rng.normal(0, self.noise, (len(sequences), self.channel_count))
+        if self.burst_interval_s:
+            in_burst = (t[:, 0] % self.burst_interval_s) >= self.burst_interval_s - self.burst_duration_s
+            spike_wave = 16 * np.sin(2 * np.pi * 3 * t) ** 15 + 5 * np.sin(2 * np.pi * 3 * t)
+            signal[in_burst] += spike_wave[in_burst]
+        return signal.astype('<f4')
+
+    def corrupt(self, frame):
+        self.frames_corrupted += 1
+        damage = self.random.choice(('flip', 'truncate', 'garbage'))
+        if damage == 'flip':
+            frame = bytearray(frame)
+            frame[self.random.randrange(len(frame))] ^= 0xFF
+            return bytes(frame)
+        if damage == 'truncate':
+            return frame[:self.random.randrange(1, len(frame))]
+        return bytes(self.random.randrange(256) for _ in range(8)) + frame
+
+    def run(self):
+        start_time = time.monotonic()
+        while self.running:
+            due = int((time.monotonic() - start_time) * self.sample_rate_hz)
+            if due > self.sequence:
+                sequences = np.arange(self.sequence, due)
+                samples = self.synthesize(sequences)
+                frames = []
+                for sequence, values in zip(sequences, samples):
+                    frame = encode_frame(int(sequence), values)
+                    if self.framing_error_rate and self.random.random() < self.framing_error_rate:
+                        frame = self.corrupt(frame)
+                    frames.append(frame)
+                self.write(frames)
+                self.sequence = due
+            time.sleep(self.tick_ms / 1000)
+
+    def write(self, frames):
+        for frame in frames:
+            if len(self.fifo) + len(frame) > self.fifo_bytes:
+                self.frames_dropped += 1
+                continue
+            self.fifo += frame
+            self.frames_sent += 1
+        try:
+            written = os.write(self.master_fd, self.fifo)
+        except BlockingIOError:
+            written = 0
+        del self.fifo[:written]
+
+
+def run_load_test(duration_s=10.0, sample_rate_hz=2000, channel_count=64, noise=0.2, framing_error_rate=0.0, poll_ms=10):
+    """Stream emulated frames through SerialSource for duration_s and report throughput and losses."""
+    app = QCoreApplication.instance() or QCoreApplication(sys.argv)
+    emulator = SerialEmulator(sample_rate_hz, channel_count, noise=noise, framing_error_rate=framing_error_rate)
+    source = SerialSource(emulator.port, sample_rate_hz, poll_ms=poll_ms)
+    received = [0]
+    source.samples_ready.connect(lambda timestamps, frames: received.__setitem__(0, received[0] + len(timestamps)))
+    source.start()
+    emulator.start()
+    wall_start = time.monotonic()
+    QTimer.singleShot(int(duration_s * 1000), app.quit)
+    app.exec_()
+    wall_time = time.monotonic() - wall_start
+    emulator.stop()
+    decoder = source.decoder
+    source.stop()
+    emulator.close()
+    return {
+        'sample_rate_hz': sample_rate_hz,
+        'channels': channel_count,
+        'duration_s': wall_time,
+        'frames_generated': emulator.sequence,
+        'frames_sent': emulator.frames_sent - len(emulator.fifo) // (4 * channel_count + 9),
+        'frames_dropped_at_device': emulator.frames_dropped,
+        'frames_corrupted': emulator.frames_corrupted,
+        'frames_received': received[0],
+        'frames_per_second': received[0] / wall_time,
+        'dropped_frames': decoder.dropped_frames,
+        'framing_errors': decoder.framing_errors,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Emulate a serial EEG device on a pseudo-terminal.")
+    parser.add_argument('--rate', type=int, default=256, help="samples per second per channel")
+    parser.add_argument('--channels', type=int, default=8)
+    parser.add_argument('--noise', type=float, default=0.2)
+    parser.add_argument('--burst-interval', type=float, default=60.0, help="seconds between seizure-like bursts, 0 to disable")
+    parser.add_argument('--burst-duration', type=float, default=10.0)
+    parser.add_argument('--framing-error-rate', type=float, default=0.0)
+    parser.add_argument('--load-test', type=float, metavar='SECONDS',
+                        help="read the stream back through SerialSource and report dropped frames")
+    args = parser.parse_args()
+    if args.load_test:
+        summary = run_load_test(args.load_test, args.rate, args.channels, args.noise, args.framing_error_rate)
+        print(json.dumps(summary, indent=4))
+    else:
+        emulator = SerialEmulator(args.rate, args.channels, args.noise, args.burst_interval,
+                                  args.burst_duration, args.framing_error_rate)
+        emulator.start()
+        print(f"Connect to {emulator.port}. Press Ctrl+C to stop.")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            emulator.close()
@@ -0,0 +1,199 @@
+import math
+
+import numpy as np
+
+CHUNK_SAMPLES = 64  # Block length of the precomputed response matrices; longer blocks are processed in chunks
+BUTTERWORTH_ORDER = 4  # High- and low-pass order, two second-order sections each
+NOTCH_Q = 30.0
+MONTAGES = ('referential', 'average', 'bipolar')
+
+
+def biquad(kind, frequency_hz, sample_rate_hz, q):
+    """One second-order section [b0, b1, b2, 1, a1, a2] (RBJ cookbook, bilinear transform)."""
+    w0 = 2 * math.pi * frequency_hz / sample_rate_hz
+    cos_w0 = math.cos(w0)
+    alpha = math.sin(w0) / (2 * q)
+    if kind == 'notch':
+        b = [1.0, -2 * cos_w0, 1.0]
+    elif kind == 'lowpass':
+        b = [(1 - cos_w0) / 2, 1 - cos_w0, (1 - cos_w0) / 2]
+    elif kind == 'highpass':
+        b = [(1 + cos_w0) / 2, -(1 + cos_w0), (1 + cos_w0) / 2]
+    else:
+        raise ValueError(f"Unknown filter kind: {kind}")
+    a0 = 1 + alpha
+    return [b[0] / a0, b[1] / a0, b[2] / a0, 1.0, -2 * cos_w0 / a0, (1 - alpha) / a0]
+
+
+def butterworth(kind, cutoff_hz, sample_rate_hz, order=BUTTERWORTH_ORDER):
+    # Cascading sections with the Butterworth pole Qs gives a maximally flat response of the full order
+    return [biquad(kind, cutoff_hz, sample_rate_hz, 1 / (2 * math.cos(math.pi * (2 * k + 1) / (2 * order))))
+            for k in range(order // 2)]
+
+
+def design_sos(sample_rate_hz, notch_hz=None, highpass_hz=0, lowpass_hz=0):
+    """Second-order sections for the requested filters; cutoffs at or above Nyquist are left out."""
+    nyquist = sample_rate_hz / 2
+    sections = []
+    if notch_hz:
+        if notch_hz < nyquist:
+            sections.append(biquad('notch', notch_hz, sample_rate_hz, NOTCH_Q))
+        else:
+            print(f"Notch at {notch_hz} Hz is above Nyquist ({nyquist} Hz); not applied.")
+    if highpass_hz:
+        if highpass_hz < nyquist:
+            sections += butterworth('highpass', highpass_hz, sample_rate_hz)
+        else:
+            print(f"High-pass at {highpass_hz} Hz is above Nyquist ({nyquist} Hz); not applied.")
+    if lowpass_hz:
+        if lowpass_hz < nyquist:
+            sections += butterworth('lowpass', lowpass_hz, sample_rate_hz)
+        else:
+            print(f"Low-pass at {lowpass_hz} Hz is above Nyquist ({nyquist} Hz); not applied.")
+    return np.array(sections, dtype=float).reshape(-1, 6)
+
+
+def montage_matrix(montage, channel_count):
+    """Matrix mapping recorded channels (columns) to montage channels (rows)."""
+    if montage == 'referential' or channel_count < 2:
+        return None
+    if montage == 'average':
+        # Common average reference: each channel minus the mean of all channels
+        return np.eye(channel_count) - 1.0 / channel_count
+    if montage == 'bipolar':
+        # Chain of neighbouring pairs: 1-2, 2-3, ...
+        matrix = np.zeros((channel_count - 1, channel_count))
+        rows = np.arange(channel_count - 1)
+        matrix[rows, rows] = 1.0
+        matrix[rows, rows + 1] = -1.0
+        return matrix
+    raise ValueError(f"Unknown montage: {montage}")
+
+
+def filter_options(settings):
+    """FilterStage keyword arguments from the application settings."""
+    notch = settings.get('notch_hz')
+    return {
+        'notch_hz': None if notch == 'off' else float(notch),
+        'highpass_hz': settings.get('highpass_hz'),
+        'lowpass_hz': settings.get('lowpass_hz'),
+        'montage': settings.get('montage'),
+    }
+
+
+class SOSFilter:
+    """Streaming cascade of second-order sections over many channels, with state kept between blocks.
+
+    The cascade is linear, so for a chunk of n samples the output is T x + Z s and the next state
+    is P s + Q x, where s is the state before the chunk. T (the impulse response as a Toeplitz
+    matrix), Z, P and Q are computed once per chunk length, which turns the per-sample recursion
+    into a few matrix products over all channels at once.
+    """
+
+    def __init__(self, sos, channel_count):
+        self.sos = np.asarray(sos, dtype=float).reshape(-1, 6)
+        self.channel_count = channel_count
+        self.state_size = 2 * len(self.sos)
+        self.matrices = {}
+        if len(self.sos):
+            self.responses = self.simulate(CHUNK_SAMPLES)
+        self.reset()
+
+    def reset(self):
+        self.state = np.zeros((self.state_size, self.channel_count))
+
+    def simulate(self, length):
+        # Run the recursion once on an impulse (column 0) and on each unit initial state (the other columns)
+        columns = 1 + self.state_size
+        state = np.zeros((len(self.sos), 2, columns))
+        for section in range(len(self.sos)):
+            for slot in range(2):
+                state[section, slot, 1 + 2 * section + slot] = 1.0
+        outputs = np.zeros((length, columns))
+        states = np.zeros((length + 1, self.state_size, columns))
+        states[0] = state.reshape(self.state_size, columns)
+        for n in range(length):
+            x = np.zeros(columns)
+            if n == 0:
+                x[0] = 1.0
+            for section, (b0, b1, b2, _, a1, a2) in enumerate(self.sos):
+                # Transposed direct form II
+                y = b0 * x + state[section, 0]
+                state[section, 0] = b1 * x - a1 * y + state[section, 1]
+                state[section, 1] = b2 * x - a2 * y
+                x = y
+            outputs[n] = x
+            states[n + 1] = state.reshape(self.state_size, columns)
+        return outputs, states
+
+    def chunk_matrices(self, length):
+        matrices = self.matrices.get(length)
+        if matrices is None:
+            outputs, states = self.responses
+            impulse = outputs[:length, 0]
+            lags = np.arange(length)[:, None] - np.arange(length)[None, :]
+            t = np.where(lags >= 0, impulse[np.clip(lags, 0, None)], 0.0)
+            z = outputs[:length, 1:]
+            p = states[length, :, 1:]
+            # An impulse at sample j has had length - j samples to evolve by the end of the chunk
+            q = states[length - np.arange(length), :, 0].T
+            matrices = self.matrices[length] = (t, z, p, q)
+        return matrices
+
+    def process(self, frames):
+        """Filter a block of frames (samples x channels) and return the filtered block."""
+        frames = np.asarray(frames, dtype=float)
+        if not len(self.sos) or not len(frames):
+            return frames
+        output = np.empty_like(frames)
+        for start in range(0, len(frames), CHUNK_SAMPLES):
+            chunk = frames[start:start + CHUNK_SAMPLES]
+            t, z, p, q = self.chunk_matrices(len(chunk))
+            output[start:start + len(chunk)] = t @ chunk + z @ self.state
+            self.state = p @ self.state + q @ chunk
+        return output
+
+
+class FilterStage:
+    """Montage re-referencing followed by notch and bandpass filtering of the acquired stream."""
+
+    def __init__(self, sample_rate_hz, notch_hz=None, highpass_hz=0, lowpass_hz=0, montage='referential'):
+        self.sample_rate_hz = sample_rate_hz
+        self.notch_hz = notch_hz
+        self.highpass_hz = highpass_hz
+        self.lowpass_hz = lowpass_hz
+        self.montage = montage
+        self.input_channels = None
+        self.filter = None
+        self.reference = None
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls(settings.get('sample_rate_hz'), **filter_options(settings))
+
+    def configure(self, **changes):
+        """Change filter parameters; the filter is redesigned and its state cleared on the next block."""
+        for key, value in changes.items():
+            setattr(self, key, value)
+        self.input_channels = None
+
+    def setup(self, channel_count):
+        self.input_channels = channel_count
+        self.reference = montage_matrix(self.montage, channel_count)
+        output_channels = channel_count if self.reference is None else len(self.reference)
+        sos = design_sos(self.sample_rate_hz, self.notch_hz, self.highpass_hz, self.lowpass_hz)
+        self.filter = SOSFilter(sos, output_channels)
+
+    def montage_mask(self, mask):
+        """Map a per-channel mask of recorded channels onto the montage channels derived from them."""
+        if self.reference is None or not len(mask):
+            return mask
+        return (mask @ (self.reference != 0).T) > 0
+
+    def process(self, frames):
+        frames = np.asarray(frames, dtype=float)
+        if frames.shape[1] != self.input_channels:
+            self.setup(frames.shape[1])
+        if self.reference is not None:
+            frames = frames @ self.reference.T
+        return self.filter.process(frames)
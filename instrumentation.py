@@ -0,0 +1,349 @@
+import collections
+import datetime
+import functools
+import itertools
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from PyQt5.QtCore import QObject, Qt, QTimer, pyqtSignal
+from PyQt5.QtGui import QFont
+from PyQt5.QtWidgets import QFrame, QHBoxLayout, QLabel, QPushButton, QVBoxLayout
+
+HISTOGRAM_BUCKETS = 40  # Bucket i holds durations in [2^(i-1), 2^i) microseconds
+MAX_ONSET_AGE_S = 600  # Older sample times come from another clock (e.g. a replay) and are not traced
+
+
+class Histogram:
+    """Log2-bucketed timing histogram; recording is O(1) and allocation free."""
+
+    def __init__(self):
+        self.buckets = [0] * HISTOGRAM_BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+
+    def record(self, seconds):
+        index = int(seconds * 1e6).bit_length()
+        self.buckets[min(index, HISTOGRAM_BUCKETS - 1)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.maximum:
+            self.maximum = seconds
+
+    def percentile(self, fraction):
+        # Upper bound of the bucket holding the requested fraction of samples, in seconds
+        if not self.count:
+            return 0.0
+        target = fraction * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.buckets):
+            seen += bucket_count
+            if seen >= target:
+                return min(2 ** index / 1e6, self.maximum)
+        return self.maximum
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'mean_ms': self.total / self.count * 1000 if self.count else 0.0,
+            'p50_ms': self.percentile(0.5) * 1000,
+            'p95_ms': self.percentile(0.95) * 1000,
+            'p99_ms': self.percentile(0.99) * 1000,
+            'max_ms': self.maximum * 1000,
+            'buckets_us': {f"<{2 ** index}": bucket_count for index, bucket_count in enumerate(self.buckets) if bucket_count},
+        }
+
+
+class Profiler(QObject):
+    """Collects per-stage timings, counters and gauges while enabled."""
+
+    def __init__(self):
+        super().__init__()
+        self.enabled = False
+        self.stages = {}
+        self.counters = {}
+        self.gauge_sources = {}  # Gauge name -> callable, read only when a snapshot is taken
+        # Event-loop lag: how late a periodic timer fires compared to its interval
+        self.lag_interval_ms = 100
+        self.lag_timer = QTimer()
+        self.lag_timer.timeout.connect(self.measure_event_loop_lag)
+        self.last_lag_check = None
+
+    def set_enabled(self, enabled):
+        self.enabled = enabled
+        if enabled:
+            self.last_lag_check = time.perf_counter()
+            self.lag_timer.start(self.lag_interval_ms)
+        else:
+            self.lag_timer.stop()
+
+    def record(self, stage, seconds):
+        histogram = self.stages.get(stage)
+        if histogram is None:
+            histogram = self.stages[stage] = Histogram()
+        histogram.record(seconds)
+
+    def count(self, counter, amount=1):
+        if self.enabled:
+            self.counters[counter] = self.counters.get(counter, 0) + amount
+
+    def add_gauge(self, name, source):
+        self.gauge_sources[name] = source
+
+    def measure_event_loop_lag(self):
+        now = time.perf_counter()
+        self.record('event_loop_lag', max(0.0, now - self.last_lag_check - self.lag_interval_ms / 1000))
+        self.last_lag_check = now
+
+    def reset(self):
+        self.stages = {}
+        self.counters = {}
+
+    def snapshot(self):
+        gauges = {}
+        for name, source in self.gauge_sources.items():
+            try:
+                gauges[name] = source()
+            except Exception as e:  # A gauge must never break the snapshot
+                gauges[name] = f"unavailable: {e}"
+        return {
+            'timestamp': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'stages': {name: histogram.summary() for name, histogram in sorted(self.stages.items())},
+            'counters': dict(sorted(self.counters.items())),
+            'gauges': gauges,
+            'tracing': tracer.summary(),
+        }
+
+    def export_snapshot(self, filename=None):
+        if filename is None:
+            filename = f"Performance_Snapshot_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+        with open(filename, 'w') as f:
+            json.dump(self.snapshot(), f, indent=4)
+        return filename
+
+
+profiler = Profiler()
+
+
+class CountingThreadPool(ThreadPoolExecutor):
+    """ThreadPoolExecutor that counts its queued and running jobs, for the worker gauge."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lock = threading.Lock()
+        self.jobs = 0
+
+    def submit(self, function, *args, **kwargs):
+        # Counted before submitting, so a job finishing at once never takes the count below zero
+        with self.lock:
+            self.jobs += 1
+        try:
+            future = super().submit(function, *args, **kwargs)
+        except RuntimeError:  # Shut down
+            self.job_done(None)
+            raise
+        future.add_done_callback(self.job_done)
+        return future
+
+    def job_done(self, future):
+        with self.lock:
+            self.jobs -= 1
+
+
+class Tracer(QObject):
+    """End-to-end traces of seizure handling: EEG onset, detection, protocol start and first dose.
+
+    Each trace carries a correlation ID that is also written to the journalled events, and stamps
+    its stages with time.monotonic(). Latencies between consecutive stages, and from the first to
+    the last stage ('end_to_end'), go into histograms and are checked against per-span budgets.
+    Spans marked as waits (a protocol's duration threshold) are left out of 'end_to_end'.
+    """
+    budget_exceeded = pyqtSignal(dict, str, float)  # Signal with the trace, span name and seconds
+
+    def __init__(self, max_traces=1000, max_open=100):
+        super().__init__()
+        self.ids = itertools.count(1)
+        self.open_traces = collections.OrderedDict()  # Trace id -> trace still collecting stages
+        self.traces = collections.deque(maxlen=max_traces)  # Finished traces, newest last
+        self.max_open = max_open
+        self.latencies = {}  # Span name -> Histogram
+        self.budgets = {}  # Span name -> seconds
+        self.budget_violations = 0
+
+    def set_budget(self, span, seconds):
+        self.budgets[span] = seconds
+
+    def begin(self, name, onset_time=None, **args):
+        """Open a trace at detection; onset_time is the epoch time of the first seizure sample, if known."""
+        now = time.monotonic()
+        trace_id = f"{os.getpid()}-{next(self.ids)}"
+        trace = {'id': trace_id, 'name': name, 'args': args, 'stages': [], 'waited': 0.0}
+        if onset_time is not None and 0 <= time.time() - onset_time <= MAX_ONSET_AGE_S:
+            trace['stages'].append(('onset', now - (time.time() - onset_time)))
+        self.open_traces[trace_id] = trace
+        while len(self.open_traces) > self.max_open:
+            self.open_traces.popitem(last=False)  # Abandoned traces must not grow without bound
+        self.mark(trace_id, 'detected', now)
+        return trace_id
+
+    def mark(self, trace_id, stage, now=None, wait=False):
+        """Stamp a stage; wait=True when the span leading to it is deliberate rather than latency."""
+        trace = self.open_traces.get(trace_id)
+        if trace is None:
+            return
+        now = time.monotonic() if now is None else now
+        if trace['stages']:
+            previous_stage, previous_time = trace['stages'][-1]
+            self.record(trace, f"{previous_stage}->{stage}", now - previous_time)
+            if wait:
+                trace['waited'] += now - previous_time
+        trace['stages'].append((stage, now))
+
+    def end(self, trace_id):
+        trace = self.open_traces.pop(trace_id, None)
+        if trace is None:
+            return
+        stages = trace['stages']
+        if len(stages) > 1:
+            self.record(trace, 'end_to_end', stages[-1][1] - stages[0][1] - trace['waited'])
+        self.traces.append(trace)
+
+    def discard(self, trace_id):
+        # A detection that never led to a dose, such as an episode shorter than every threshold
+        self.open_traces.pop(trace_id, None)
+
+    def record(self, trace, span, seconds):
+        histogram = self.latencies.get(span)
+        if histogram is None:
+            histogram = self.latencies[span] = Histogram()
+        histogram.record(seconds)
+        profiler.record(span, seconds)
+        budget = self.budgets.get(span)
+        if budget is not None and seconds > budget:
+            self.budget_violations += 1
+            self.budget_exceeded.emit(trace, span, seconds)
+
+    def summary(self):
+        return {
+            'traces': len(self.traces),
+            'budget_violations': self.budget_violations,
+            'budgets_ms': {span: seconds * 1000 for span, seconds in self.budgets.items()},
+            'latencies': {span: histogram.summary() for span, histogram in sorted(self.latencies.items())},
+        }
+
+    def chrome_trace(self):
+        """Finished traces as Chrome trace events (chrome://tracing, Perfetto); one row per trace."""
+        pid = os.getpid()
+        events = []
+        for row, trace in enumerate(self.traces):
+            args = dict(trace['args'], trace_id=trace['id'])
+            events.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': row,
+                           'args': {'name': f"{trace['name']} {trace['id']}"}})
+            stages = trace['stages']
+            for (stage, start), (next_stage, end) in zip(stages, stages[1:]):
+                events.append({'name': f"{stage}->{next_stage}", 'cat': trace['name'], 'ph': 'X', 'pid': pid,
+                               'tid': row, 'ts': start * 1e6, 'dur': (end - start) * 1e6, 'args': args})
+            for stage, moment in stages:
+                events.append({'name': stage, 'cat': trace['name'], 'ph': 'i', 's': 't', 'pid': pid,
+                               'tid': row, 'ts': moment * 1e6, 'args': args})
+        return {'traceEvents': events, 'displayTimeUnit': 'ms', 'otherData': self.summary()}
+
+    def export_chrome_trace(self, filename=None):
+        if filename is None:
+            filename = f"Seizure_Trace_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+        with open(filename, 'w') as f:
+            json.dump(self.chrome_trace(), f)
+        return filename
+
+
+tracer = Tracer()
+
+
+def timed_stage(stage):
+    """Decorator that records the call duration under stage while the profiler is enabled."""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not profiler.enabled:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                profiler.record(stage, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+class PerformanceOverlay(QFrame):
+    """Translucent panel over the main window showing live profiler statistics."""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setStyleSheet("""
+            QFrame {
+                background-color: rgba(0, 0, 0, 200);
+                border-radius: 8px;
+            }
+            QLabel {
+                color: #2ecc71;
+                background: transparent;
+            }
+        """)
+        layout = QVBoxLayout()
+        self.stats_label = QLabel()
+        self.stats_label.setFont(QFont('Courier', 9))
+        self.stats_label.setTextFormat(Qt.PlainText)
+        layout.addWidget(self.stats_label)
+
+        buttons_layout = QHBoxLayout()
+        export_button = QPushButton("Export Snapshot")
+        export_button.clicked.connect(self.export_snapshot)
+        trace_button = QPushButton("Export Trace")
+        trace_button.clicked.connect(self.export_trace)
+        reset_button = QPushButton("Reset")
+        reset_button.clicked.connect(profiler.reset)
+        buttons_layout.addWidget(export_button)
+        buttons_layout.addWidget(trace_button)
+        buttons_layout.addWidget(reset_button)
+        layout.addLayout(buttons_layout)
+        self.setLayout(layout)
+
+        # Refresh only while visible so a hidden overlay costs nothing
+        self.refresh_timer = QTimer()
+        self.refresh_timer.timeout.connect(self.refresh)
+        self.setVisible(False)
+
+    def showEvent(self, event):
+        self.refresh()
+        self.refresh_timer.start(500)
+        super().showEvent(event)
+
+    def hideEvent(self, event):
+        self.refresh_timer.stop()
+        super().hideEvent(event)
+
+    def refresh(self):
+        snapshot = profiler.snapshot()
+        lines = [f"{'stage':<22}{'count':>8}{'p50 ms':>9}{'p95 ms':>9}{'max ms':>9}"]
+        for name, stats in snapshot['stages'].items():
+            lines.append(f"{name:<22}{stats['count']:>8}{stats['p50_ms']:>9.2f}{stats['p95_ms']:>9.2f}{stats['max_ms']:>9.2f}")
+        for name, value in list(snapshot['counters'].items()) + list(snapshot['gauges'].items()):
+            lines.append(f"{name:<22}{value:>8}")
+        self.stats_label.setText("\n".join(lines))
+        self.adjustSize()
+        if self.parent() is not None:
+            # Keep the panel pinned to the top-right corner
+            self.move(self.parent().width() - self.width() - 10, 50)
+        self.raise_()
+
+    def export_snapshot(self):
+        filename = profiler.export_snapshot()
+        print(f"Performance snapshot saved to {filename}")
+
+    def export_trace(self):
+        filename = tracer.export_chrome_trace()
+        print(f"Seizure handling trace saved to {filename}")
@@ -0,0 +1,178 @@
+import argparse
+import collections
+import json
+import os
+import time
+
+from replay import parse_timestamp
+
+DOSE_LIMITS_FILE = "dose_limits.json"
+MEDICATION_JOURNAL = "medication_log.json"
+HOUR_S = 3600
+DAY_S = 86400
+READ_BLOCK_BYTES = 64 * 1024
+
+# Illustrative adult ceilings (mg per hour, mg per 24 hours). Each site sets its own in dose_limits.json;
+# medications without an entry are not limited.
+DEFAULT_DOSE_LIMITS = {
+    'Levetiracetam (Keppra)': {'max_1h_mg': 4500, 'max_24h_mg': 6000},
+    'Phenytoin (Dilantin)': {'max_1h_mg': 1500, 'max_24h_mg': 2000},
+    'Valproate (Depakote)': {'max_1h_mg': 3000, 'max_24h_mg': 4000},
+    'Lacosamide (Vimpat)': {'max_1h_mg': 400, 'max_24h_mg': 600},
+    'Lorazepam (Ativan)': {'max_1h_mg': 8, 'max_24h_mg': 12},
+    'Diazepam (Valium)': {'max_1h_mg': 20, 'max_24h_mg': 40},
+}
+
+
+def load_dose_limits(path=DOSE_LIMITS_FILE):
+    """Default limits overridden per medication by the limits file, when there is one."""
+    limits = {medication: dict(limit) for medication, limit in DEFAULT_DOSE_LIMITS.items()}
+    if not os.path.exists(path):
+        return limits
+    try:
+        with open(path, 'r') as f:
+            stored = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"Could not read dose limits from {path}: {e}. Using defaults.")
+        return limits
+    for medication, limit in stored.items():
+        limits[medication] = {key: float(limit[key]) for key in ('max_1h_mg', 'max_24h_mg') if limit.get(key) is not None}
+    return limits
+
+
+class RollingSum:
+    """Sum of the values added during the last window_s seconds; values must be added in time order."""
+
+    def __init__(self, window_s):
+        self.window_s = window_s
+        self.entries = collections.deque()  # (time, value), oldest first
+        self.total = 0.0
+
+    def add(self, time, value):
+        self.entries.append((time, value))
+        self.total += value
+        self.value(time)  # Expire here too, so the window stays bounded even when totals are never read
+
+    def value(self, now):
+        # Each entry is added and expired once, so this is amortised O(1)
+        cutoff = now - self.window_s
+        while self.entries and self.entries[0][0] <= cutoff:
+            self.total -= self.entries.popleft()[1]
+        if not self.entries:
+            self.total = 0.0  # Drop accumulated rounding error
+        return self.total
+
+
+class DoseLedger:
+    """Per-patient, per-medication cumulative doses over the last hour and day, checked against limits."""
+
+    def __init__(self, limits=None):
+        self.limits = limits if limits is not None else load_dose_limits()
+        self.enabled = True
+        self.windows = {}  # (patient id, medication) -> (last hour, last day)
+
+    def window(self, patient_id, medication):
+        key = (patient_id or '', medication)
+        windows = self.windows.get(key)
+        if windows is None:
+            windows = self.windows[key] = (RollingSum(HOUR_S), RollingSum(DAY_S))
+        return windows
+
+    def record(self, patient_id, medication, dose_mg, time_s=None):
+        time_s = time.time() if time_s is None else time_s
+        for rolling_sum in self.window(patient_id, medication):
+            rolling_sum.add(time_s, dose_mg)
+
+    def totals(self, patient_id, medication, now=None):
+        """(mg in the last hour, mg in the last 24 hours)."""
+        now = time.time() if now is None else now
+        last_hour, last_day = self.window(patient_id, medication)
+        return last_hour.value(now), last_day.value(now)
+
+    def check(self, patient_id, medication, dose_mg, now=None):
+        """None when the dose is within the limits, otherwise the reason it is not."""
+        limit = self.limits.get(medication)
+        if not self.enabled or not limit:
+            return None
+        last_hour, last_day = self.totals(patient_id, medication, now)
+        if 'max_1h_mg' in limit and last_hour + dose_mg > limit['max_1h_mg']:
+            return f"{last_hour:g} mg given in the last hour; {dose_mg:g} mg more exceeds {limit['max_1h_mg']:g} mg/h"
+        if 'max_24h_mg' in limit and last_day + dose_mg > limit['max_24h_mg']:
+            return f"{last_day:g} mg given in the last 24 h; {dose_mg:g} mg more exceeds {limit['max_24h_mg']:g} mg/24 h"
+        return None
+
+    def rebuild(self, path=MEDICATION_JOURNAL, now=None):
+        """Reload the last 24 hours of doses from the medication journal; returns the number loaded."""
+        now = time.time() if now is None else now
+        self.windows = {}
+        doses = []
+        for event in read_recent_events(path, now - DAY_S):
+            try:
+                doses.append((parse_timestamp(event['timestamp']), event.get('patient_id'),
+                              str(event['medication']), float(event['dose_mg'])))
+            except (KeyError, TypeError, ValueError):
+                continue
+        doses = sorted((dose for dose in doses if dose[0] > now - DAY_S), key=lambda dose: dose[0])
+        for time_s, patient_id, medication, dose_mg in doses:
+            self.record(patient_id, medication, dose_mg, time_s)
+        return len(doses)
+
+
+def read_recent_events(path, since):
+    """Journal records from since onwards, read backwards from the end of the file.
+
+    Records are appended in time order, so reading stops at the first block whose records
+    are all older than since; startup cost follows the last day's doses, not the journal's age.
+    """
+    if not os.path.exists(path):
+        return []
+    events = []
+    with open(path, 'rb') as f:
+        position = f.seek(0, os.SEEK_END)
+        tail = b''
+        while position > 0:
+            size = min(READ_BLOCK_BYTES, position)
+            position -= size
+            f.seek(position)
+            lines = (f.read(size) + tail).split(b'\n')
+            # The first line may be cut by the block boundary; keep it for the next block
+            tail = lines.pop(0) if position > 0 else b''
+            block = [event for event in map(parse_line, lines) if event is not None]
+            events.extend(block)
+            if block and all(event_time(event) < since for event in block):
+                break
+    return events
+
+
+def parse_line(line):
+    if not line.strip():
+        return None
+    try:
+        return json.loads(line)
+    except ValueError:
+        return None
+
+
+def event_time(event):
+    try:
+        return parse_timestamp(event['timestamp'])
+    except (KeyError, TypeError, ValueError):
+        return float('inf')  # Unreadable timestamps never end the backwards scan
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cumulative doses over the last hour and day, against the limits.")
+    parser.add_argument('patient', nargs='?', default='', help="patient ID ('' for records without one)")
+    parser.add_argument('--journal', default=MEDICATION_JOURNAL)
+    parser.add_argument('--limits', default=DOSE_LIMITS_FILE)
+    args = parser.parse_args()
+
+    ledger = DoseLedger(load_dose_limits(args.limits))
+    ledger.rebuild(args.journal)
+    for patient_id, medication in sorted(ledger.windows):
+        if patient_id != args.patient:
+            continue
+        last_hour, last_day = ledger.totals(patient_id, medication)
+        limit = ledger.limits.get(medication, {})
+        print(f"{medication}: {last_hour:g} mg in 1 h (max {limit.get('max_1h_mg', '-')}), "
+              f"{last_day:g} mg in 24 h (max {limit.get('max_24h_mg', '-')})")
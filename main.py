@@ -1,4 +1,5 @@
 import sys
+import asyncio
 import serial
 import serial.tools.list_ports
 from PyQt5.QtWidgets import (
@@ -6,117 +7,42 @@ from PyQt5.QtWidgets import (
     QTabWidget, QScrollArea, QFrame, QInputDialog, QSplitter, QSizePolicy, QLineEdit,
     QTextEdit, QListWidget, QMessageBox, QTableWidget, QTableWidgetItem, QHeaderView,
     QDialog, QFormLayout, QComboBox, QSpinBox, QDoubleSpinBox, QDialogButtonBox,
-    QFileDialog, QGroupBox, QCheckBox
+    QFileDialog, QGroupBox, QCheckBox, QShortcut
 )
-from PyQt5.QtCore import Qt, QTimer, QDateTime, QObject, pyqtSignal
-from PyQt5.QtGui import QFont
+from PyQt5.QtCore import Qt, QTimer, pyqtSignal
+from PyQt5.QtGui import QFont, QKeySequence
 import pyqtgraph as pg
 import qdarkstyle
 import json
 import os
-import threading
 import datetime
-
-class SeizureDetector(QObject):
-    seizure_detected = pyqtSignal()
-
-    def __init__(self):
-        super().__init__()
-        self.timer = QTimer()
-        self.timer.timeout.connect(self.detect_seizure)
-        # Start detection only when auto mode is enabled
-
-    def start_detection(self):
-        self.timer.start(1000)  # Check every second
-        print("Seizure detection started.")
-
-    def stop_detection(self):
-        self.timer.stop()
-        print("Seizure detection stopped.")
-
-    def detect_seizure(self):
-        import random
-        # Randomly simulate seizure detection
-        if random.randint(0, 100) < 5:  # 5% chance every second
-            self.seizure_detected.emit()
-            # Do not stop the timer to allow continuous detection
-
-class SeizureProtocolManager(QObject):
-    dose_to_administer = pyqtSignal(float, str)  # Signal with dose in mg and medication name
-    protocol_started = pyqtSignal(str)  # Signal with protocol name
-    protocol_completed = pyqtSignal(str)
-    new_schedule = pyqtSignal(list)  # Signal with list of timestamps and doses
-    protocol_updated = pyqtSignal()
-
-    def __init__(self):
-        super().__init__()
-        self.protocols = {}  # Store all protocols
-        self.current_protocol = None
-        self.current_protocol_timer = None
-        self.step_index = 0
-        self.schedule = []
-
-    def add_protocol(self, protocol_id, name, seizure_duration_threshold, steps, total_duration):
-        """Add a new protocol to the system."""
-        self.protocols[protocol_id] = {
-            "id": protocol_id,
-            "name": name,
-            "seizure_duration_threshold": seizure_duration_threshold,  # in minutes
-            "steps": steps,  # list of dicts with 'duration' in minutes, 'dose_mg', 'medication'
-            "total_duration": total_duration  # in minutes
-        }
-        print(f"Added {name} (Protocol {protocol_id}) to the system.")
-        self.protocol_updated.emit()
-
-    def start_protocol(self, protocol_id):
-        """Start the protocol when a seizure is detected."""
-        if protocol_id not in self.protocols:
-            print(f"Protocol {protocol_id} not found.")
-            return
-
-        self.current_protocol = self.protocols[protocol_id]
-        self.protocol_started.emit(self.current_protocol['name'])
-        print(f"Running {self.current_protocol['name']}...")
-
-        # Create a schedule of timestamps and doses
-        self.schedule = []
-        current_time = QDateTime.currentDateTime()
-        for step in self.current_protocol['steps']:
-            duration = step['duration']  # in minutes
-            dose_mg = step['dose_mg']
-            medication = step.get('medication', 'Unknown')
-            timestamp = current_time.addSecs(duration * 60)
-            self.schedule.append({'time': timestamp, 'dose_mg': dose_mg, 'medication': medication})
-            current_time = timestamp
-
-        # Emit the schedule
-        self.new_schedule.emit(self.schedule)
-
-        # Start administering doses
-        self.step_index = 0
-        self.administer_next_dose()
-
-    def administer_next_dose(self):
-        if self.step_index >= len(self.current_protocol['steps']):
-            # Protocol completed
-            self.protocol_completed.emit(self.current_protocol['name'])
-            self.current_protocol = None
-            return
-
-        step = self.current_protocol['steps'][self.step_index]
-        dose_mg = step['dose_mg']
-        medication = step.get('medication', 'Unknown')
-        self.dose_to_administer.emit(dose_mg, medication)
-        print(f"Administering {dose_mg} mg of {medication} at {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}.")
-
-        # Schedule next dose
-        duration = step['duration']  # in minutes
-        self.current_protocol_timer = QTimer()
-        self.current_protocol_timer.setSingleShot(True)
-        self.current_protocol_timer.timeout.connect(self.administer_next_dose)
-        self.current_protocol_timer.start(duration * 60 * 1000)  # Convert to milliseconds
-
-        self.step_index += 1
+import multiprocessing
+import shutil
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from acquisition import SerialSource, SimulatedSource
+from analytics import SeizureAnalytics
+from artifacts import ArtifactDetector
+from aio import AsyncJournal, AsyncSerialSource, ExportServer, IOLoop, read_journal
+from archive import EEGArchive
+from checkpoint import CHECKPOINT_INTERVAL_MS, StateCheckpoint
+from database import EventDatabase
+from daemon import DaemonClient, DaemonSource
+from detection import SeizureDetector
+from filters import FilterStage, filter_options
+from instrumentation import CountingThreadPool, PerformanceOverlay, profiler, timed_stage, tracer
+from ledger import DoseLedger
+from protocols import DEFAULT_PROTOCOL, ProtocolSelector, SeizureProtocolManager
+from replay import ReplaySource, recording_entries
+from report import build_report, report_filename
+from ring import SampleRing
+from settings import Settings, SETTINGS_SPEC, buffer_capacity
+
+# Long sessions keep only their recent history in memory; the journals and the streamed recording hold the rest
+LOG_MAX_LINES = 10000
+MEDICATION_LOG_MAX_ENTRIES = 1000
 
 class AddProtocolDialog(QDialog):
     def __init__(self, medications):
@@ -328,19 +254,55 @@ class PatientDataPopup(QDialog):
         self.setLayout(layout)
 
 class MainWindow(QMainWindow):
+    ai_model_updated = pyqtSignal()  # Emitted from the I/O loop when training finishes
+    report_finished = pyqtSignal(list, str)  # Emitted from the report pool with the files written, or an error
+    save_finished = pyqtSignal(str, str, str)  # Emitted from the worker pool with the file saved, archive patient ID and any error
+
     def __init__(self):
         super().__init__()
 
         self.setWindowTitle("Medical Device UI")
         self.setGeometry(100, 100, 1200, 800)
 
+        # Persistent settings, applied live as they change
+        self.settings = Settings()
+        self.settings.setting_changed.connect(self.apply_setting)
+
         # Serial Port and Connection setup
         self.serial_port = None
-        self.data_buffer = []  # Buffer to store data from the serial port
-        self.eeg_data = []  # Store EEG data with timestamps
+        self.emulator = None  # Built-in serial device emulator, started on demand
+        self.daemon_client = None  # Connection to a headless monitoring daemon, when attached
+
+        # Multi-bed monitoring, created when the ward dashboard is first opened
+        self.session_manager = None
+        self.ward_dashboard = None
+        self.sample_ring = SampleRing(self.buffer_capacity())  # Shared-memory buffer of filtered samples
+        self.sample_ring_lock = threading.Lock()  # Export threads read the ring while it is written or replaced
+        self.filter_stage = FilterStage.from_settings(self.settings)  # Montage, notch and bandpass
+        self.artifact_detector = ArtifactDetector(self.settings.get('sample_rate_hz'))  # Screens detector input
+        self.eeg_data = deque(maxlen=self.buffer_capacity())  # Recent EEG data with timestamps, as long as the ring
+
+        # Serial devices, the event journal and exports wait on one asyncio loop thread
+        self.io_loop = IOLoop()
+        self.io_loop.start()
+        self.export_server = None
+
+        # Journal for seizure and medication events, indexed per patient, and a pool for blocking work
+        self.database = EventDatabase()
+        # Seizure statistics catch up on journal lines written since they were last saved, then follow the journal
+        self.analytics = SeizureAnalytics()
+        self.analytics.catch_up()
+        self.analytics.updated.connect(self.on_analytics_updated)
+        self.journal = AsyncJournal(self.io_loop, self.settings.get('journal_fsync'),
+                                    indexes=[self.database, self.analytics])
+        self.worker_pool = CountingThreadPool(max_workers=self.settings.get('worker_threads'))
+        self.archive = EEGArchive()
 
         # Recording and Auto Mode Flags
         self.is_recording = False
+        self.recording_file = None  # EEG_Data_*.jsonl the recording streams into
+        self.recorded_samples = 0
+        self.last_recording_file = None  # Kept after the recording stops, for Save EEG Data
         self.auto_mode = False
         self.seizure_active = False  # To track if a seizure is currently active
 
@@ -355,6 +317,22 @@ class MainWindow(QMainWindow):
         self.protocol_manager.protocol_started.connect(self.on_protocol_started)
         self.protocol_manager.protocol_completed.connect(self.on_protocol_completed)
         self.protocol_manager.protocol_updated.connect(self.update_protocol_list)
+        self.protocol_manager.dose_withheld.connect(self.on_dose_withheld)
+        # Every dose, automatic or manual, is checked against the patient's recent cumulative doses
+        self.dose_ledger = DoseLedger()
+        self.dose_ledger.enabled = self.settings.get('enforce_dose_limits')
+        self.dose_ledger.rebuild()
+        self.protocol_manager.dose_check = lambda dose_mg, medication: self.dose_ledger.check(
+            self.patient_id_input.text(), medication, dose_mg)
+        # Detections are grouped into episodes; protocols follow the episode's duration
+        self.protocol_selector = ProtocolSelector(self.protocol_manager)
+        self.protocol_selector.protocol_selected.connect(self.on_protocol_selected)
+        self.protocol_selector.episode_ended.connect(self.on_seizure_episode_ended)
+
+        # Sample sources feed ingest_samples; the simulated source is the default
+        self.simulated_source = SimulatedSource(self.settings.get('sample_rate_hz'))
+        self.source = None
+        self.set_source(self.simulated_source)
 
         # Medications Data
         self.medications = {
@@ -383,18 +361,7 @@ class MainWindow(QMainWindow):
         }
 
         # Add default protocol
-        self.protocol_manager.add_protocol(
-            protocol_id=1,
-            name="Default Protocol",
-            seizure_duration_threshold=2,  # Seizure must last for 2 minutes
-            steps=[
-                {"duration": 1, "dose_mg": 5, "medication": "Levetiracetam (Keppra)"},    # First 1 minute
-                {"duration": 1, "dose_mg": 2.5, "medication": "Phenytoin (Dilantin)"},  # Next 1 minute
-                {"duration": 1, "dose_mg": 1, "medication": "Valproate (Depakote)"},    # Next 1 minute
-                {"duration": 1, "dose_mg": 0.5, "medication": "Lacosamide (Vimpat)"}   # Final 1 minute
-            ],
-            total_duration=4  # Total duration of the protocol: 4 minutes
-        )
+        self.protocol_manager.add_protocol(**DEFAULT_PROTOCOL)
 
         central_widget = QWidget()
         self.setCentralWidget(central_widget)
@@ -421,14 +388,54 @@ class MainWindow(QMainWindow):
         self.timer.timeout.connect(self.update_eeg_plot)
 
         # Initialize medication logs
-        self.medication_logs = []
+        self.medication_logs = deque(maxlen=MEDICATION_LOG_MAX_ENTRIES)
+
+        # Performance overlay (F12) and the gauges it shows
+        profiler.add_gauge('sample_ring', lambda: len(self.sample_ring))
+        profiler.add_gauge('eeg_data', lambda: len(self.eeg_data))
+        profiler.add_gauge('medication_logs', lambda: len(self.medication_logs))
+        profiler.add_gauge('worker_jobs', lambda: self.worker_pool.jobs)  # Queued and running
+        profiler.add_gauge('journal_unsynced', lambda: sum(self.journal.unsynced.values()))
+        profiler.add_gauge('journal_queue', lambda: self.journal.queued())
+
+        # Trace each automatic response from EEG onset to the first dose against a latency budget
+        self.active_trace = None
+        tracer.set_budget('end_to_end', self.settings.get('latency_budget_ms') / 1000)
+        tracer.budget_exceeded.connect(self.on_latency_budget_exceeded)
+        self.performance_overlay = PerformanceOverlay(self)
+        overlay_shortcut = QShortcut(QKeySequence("F12"), self)
+        overlay_shortcut.activated.connect(
+            lambda: self.settings.set('performance_overlay', not self.settings.get('performance_overlay')))
+        self.apply_setting('performance_overlay', self.settings.get('performance_overlay'))
+
+        self.ai_model_updated.connect(self.on_ai_model_updated)
+        # Reports are built in a separate process, started on first use
+        self.report_pool = None
+        self.report_finished.connect(self.on_report_finished)
+        self.save_finished.connect(self.on_save_finished)
+        self.apply_setting('export_port', self.settings.get('export_port'))
+
+        # Restore auto mode from the previous session
+        if self.settings.get('auto_mode'):
+            self.auto_button.setChecked(True)
+            self.toggle_auto_mode()
+
+        # Running protocols and recordings are checkpointed, so a crash or restart picks them up again
+        self.checkpoint = StateCheckpoint()
+        self.protocol_manager.protocol_resumed.connect(self.on_protocol_resumed)
+        self.protocol_manager.doses_missed.connect(self.on_doses_missed)
+        self.protocol_manager.run_state_changed.connect(lambda: self.save_checkpoint(sync=True))
+        self.resume_from_checkpoint()
+        self.checkpoint_timer = QTimer()
+        self.checkpoint_timer.timeout.connect(self.save_checkpoint)
+        self.checkpoint_timer.start(CHECKPOINT_INTERVAL_MS)
 
     def create_top_bar(self):
         top_bar_layout = QHBoxLayout()
         top_bar_layout.setAlignment(Qt.AlignLeft)  # Align buttons to the left
 
         # Adding buttons for top bar
-        buttons = ["Home", "Patient Data", "Seizure Stats", "Logs", "Settings"]
+        buttons = ["Home", "Patient Data", "Seizure Stats", "Logs", "Settings", "Ward"]
         for btn in buttons:
             button = QPushButton(btn)
             button.setFixedSize(100, 30)  # Set fixed size for buttons
@@ -456,6 +463,8 @@ class MainWindow(QMainWindow):
                 button.clicked.connect(lambda: self.tabs.setCurrentIndex(self.tabs.indexOf(self.logs_tab)))
             elif btn == "Settings":
                 button.clicked.connect(lambda: self.tabs.setCurrentIndex(self.tabs.indexOf(self.settings_tab)))
+            elif btn == "Ward":
+                button.clicked.connect(self.show_ward_dashboard)
             top_bar_layout.addWidget(button)
 
         # Add "Auto" button
@@ -514,6 +523,9 @@ class MainWindow(QMainWindow):
         stop_eeg_button = QPushButton("Stop EEG")
         save_eeg_button = QPushButton("Save EEG Data")
         record_button = QPushButton("Record")  # Added Record button
+        replay_button = QPushButton("Replay Recording")
+        connect_device_button = QPushButton("Connect Device")
+        attach_daemon_button = QPushButton("Attach to Daemon")
 
         # Style buttons
         start_eeg_button.setStyleSheet("""
@@ -572,17 +584,68 @@ class MainWindow(QMainWindow):
             }
         """)
 
+        replay_button.setStyleSheet("""
+            QPushButton {
+                background-color: #9b59b6;
+                color: white;
+                font-size: 16px;
+                padding: 10px;
+                border-radius: 8px;
+                border: 1px solid #9b59b6;
+            }
+            QPushButton:hover {
+                background-color: #8e44ad;
+                color: white;
+            }
+        """)
+
+        connect_device_button.setStyleSheet("""
+            QPushButton {
+                background-color: #16a085;
+                color: white;
+                font-size: 16px;
+                padding: 10px;
+                border-radius: 8px;
+                border: 1px solid #16a085;
+            }
+            QPushButton:hover {
+                background-color: #138d75;
+                color: white;
+            }
+        """)
+
+        attach_daemon_button.setStyleSheet("""
+            QPushButton {
+                background-color: #2980b9;
+                color: white;
+                font-size: 16px;
+                padding: 10px;
+                border-radius: 8px;
+                border: 1px solid #2980b9;
+            }
+            QPushButton:hover {
+                background-color: #2471a3;
+                color: white;
+            }
+        """)
+
         start_eeg_button.clicked.connect(self.start_eeg)
         stop_eeg_button.clicked.connect(self.stop_eeg)
         save_eeg_button.clicked.connect(self.save_eeg_data)
         record_button.setCheckable(True)
         record_button.clicked.connect(self.toggle_recording)
         self.record_button = record_button  # Keep a reference to change text
+        replay_button.clicked.connect(self.replay_recording)
+        connect_device_button.clicked.connect(self.connect_serial_device)
+        attach_daemon_button.clicked.connect(self.attach_to_daemon)
 
+        button_layout.addWidget(connect_device_button)
+        button_layout.addWidget(attach_daemon_button)
         button_layout.addWidget(start_eeg_button)
         button_layout.addWidget(stop_eeg_button)
         button_layout.addWidget(save_eeg_button)
         button_layout.addWidget(record_button)
+        button_layout.addWidget(replay_button)
 
         # EEG Graph (using pyqtgraph)
         self.eeg_plot_widget = pg.PlotWidget()
@@ -590,8 +653,12 @@ class MainWindow(QMainWindow):
         self.eeg_plot_widget.showGrid(x=True, y=True)
         self.eeg_plot = self.eeg_plot_widget.plot(pen=pg.mkPen(color=(0, 255, 0), width=2))
 
+        # Worst channel's signal quality index and the artifacts found in the latest epoch
+        self.signal_quality_label = QLabel("Signal quality: -")
+
         eeg_layout.addLayout(button_layout)
         eeg_layout.addWidget(self.eeg_plot_widget)
+        eeg_layout.addWidget(self.signal_quality_label)
 
         eeg_widget.setLayout(eeg_layout)
         splitter.addWidget(eeg_widget)
@@ -662,8 +729,11 @@ class MainWindow(QMainWindow):
 
         save_patient_data_button = QPushButton("Save Patient Data")
         save_patient_data_button.clicked.connect(self.save_patient_data)
+        generate_report_button = QPushButton("Generate Report")
+        generate_report_button.clicked.connect(self.generate_report)
         patient_data_layout.addLayout(patient_form_layout)
         patient_data_layout.addWidget(save_patient_data_button)
+        patient_data_layout.addWidget(generate_report_button)
         patient_data_tab.setLayout(patient_data_layout)
         tabs.addTab(patient_data_tab, "Patient Data")
         self.patient_data_tab = patient_data_tab  # Store reference
@@ -712,6 +782,39 @@ class MainWindow(QMainWindow):
         seizure_stats_layout.addWidget(mark_seizure_button)
         seizure_stats_layout.addWidget(stop_seizure_button)
 
+        # Precomputed statistics for the selected patient
+        stats_patient_layout = QHBoxLayout()
+        stats_patient_layout.addWidget(QLabel("Patient:"))
+        self.stats_patient_combo = QComboBox()
+        self.stats_patient_combo.currentIndexChanged.connect(self.refresh_seizure_stats)
+        stats_patient_layout.addWidget(self.stats_patient_combo, 1)
+        seizure_stats_layout.addLayout(stats_patient_layout)
+
+        stats_form = QFormLayout()
+        self.stats_labels = {}
+        for key, title in (('episodes', "Episodes:"), ('duration', "Duration (mean / max):"),
+                           ('inter_ictal', "Inter-ictal interval (mean / min):"), ('last', "Last episode ended:")):
+            self.stats_labels[key] = QLabel("-")
+            stats_form.addRow(title, self.stats_labels[key])
+        seizure_stats_layout.addLayout(stats_form)
+
+        # Episode onsets by hour of day
+        self.hour_histogram_plot = pg.PlotWidget()
+        self.hour_histogram_plot.setTitle("Episode Onsets by Hour of Day")
+        self.hour_histogram_plot.setLabel('bottom', 'Hour')
+        self.hour_histogram_plot.setMouseEnabled(x=False, y=False)
+        self.hour_histogram_bars = pg.BarGraphItem(x=np.arange(24), height=np.zeros(24), width=0.8, brush='#e74c3c')
+        self.hour_histogram_plot.addItem(self.hour_histogram_bars)
+        seizure_stats_layout.addWidget(self.hour_histogram_plot)
+
+        # Dose response per medication
+        self.dose_response_table = QTableWidget(0, 5)
+        self.dose_response_table.setHorizontalHeaderLabels(
+            ["Medication", "Doses (total mg)", "During Episode", "Ended Within 10 min", "Mean Time to End"])
+        self.dose_response_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.dose_response_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        seizure_stats_layout.addWidget(self.dose_response_table)
+
         seizure_stats_tab.setLayout(seizure_stats_layout)
         tabs.addTab(seizure_stats_tab, "Seizure Stats")
         self.seizure_stats_tab = seizure_stats_tab  # Store reference
@@ -749,6 +852,7 @@ class MainWindow(QMainWindow):
         logs_layout.addWidget(QLabel("Medication Administration Log:"))
         self.logs_text_edit = QTextEdit()
         self.logs_text_edit.setReadOnly(True)
+        self.logs_text_edit.document().setMaximumBlockCount(LOG_MAX_LINES)  # Oldest lines are dropped
         logs_layout.addWidget(self.logs_text_edit)
         logs_tab.setLayout(logs_layout)
         tabs.addTab(logs_tab, "Logs")
@@ -769,20 +873,42 @@ class MainWindow(QMainWindow):
         settings_tab = QWidget()
         settings_layout = QVBoxLayout()
 
-        # Example settings
-        auto_mode_checkbox = QCheckBox("Enable Auto Mode")
-        auto_mode_checkbox.setChecked(self.auto_mode)
-        auto_mode_checkbox.stateChanged.connect(self.toggle_auto_mode_from_settings)
-
-        seizure_detection_interval_input = QSpinBox()
-        seizure_detection_interval_input.setRange(1, 60)
-        seizure_detection_interval_input.setValue(1)
-        seizure_detection_interval_input.setSuffix(" sec")
-        seizure_detection_interval_input.valueChanged.connect(self.set_seizure_detection_interval)
-
-        settings_layout.addWidget(auto_mode_checkbox)
-        settings_layout.addWidget(QLabel("Seizure Detection Interval:"))
-        settings_layout.addWidget(seizure_detection_interval_input)
+        # One input per persisted setting; changes are applied immediately
+        settings_form_layout = QFormLayout()
+        self.settings_inputs = {}
+        for key, (value_type, _, minimum, maximum, label) in SETTINGS_SPEC.items():
+            value = self.settings.get(key)
+            if key == 'auto_mode':
+                setting_input = QCheckBox(label)
+                setting_input.setChecked(value)
+                setting_input.stateChanged.connect(self.toggle_auto_mode_from_settings)
+                settings_form_layout.addRow(setting_input)
+            elif value_type is bool:
+                setting_input = QCheckBox(label)
+                setting_input.setChecked(value)
+                setting_input.stateChanged.connect(lambda state, key=key: self.settings.set(key, state == Qt.Checked))
+                settings_form_layout.addRow(setting_input)
+            elif value_type is str:
+                setting_input = QComboBox()
+                setting_input.addItems(minimum)
+                setting_input.setCurrentText(value)
+                setting_input.currentTextChanged.connect(lambda text, key=key: self.settings.set(key, text))
+                settings_form_layout.addRow(f"{label}:", setting_input)
+            else:
+                if value_type is float:
+                    setting_input = QDoubleSpinBox()
+                    setting_input.setDecimals(1)
+                else:
+                    setting_input = QSpinBox()
+                setting_input.setKeyboardTracking(False)  # Apply typed numbers once, not on every keystroke
+                setting_input.setRange(minimum, maximum)
+                setting_input.setValue(value)
+                setting_input.valueChanged.connect(lambda number, key=key: self.settings.set(key, number))
+                settings_form_layout.addRow(f"{label}:", setting_input)
+            self.settings_inputs[key] = setting_input
+
+        settings_layout.addLayout(settings_form_layout)
+        settings_layout.addStretch(1)
 
         settings_tab.setLayout(settings_layout)
         tabs.addTab(settings_tab, "Settings")
@@ -791,13 +917,15 @@ class MainWindow(QMainWindow):
         return tabs
 
     def start_eeg(self):
-        self.timer.start(100)  # Update every 100 ms
+        self.source.start()
+        self.timer.start(1000 // self.settings.get('render_fps'))  # Update every 100 ms by default
         print("EEG started")
         # Record the start time
         self.eeg_start_time = datetime.datetime.now()
-        self.eeg_data = []  # Clear previous EEG data
+        self.eeg_data.clear()  # Clear previous EEG data
 
     def stop_eeg(self):
+        self.source.stop()
         self.timer.stop()  # Stop updating
         print("EEG stopped")
         # Record the stop time
@@ -805,15 +933,65 @@ class MainWindow(QMainWindow):
 
     def save_eeg_data(self):
         # Logic to save EEG data
-        if not self.eeg_data:
+        recording = self.recording_file or self.last_recording_file
+        # Archived into the patient's archive after saving when enabled; empty for no archive
+        patient_id = (self.patient_id_input.text() or "unknown") if self.settings.get('archive_on_save') else ""
+        if recording is not None and os.path.exists(recording):
+            # eeg_data only holds the recent samples; the streamed recording has the whole session.
+            # Copying it can take a while, so it runs on the worker pool with the archive step
+            filename = f"EEG_Data_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}_saved.jsonl"
+            self.worker_pool.submit(self.store_eeg_data, filename, patient_id, recording)
+        elif self.eeg_data:
+            filename = f"EEG_Data_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+            self.write_eeg_data(filename)
+            self.worker_pool.submit(self.store_eeg_data, filename, patient_id)
+        else:
             QMessageBox.warning(self, "Save EEG Data", "No EEG data to save.")
+
+    def store_eeg_data(self, filename, patient_id, recording=None):
+        # Runs on the worker pool; the signal hands the result to the GUI thread
+        if recording is not None:
+            try:
+                self.journal.flush()  # The copy must hold every block queued for the recording
+                shutil.copyfile(recording, filename)
+            except Exception as e:
+                self.save_finished.emit("", patient_id, str(e))
+                return
+        if patient_id:
+            try:
+                entry = self.archive.archive_session(filename, patient_id)
+                self.database.add_session(patient_id, entry)
+                self.archive.enforce_retention(self.settings.get('archive_max_age_days'),
+                                               self.settings.get('archive_quota_mb'))
+            except Exception as e:
+                self.save_finished.emit(filename, patient_id, str(e))
+                return
+        self.save_finished.emit(filename, patient_id, "")
+
+    def on_save_finished(self, filename, patient_id, error):
+        timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        if not filename:
+            self.append_log(f"{timestamp}: EEG data could not be saved: {error}")
+            QMessageBox.warning(self, "Save EEG Data", f"EEG data could not be saved: {error}")
             return
-        filename = f"EEG_Data_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-        with open(filename, 'w') as f:
-            json.dump(self.eeg_data, f)
         print(f"EEG data saved to {filename}")
+        if error:
+            self.append_log(f"{timestamp}: Could not archive {filename}: {error}")
+            QMessageBox.warning(self, "Save EEG Data",
+                                f"EEG data has been saved to {filename}, but could not be archived: {error}")
+            return
+        if patient_id:
+            self.append_log(f"{timestamp}: {filename} archived for patient {patient_id}.")
+            QMessageBox.information(self, "Save EEG Data",
+                                    f"EEG data has been saved to {filename} and archived for patient {patient_id}.")
+            return
         QMessageBox.information(self, "Save EEG Data", f"EEG data has been saved to {filename}.")
 
+    @timed_stage('save_eeg_data')
+    def write_eeg_data(self, filename):
+        with open(filename, 'w') as f:
+            json.dump(list(self.eeg_data), f)
+
     def save_patient_data(self):
         # Logic to save patient data
         patient_data = {
@@ -827,9 +1005,15 @@ class MainWindow(QMainWindow):
         filename = f"Patient_Data_{patient_data['id']}.json"
         with open(filename, 'w') as f:
             json.dump(patient_data, f)
+        self.database.upsert_patient(patient_data['id'], patient_data['name'], patient_data['age'])
         print(f"Patient data saved to {filename}")
         QMessageBox.information(self, "Save Patient Data", f"Patient data has been saved to {filename}.")
 
+    def record_event(self, filename, event):
+        # Tag every journalled event with the current patient so it can be found per patient
+        event['patient_id'] = self.patient_id_input.text() or None
+        self.journal.append(filename, event)
+
     def manually_mark_seizure(self):
         # Logic to manually mark a seizure episode start
         if self.seizure_active:
@@ -841,9 +1025,7 @@ class MainWindow(QMainWindow):
             'timestamp': timestamp,
             'event': 'Seizure Start'
         }
-        if self.is_recording:
-            with open('seizure_events.json', 'a') as f:
-                f.write(json.dumps(event) + '\n')
+        self.record_event('seizure_events.json', event)
         print(f"Seizure episode started at {timestamp}")
         # Optional: Update UI to reflect seizure is active
 
@@ -858,74 +1040,306 @@ class MainWindow(QMainWindow):
             'timestamp': timestamp,
             'event': 'Seizure Stop'
         }
-        if self.is_recording:
-            with open('seizure_events.json', 'a') as f:
-                f.write(json.dumps(event) + '\n')
+        self.record_event('seizure_events.json', event)
         print(f"Seizure episode stopped at {timestamp}")
         # Optional: Update UI to reflect seizure has ended
 
     def update_ai_model(self):
         # Logic to send data to backend AI model for training
-        # This can be implemented as a separate thread to avoid freezing the UI
-        threading.Thread(target=self.train_ai_model).start()
+        # Runs on the I/O loop so the UI never freezes; the result comes back as a signal
+        future = self.io_loop.submit(self.train_ai_model())
+        future.add_done_callback(lambda _: self.ai_model_updated.emit())
 
-    def train_ai_model(self):
+    async def train_ai_model(self):
         print("AI model training started with new data...")
         # Simulate training process
-        import time
-        time.sleep(5)  # Simulate time-consuming training
+        await asyncio.sleep(5)  # Simulate time-consuming training
         print("AI model updated with new data")
+
+    def on_ai_model_updated(self):
+        # Widgets may only be touched from the GUI thread
         QMessageBox.information(self, "AI Model Update", "AI model has been updated with new data.")
 
+    def set_source(self, source):
+        # Route a sample source into the acquisition path
+        if self.source is not None:
+            self.source.stop()
+            self.source.samples_ready.disconnect(self.ingest_samples)
+        self.source = source
+        self.source.samples_ready.connect(self.ingest_samples)
+        self.seizure_detector.reset()
+        self.protocol_selector.reset()  # An episode does not carry over to another source
+        self.protocol_manager.set_clock(None)  # Wall time, until a replay hands over its clock
+        self.update_local_detection()
+        self.filter_stage.configure()  # Filter state from the previous source would ring into the new one
+        self.artifact_detector.reset()
+
+    @timed_stage('ingest')
+    def ingest_samples(self, timestamps, frames):
+        # Common acquisition path for simulated, serial and replayed samples
+        frames = np.asarray(frames, dtype=float).reshape(len(timestamps), -1)
+        # Recordings keep the raw samples; the plot and the detector get the filtered stream
+        raw_frames = frames
+        if not self.source.remote:  # A daemon's beds are filtered in the daemon
+            frames = self.filter_stage.process(frames)
+        if frames.shape[1] != self.sample_ring.channel_count:
+            self.resize_sample_ring(frames.shape[1])
+        with self.sample_ring_lock:
+            self.sample_ring.write(timestamps, frames)
+        if self.is_recording:  # Never for a daemon's bed; the daemon records it
+            entries = recording_entries(timestamps, raw_frames)
+            self.eeg_data.extend(entries)
+            # Streamed to disk as recorded, so a crash loses at most the journal's unsynced tail
+            self.journal.append_batch(self.recording_file, entries)
+            self.recorded_samples += len(entries)
+        if not self.source.remote:
+            # Samples reach the detector one artifact epoch late, with contaminated channels masked
+            timestamps, frames, mask = self.artifact_detector.process(timestamps, raw_frames, frames)
+            self.seizure_detector.push_samples(timestamps, frames, self.filter_stage.montage_mask(mask))
+
+    @timed_stage('plot')
     def update_eeg_plot(self):
-        # Simulating data acquisition from the serial port
-        import random
-        value = random.uniform(-1, 1)  # Simulate EEG data
-        timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')
-        self.data_buffer.append(value)
+        # Update the EEG plot (up to the last plot_window_points points)
+        _, frames = self.sample_ring.latest(self.settings.get('plot_window_points'))
+        self.eeg_plot.setData(frames[:, 0])
+        if not self.source.remote:
+            self.signal_quality_label.setText(self.artifact_detector.quality_summary())
+
+    def generate_report(self):
+        path, _ = QFileDialog.getOpenFileName(self, "Generate Report", self.recording_file or "",
+                                              "EEG Recordings (*.json *.jsonl)")
+        if not path:
+            return
+        if self.report_pool is None:
+            # Spawned rather than forked, so the worker does not inherit this process's Qt state
+            self.report_pool = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn'))
+        patient = {
+            'name': self.patient_name_input.text(),
+            'age': self.patient_age_input.text(),
+            'id': self.patient_id_input.text()
+        }
+        self.journal.flush()  # The worker reads the journals from disk
+        future = self.report_pool.submit(build_report, path, report_filename(path), patient,
+                                         pdf=self.settings.get('report_pdf'))
+        future.add_done_callback(self.on_report_done)
+        timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        self.append_log(f"{timestamp}: Building report for {os.path.basename(path)}.")
+
+    def on_report_done(self, future):
+        # Runs on a pool thread; the signal hands the result to the GUI thread
+        try:
+            self.report_finished.emit(future.result(), "")
+        except Exception as e:
+            self.report_finished.emit([], str(e))
+
+    def on_report_finished(self, paths, error):
+        timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        if error:
+            self.append_log(f"{timestamp}: Report failed: {error}")
+            QMessageBox.warning(self, "Generate Report", f"The report could not be built: {error}")
+            return
+        self.append_log(f"{timestamp}: Report saved to {', '.join(paths)}.")
+        QMessageBox.information(self, "Generate Report", "Report saved to " + " and ".join(paths) + ".")
+
+    def replay_recording(self):
+        # Feed a saved recording through the acquisition path
+        path, _ = QFileDialog.getOpenFileName(self, "Replay Recording", "", "EEG Recordings (*.json *.jsonl)")
+        if not path:
+            return
+        speeds = ["1x", "2x", "10x", "60x", "Maximum"]
+        speed_text, ok = QInputDialog.getItem(self, "Replay Recording", "Replay speed:", speeds, 0, False)
+        if not ok:
+            return
+        speed = 0 if speed_text == "Maximum" else float(speed_text[:-1])
+        try:
+            replay_source = ReplaySource(path, speed=speed)
+        except (OSError, ValueError, KeyError) as e:
+            QMessageBox.warning(self, "Replay Recording", f"Could not load recording:\n{e}")
+            return
+        replay_source.annotation_reached.connect(self.on_replay_annotation)
+        replay_source.finished.connect(self.on_replay_finished)
+        self.stop_eeg()
+        self.set_source(replay_source)
+        self.start_eeg()
+        # Doses and episode gaps follow replayed sample time, at any replay speed
+        self.protocol_manager.set_clock(replay_source.clock)
+
+    def connect_serial_device(self):
+        # Read EEG frames from a serial device, a pseudo-terminal or the built-in emulator
+        ports = [port.device for port in serial.tools.list_ports.comports()]
+        choices = ["Built-in Emulator"] + ports
+        port, ok = QInputDialog.getItem(self, "Connect Device", "Serial port or device path:", choices, 0, True)
+        if not ok or not port:
+            return
+        if port == "Built-in Emulator":
+            if self.emulator is None:
+                from emulator import SerialEmulator  # Needs POSIX pseudo-terminals
+                self.emulator = SerialEmulator(self.settings.get('sample_rate_hz'))
+                self.emulator.start()
+            port = self.emulator.port
+        serial_source = AsyncSerialSource(self.io_loop, port, self.settings.get('sample_rate_hz'))
+        serial_source.finished.connect(self.on_serial_disconnected)
+        self.stop_eeg()
+        self.set_source(serial_source)
+        try:
+            self.start_eeg()
+        except serial.SerialException as e:
+            QMessageBox.warning(self, "Connect Device", f"Could not open {port}:\n{e}")
+            self.set_source(self.simulated_source)
+            return
+        self.serial_port = serial_source.serial_port
+
+    def on_serial_disconnected(self):
+        self.stop_eeg()
+        self.set_source(self.simulated_source)
+        self.serial_port = None
+        QMessageBox.warning(self, "Connect Device", "The serial device was disconnected.")
+
+    def attach_to_daemon(self):
+        # View a bed monitored by the headless daemon; the daemon keeps detecting and dosing without us
+        client = DaemonClient()
+        try:
+            sessions = client.connect_to_daemon()
+        except ConnectionError as e:
+            QMessageBox.warning(self, "Attach to Daemon", f"Could not reach the daemon:\n{e}")
+            return
+        if not sessions:
+            QMessageBox.warning(self, "Attach to Daemon", "The daemon is not monitoring any beds.")
+            client.disconnect_from_daemon()
+            return
+        choices = [f"{session['patient_name']} ({session['patient_id']}) - {session['session_id']}" for session in sessions]
+        choice, ok = QInputDialog.getItem(self, "Attach to Daemon", "Bed:", choices, 0, False)
+        if not ok:
+            client.disconnect_from_daemon()
+            return
+        session_id = sessions[choices.index(choice)]['session_id']
+        self.detach_from_daemon()
+        self.daemon_client = client
+        client.log_received.connect(lambda _, log_entry: self.append_log(log_entry))
+        client.status_received.connect(
+            lambda session: self.seizure_detected_label.setVisible(session['seizure_active']))
+        # Artifacts are screened in the daemon; its status updates carry the bed's signal quality
+        client.status_received.connect(
+            lambda session: session['session_id'] == session_id
+            and self.signal_quality_label.setText(session.get('signal_quality', "Signal quality: -")))
+        daemon_source = DaemonSource(client, session_id)
+        daemon_source.finished.connect(self.on_daemon_detached)
         if self.is_recording:
-            self.eeg_data.append({'timestamp': timestamp, 'value': value})
+            self.toggle_recording()  # The daemon records its own beds
+        self.stop_eeg()
+        self.set_source(daemon_source)
+        self.start_eeg()
+        client.status_received.connect(lambda session: self.update_record_button())
+        self.update_record_button()
+
+    def detach_from_daemon(self):
+        if self.daemon_client is None:
+            return
+        if self.source.remote:
+            self.source.finished.disconnect(self.on_daemon_detached)
+        self.daemon_client.disconnect_from_daemon()
+        self.daemon_client = None
+
+    def on_daemon_detached(self):
+        self.stop_eeg()
+        self.set_source(self.simulated_source)
+        self.daemon_client = None
+        self.update_record_button()
+        self.seizure_detected_label.setVisible(False)
+        QMessageBox.warning(self, "Attach to Daemon", "The connection to the daemon was closed.")
 
-        # Update the EEG plot (up to the last 100 points)
-        self.eeg_plot.setData(self.data_buffer[-100:])
+    def on_replay_annotation(self, event):
+        log_entry = f"{event['timestamp']}: Replayed event '{event.get('event', 'Unknown')}'."
+        self.append_log(log_entry)
 
+    def on_replay_finished(self):
+        self.stop_eeg()
+        self.set_source(self.simulated_source)
+
+    @timed_stage('seizure_handler')
     def on_seizure_detected(self):
         if not self.auto_mode:
             print("Seizure detected, but auto mode is off. No action taken.")
             return
+        if self.source.remote:
+            return  # The daemon treats this bed
+        # Repeated detections of the same episode only extend it
+        if not self.protocol_selector.on_detection(self.seizure_detector.detection_time,
+                                                   self.seizure_detector.onset_time):
+            return
         print("Seizure detected!")
+        trace_id = self.active_trace = tracer.begin('seizure', self.seizure_detector.onset_time,
+                                                    source=type(self.source).__name__)
         self.seizure_detected_label.setVisible(True)  # Show the seizure detected indicator
-        # Start the protocol (for now, we can hardcode protocol_id=1)
-        self.protocol_manager.start_protocol(1)
-        # Record the seizure event if recording
-        if self.is_recording:
-            timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            event = {
-                'timestamp': timestamp,
-                'event': 'Seizure Detected'
-            }
-            with open('seizure_events.json', 'a') as f:
-                f.write(json.dumps(event) + '\n')
+        # Record the seizure event
+        timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        event = {
+            'timestamp': timestamp,
+            'event': 'Seizure Detected',
+            'trace_id': trace_id
+        }
+        self.record_event('seizure_events.json', event)
+
+    def on_protocol_selected(self, protocol_id, threshold_time):
+        # The episode has lasted long enough for this protocol; a longer one escalates further
+        if not self.auto_mode:
+            return
+        protocol = self.protocol_manager.protocols[protocol_id]
+        if self.active_trace is not None:
+            # Waiting for the threshold is the protocol's choice, not handling latency
+            tracer.mark(self.active_trace, 'protocol', wait=True)
+        timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        self.append_log(f"{timestamp}: Seizure has lasted {protocol['seizure_duration_threshold']} min; "
+                        f"selecting protocol '{protocol['name']}'.")
+        self.protocol_manager.start_protocol(protocol_id)
+
+    def on_seizure_episode_ended(self, start, end):
+        self.seizure_detected_label.setVisible(False)
+        if self.active_trace is not None and self.protocol_manager.current_protocol is None:
+            tracer.discard(self.active_trace)  # The episode ended before any protocol started
+            self.active_trace = None
+        timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        # Journalled once no detection has followed for the episode gap; duration_s is onset to last detection
+        event = {
+            'timestamp': timestamp,
+            'event': 'Seizure Ended',
+            'duration_s': end - start
+        }
+        self.record_event('seizure_events.json', event)
+        self.append_log(f"{timestamp}: Seizure episode ended after {format_duration(end - start)}.")
 
+    @timed_stage('dose_handler')
     def on_dose_to_administer(self, dose_mg, medication):
         # No notification displayed
         # Update logs
         timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         log_entry = f"{timestamp}: Administered {dose_mg} mg of {medication}."
-        self.logs_text_edit.append(log_entry)
+        self.append_log(log_entry)
         self.medication_logs.append(log_entry)  # Add this line
-        # Record the medication event if recording
-        if self.is_recording:
-            event = {
-                'timestamp': timestamp,
-                'dose_mg': dose_mg,
-                'medication': medication,
-                'protocol': self.protocol_manager.current_protocol['name'] if self.protocol_manager.current_protocol else 'Manual'
-            }
-            with open('medication_log.json', 'a') as f:
-                f.write(json.dumps(event) + '\n')
-            print(f"Recorded medication event: {event}")
+        self.dose_ledger.record(self.patient_id_input.text(), medication, dose_mg)
+        # The first dose after a detection completes its trace
+        trace_id = self.active_trace
+        if trace_id is not None:
+            tracer.mark(trace_id, 'dose')
+            tracer.end(trace_id)
+            self.active_trace = None
+        # Every dose is journalled, recording or not: the dose ledger is rebuilt from the journal on restart
+        event = {
+            'timestamp': timestamp,
+            'dose_mg': dose_mg,
+            'medication': medication,
+            'protocol': self.protocol_manager.current_protocol['name'] if self.protocol_manager.current_protocol else 'Manual'
+        }
+        if trace_id is not None:
+            event['trace_id'] = trace_id
+        self.record_event('medication_log.json', event)
+        print(f"Recorded medication event: {event}")
+
+    def on_dose_withheld(self, dose_mg, medication, reason):
+        timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        self.append_log(f"{timestamp}: Withheld {dose_mg} mg of {medication} from the protocol: {reason}.")
 
+    @timed_stage('dosage_schedule')
     def update_dosage_schedule(self, schedule):
         # Clear the scroll area and update with new schedule
         for i in reversed(range(self.scroll_layout.count())):
@@ -960,6 +1374,10 @@ class MainWindow(QMainWindow):
 
             self.scroll_layout.addWidget(frame)
 
+    @timed_stage('log_append')
+    def append_log(self, log_entry):
+        self.logs_text_edit.append(log_entry)
+
     def on_protocol_started(self, protocol_name):
         print(f"Protocol {protocol_name} started.")
         # Record the protocol start time
@@ -967,7 +1385,7 @@ class MainWindow(QMainWindow):
         # Update logs
         timestamp = self.protocol_start_time.strftime('%Y-%m-%d %H:%M:%S')
         log_entry = f"{timestamp}: Protocol '{protocol_name}' started."
-        self.logs_text_edit.append(log_entry)
+        self.append_log(log_entry)
 
     def on_protocol_completed(self, protocol_name):
         print(f"Protocol {protocol_name} completed.")
@@ -976,7 +1394,15 @@ class MainWindow(QMainWindow):
         # Record the protocol completion
         timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         log_entry = f"{timestamp}: Protocol '{protocol_name}' completed."
-        self.logs_text_edit.append(log_entry)
+        self.append_log(log_entry)
+
+    def on_latency_budget_exceeded(self, trace, span, seconds):
+        timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        budget = tracer.budgets[span]
+        log_entry = (f"{timestamp}: Latency budget exceeded: {span} took {seconds * 1000:.0f} ms "
+                     f"(budget {budget * 1000:.0f} ms, trace {trace['id']}).")
+        print(log_entry)
+        self.append_log(log_entry)
 
     def update_protocol_list(self):
         self.protocol_list_widget.clear()
@@ -1053,72 +1479,337 @@ class MainWindow(QMainWindow):
         if dialog.exec_() == QDialog.Accepted:
             dose_mg = dialog.dose_input.value()
             medication = dialog.medication_input.currentText()
-            # Update logs
             timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            # A clinician may override a dose limit; the override is logged and journalled
+            reason = self.dose_ledger.check(self.patient_id_input.text(), medication, dose_mg)
+            if reason:
+                answer = QMessageBox.question(self, "Dose Limit", f"{reason}.\n\nDispense anyway?",
+                                              QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
+                if answer != QMessageBox.Yes:
+                    self.append_log(f"{timestamp}: Manual dose of {dose_mg} mg of {medication} not given: {reason}.")
+                    return
+            # Update logs
             log_entry = f"{timestamp}: Manually dispensed {dose_mg} mg of {medication}."
-            self.logs_text_edit.append(log_entry)
+            if reason:
+                log_entry += f" Dose limit overridden: {reason}."
+            self.append_log(log_entry)
             self.medication_logs.append(log_entry)  # Add this line
-            # Record the medication event if recording
-            if self.is_recording:
-                event = {
-                    'timestamp': timestamp,
-                    'dose_mg': dose_mg,
-                    'medication': medication,
-                    'protocol': 'Manual'
-                }
-                with open('medication_log.json', 'a') as f:
-                    f.write(json.dumps(event) + '\n')
-                print(f"Recorded medication event: {event}")
+            self.dose_ledger.record(self.patient_id_input.text(), medication, dose_mg)
+            # Record the medication event, and any limit override, recording or not
+            event = {
+                'timestamp': timestamp,
+                'dose_mg': dose_mg,
+                'medication': medication,
+                'protocol': 'Manual'
+            }
+            if reason:
+                event['limit_override'] = reason
+            self.record_event('medication_log.json', event)
+            print(f"Recorded medication event: {event}")
             # No notification displayed
 
     def toggle_recording(self):
+        if self.source.remote:
+            # The daemon records its beds, so closing or crashing this window never ends the recording
+            self.source.set_recording(self.source.recording is None)
+            self.update_record_button()
+            return
         if not self.is_recording:
             self.is_recording = True
+            self.recording_file = f"EEG_Data_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.jsonl"
+            self.recorded_samples = 0
             self.record_button.setText("Stop Recording")
-            print("Recording started.")
+            print(f"Recording started into {self.recording_file}.")
         else:
             self.is_recording = False
             self.record_button.setText("Record")
-            print("Recording stopped.")
+            print(f"Recording stopped; {self.recorded_samples} samples in {self.recording_file}.")
+            self.journal.close_file(self.recording_file)
+            self.last_recording_file = self.recording_file
+            self.recording_file = None
+        self.save_checkpoint(sync=True)
+
+    def update_record_button(self):
+        # Reflects the daemon's recording of the viewed bed, or this window's own recording
+        recording = self.source.recording is not None if self.source.remote else self.is_recording
+        self.record_button.setChecked(recording)
+        self.record_button.setText("Stop Recording" if recording else "Record")
+
+    def checkpoint_state(self):
+        return {
+            'patient_id': self.patient_id_input.text() or None,
+            'protocol': self.protocol_manager.run_state(),
+            'recording': {'file': self.recording_file, 'samples': self.recorded_samples} if self.is_recording else None,
+        }
+
+    def save_checkpoint(self, sync=False):
+        try:
+            self.checkpoint.write(self.checkpoint_state(), sync)
+        except (OSError, ValueError) as e:
+            print(f"Could not write checkpoint: {e}")
+
+    def resume_from_checkpoint(self):
+        state = self.checkpoint.read()
+        if not state:
+            return
+        timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        if state.get('patient_id') and not self.patient_id_input.text():
+            self.patient_id_input.setText(state['patient_id'])
+        recording = state.get('recording')
+        if recording:
+            # Samples are appended to the interrupted recording as soon as acquisition runs again
+            self.is_recording = True
+            self.recording_file = recording['file']
+            self.recorded_samples = recording['samples']
+            self.record_button.setText("Stop Recording")
+            self.append_log(f"{timestamp}: Recording resumed into {self.recording_file} "
+                            f"after {self.recorded_samples} samples.")
+        if state.get('protocol'):
+            self.protocol_manager.resume(state['protocol'])
+
+    def on_protocol_resumed(self, protocol_name):
+        timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        self.append_log(f"{timestamp}: Protocol '{protocol_name}' resumed after a restart.")
+
+    def on_doses_missed(self, missed):
+        lines = [f"{dose['dose_mg']} mg of {dose['medication']} due at "
+                 f"{datetime.datetime.fromtimestamp(dose['due']).strftime('%Y-%m-%d %H:%M:%S')}" for dose in missed]
+        timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        for line in lines:
+            self.append_log(f"{timestamp}: Missed dose while not running: {line}.")
+        # Shown once the window is up; missed doses are not given late automatically
+        QTimer.singleShot(0, lambda: QMessageBox.warning(
+            self, "Missed Doses", "These doses fell due while the monitor was not running:\n" + "\n".join(lines)))
 
     def toggle_auto_mode(self):
         self.auto_mode = self.auto_button.isChecked()
+        self.settings.set('auto_mode', self.auto_mode)
+        self.update_local_detection()
         if self.auto_mode:
-            self.seizure_detector.start_detection()
             print("Auto mode enabled.")
         else:
-            self.seizure_detector.stop_detection()
             print("Auto mode disabled.")
+            self.protocol_selector.end_episode()
             # Hide seizure detected label if visible
             self.seizure_detected_label.setVisible(False)
 
+    def update_local_detection(self):
+        # Detect locally in auto mode, except on a daemon's bed: the daemon detects and doses for it,
+        # and the local detector, given no samples, would fall back to simulated detections
+        if self.auto_mode and not self.source.remote:
+            if not self.seizure_detector.running:
+                self.seizure_detector.start_detection(self.settings.get('detector_interval_ms'))
+        elif self.seizure_detector.running:
+            self.seizure_detector.stop_detection()
+
     def toggle_auto_mode_from_settings(self, state):
         self.auto_mode = (state == Qt.Checked)
         self.auto_button.setChecked(self.auto_mode)
         self.toggle_auto_mode()
 
+    def buffer_capacity(self):
+        return buffer_capacity(self.settings.get('sample_rate_hz'), self.settings.get('buffer_retention_s'))
+
+    def resize_sample_ring(self, channel_count=None):
+        with self.sample_ring_lock:
+            ring = self.sample_ring.resized(self.buffer_capacity(), channel_count)
+            self.sample_ring.close()
+            self.sample_ring = ring
+
+    def apply_setting(self, key, value):
+        # Apply a changed setting without restarting acquisition
+        self.sync_setting_input(key, value)
+        if key in ('sample_rate_hz', 'buffer_retention_s'):
+            self.resize_sample_ring()
+            self.eeg_data = deque(self.eeg_data, maxlen=self.buffer_capacity())
+            self.filter_stage.configure(sample_rate_hz=self.settings.get('sample_rate_hz'))
+            self.artifact_detector.configure(self.settings.get('sample_rate_hz'))
+            self.simulated_source.set_sample_rate(self.settings.get('sample_rate_hz'))
+            if isinstance(self.source, SerialSource):
+                self.source.set_sample_rate(self.settings.get('sample_rate_hz'))
+            if self.session_manager is not None:
+                self.session_manager.set_sample_rate(self.settings.get('sample_rate_hz'))
+                self.session_manager.set_buffer_retention(self.settings.get('buffer_retention_s'))
+        elif key in ('notch_hz', 'highpass_hz', 'lowpass_hz', 'montage'):
+            self.filter_stage.configure(**filter_options(self.settings))
+            if self.session_manager is not None:
+                self.session_manager.set_filter_options(filter_options(self.settings))
+        elif key == 'render_fps':
+            if self.timer.isActive():
+                self.timer.setInterval(1000 // value)
+            if self.ward_dashboard is not None:
+                self.ward_dashboard.render_timer.setInterval(1000 // value)
+        elif key == 'detector_interval_ms':
+            self.set_seizure_detection_interval(value)
+            if self.session_manager is not None:
+                self.session_manager.set_detector_interval(value)
+        elif key == 'performance_overlay':
+            profiler.set_enabled(value)
+            self.performance_overlay.setVisible(value)
+        elif key == 'enforce_dose_limits':
+            self.dose_ledger.enabled = value
+        elif key == 'latency_budget_ms':
+            tracer.set_budget('end_to_end', value / 1000)
+        elif key == 'journal_fsync':
+            self.journal.set_fsync_policy(value)
+        elif key == 'export_port':
+            self.restart_export_server(value)
+        elif key == 'worker_threads':
+            # Running jobs finish on the old pool; new jobs go to the resized one
+            old_pool = self.worker_pool
+            self.worker_pool = CountingThreadPool(max_workers=value)
+            old_pool.shutdown(wait=False)
+            if self.session_manager is not None:
+                self.session_manager.worker_pool = self.worker_pool
+        print(f"Setting {key} set to {value}.")
+
+    def sync_setting_input(self, key, value):
+        # Keep the settings tab in sync with changes made elsewhere without re-triggering them
+        setting_input = self.settings_inputs[key]
+        setting_input.blockSignals(True)
+        if isinstance(setting_input, QCheckBox):
+            setting_input.setChecked(value)
+        elif isinstance(setting_input, QComboBox):
+            setting_input.setCurrentText(value)
+        else:
+            setting_input.setValue(value)
+        setting_input.blockSignals(False)
+
+    def restart_export_server(self, port):
+        if self.export_server is not None:
+            self.export_server.stop()
+            self.export_server = None
+        if not port:
+            return
+        export_server = ExportServer(self.io_loop, {
+            '/status': self.export_status,
+            '/eeg': self.export_eeg,
+            '/events/seizures': lambda params: read_journal('seizure_events.json', int(params.get('limit', 0))),
+            '/events/medications': lambda params: read_journal('medication_log.json', int(params.get('limit', 0))),
+        }, port=port)
+        try:
+            export_server.start()
+        except OSError as e:
+            print(f"Could not start the export endpoint on port {port}: {e}")
+            return
+        self.export_server = export_server
+
+    def export_status(self, params):
+        # Called on a worker thread; reads plain attributes only, never widgets
+        return {
+            'auto_mode': self.auto_mode,
+            'seizure_marked': self.seizure_active,
+            'recording': self.is_recording,
+            'protocol': self.protocol_manager.current_protocol['name'] if self.protocol_manager.current_protocol else None,
+            'source': type(self.source).__name__,
+            'samples_buffered': self.samples_buffered(),
+        }
+
+    def samples_buffered(self):
+        with self.sample_ring_lock:
+            return len(self.sample_ring)
+
+    def export_eeg(self, params):
+        # Called on a worker thread: copy the latest samples under the lock, serialise them outside it
+        count = int(params.get('count', self.settings.get('plot_window_points')))
+        with self.sample_ring_lock:
+            timestamps, frames = (view.copy() for view in self.sample_ring.latest(count))
+        return {'timestamps': timestamps.tolist(), 'frames': frames.tolist()}
+
     def set_seizure_detection_interval(self, value):
         # Update the seizure detection interval
-        self.seizure_detector.timer.setInterval(value * 1000)
-        print(f"Seizure detection interval set to {value} seconds.")
+        self.seizure_detector.set_interval(value)
+        print(f"Seizure detection interval set to {value} ms.")
 
     def on_tab_changed(self, index):
         tab_text = self.tabs.tabText(index)
         if tab_text == "Patient Data":
             self.show_patient_data_popup()
+        elif tab_text == "Seizure Stats":
+            self.refresh_seizure_stats()
+
+    def on_analytics_updated(self, patient_id):
+        # Statistics change on every journalled event; only redraw what is on screen
+        if self.tabs.currentWidget() is self.seizure_stats_tab:
+            self.refresh_seizure_stats()
+
+    def refresh_seizure_stats(self):
+        """Show the selected patient's precomputed statistics; cost does not grow with history."""
+        patient_ids = self.analytics.patient_ids()
+        combo = self.stats_patient_combo
+        if patient_ids != [combo.itemData(i) for i in range(combo.count())]:
+            selected = combo.currentData()
+            if selected is None:
+                selected = self.patient_id_input.text()
+            combo.blockSignals(True)
+            combo.clear()
+            for patient_id in patient_ids:
+                combo.addItem(patient_id or "(no patient ID)", patient_id)
+            if selected in patient_ids:
+                combo.setCurrentIndex(patient_ids.index(selected))
+            combo.blockSignals(False)
+        if combo.currentData() is None:
+            return
+        stats = self.analytics.summary(combo.currentData())
+        episodes = str(stats['episodes'])
+        if stats['episode_open']:
+            episodes += " (one in progress)"
+        self.stats_labels['episodes'].setText(f"{episodes} on {stats['days_with_episodes']} days")
+        self.stats_labels['duration'].setText(
+            f"{format_duration(stats['mean_duration_s'])} / {format_duration(stats['max_duration_s'])}")
+        self.stats_labels['inter_ictal'].setText(
+            f"{format_duration(stats['mean_inter_ictal_s'])} / {format_duration(stats['min_inter_ictal_s'])}")
+        last = stats['last_episode_end']
+        self.stats_labels['last'].setText(
+            datetime.datetime.fromtimestamp(last).strftime('%Y-%m-%d %H:%M:%S') if last else "-")
+        self.hour_histogram_bars.setOpts(height=stats['hour_histogram'])
+
+        medications = stats['medications']
+        self.dose_response_table.setRowCount(len(medications))
+        for row, (name, medication) in enumerate(medications.items()):
+            cells = [
+                name,
+                f"{medication['doses']} ({medication['total_mg']:g} mg)",
+                str(medication['during_episode']),
+                f"{medication['responded']} of {medication['during_episode']}",
+                format_duration(medication['mean_time_to_end_s']),
+            ]
+            for column, text in enumerate(cells):
+                self.dose_response_table.setItem(row, column, QTableWidgetItem(text))
 
     def show_patient_data_popup(self):
+        self.patient_data_popup = PatientDataPopup(self, self.collect_patient_data())
+        self.patient_data_popup.exec_()
+
+    def collect_patient_data(self):
         # Collect patient data
-        patient_data = {
+        return {
             'name': self.patient_name_input.text(),
             'age': self.patient_age_input.text(),
             'id': self.patient_id_input.text(),
-            'eeg_data': self.eeg_data,
-            'med_logs': self.medication_logs,
+            'eeg_data': list(self.eeg_data),
+            'med_logs': list(self.medication_logs),
             'logs': self.logs_text_edit.toPlainText(),
         }
-        self.patient_data_popup = PatientDataPopup(self, patient_data)
-        self.patient_data_popup.exec_()
+
+    def show_ward_dashboard(self):
+        if self.session_manager is None:
+            from sessions import SessionManager
+            from ward import WardDashboard
+            # Beds share this window's journal and worker pool
+            self.session_manager = SessionManager(
+                journal=self.journal,
+                worker_pool=self.worker_pool,
+                io_loop=self.io_loop,
+                sample_rate_hz=self.settings.get('sample_rate_hz'),
+                buffer_retention_s=self.settings.get('buffer_retention_s'),
+                detector_interval_ms=self.settings.get('detector_interval_ms'),
+                filter_options=filter_options(self.settings),
+                dose_ledger=self.dose_ledger
+            )
+            self.ward_dashboard = WardDashboard(self.session_manager, self.settings)
+        self.ward_dashboard.show()
+        self.ward_dashboard.raise_()
 
     def go_home(self):
         # For now, do nothing or implement as needed
@@ -1127,8 +1818,42 @@ class MainWindow(QMainWindow):
     def closeEvent(self, event):
         if self.serial_port and self.serial_port.is_open:
             self.serial_port.close()  # Close the serial port on exit
+        if self.emulator is not None:
+            self.emulator.close()
+        # Detaching leaves the daemon monitoring and dosing as before
+        self.detach_from_daemon()
+        if self.session_manager is not None:
+            self.session_manager.close()
+            self.ward_dashboard.close()
+        self.settings.save()
+        # The protocol timer dies with the window; the checkpoint lets the next start resume it
+        self.checkpoint_timer.stop()
+        self.save_checkpoint()
+        self.checkpoint.close()
+        if self.export_server is not None:
+            self.export_server.stop()
+        self.journal.close()
+        self.database.close()
+        self.analytics.close()
+        self.io_loop.stop()
+        with self.sample_ring_lock:
+            self.sample_ring.close()
+        self.worker_pool.shutdown(wait=False)
+        if self.report_pool is not None:
+            self.report_pool.shutdown(wait=False, cancel_futures=True)
         event.accept()
 
+def format_duration(seconds):
+    if seconds is None:
+        return "-"
+    if seconds < 120:
+        return f"{seconds:.0f} s"
+    if seconds < 7200:
+        return f"{seconds / 60:.1f} min"
+    if seconds < 172800:
+        return f"{seconds / 3600:.1f} h"
+    return f"{seconds / 86400:.1f} days"
+
 if __name__ == "__main__":
     app = QApplication(sys.argv)
     app.setStyleSheet(qdarkstyle.load_stylesheet(qt_api='pyqt5'))  # Apply dark style
@@ -0,0 +1,295 @@
+import bisect
+import datetime
+import time
+
+from PyQt5.QtCore import QDateTime, QObject, QTimer, pyqtSignal
+
+EPISODE_GAP_S = 60  # A detection more than this long after the previous one starts a new episode
+MISSED_DOSE_GRACE_S = 60  # On resume, doses overdue by less than this are still given
+
+DEFAULT_PROTOCOL = {
+    'protocol_id': 1,
+    'name': "Default Protocol",
+    'seizure_duration_threshold': 2,  # Seizure must last for 2 minutes
+    'steps': [
+        {"duration": 1, "dose_mg": 5, "medication": "Levetiracetam (Keppra)"},    # First 1 minute
+        {"duration": 1, "dose_mg": 2.5, "medication": "Phenytoin (Dilantin)"},  # Next 1 minute
+        {"duration": 1, "dose_mg": 1, "medication": "Valproate (Depakote)"},    # Next 1 minute
+        {"duration": 1, "dose_mg": 0.5, "medication": "Lacosamide (Vimpat)"}   # Final 1 minute
+    ],
+    'total_duration': 4  # Total duration of the protocol: 4 minutes
+}
+
+
+class SeizureProtocolManager(QObject):
+    dose_to_administer = pyqtSignal(float, str)  # Signal with dose in mg and medication name
+    protocol_started = pyqtSignal(str)  # Signal with protocol name
+    protocol_completed = pyqtSignal(str)
+    new_schedule = pyqtSignal(list)  # Signal with list of timestamps and doses
+    protocol_updated = pyqtSignal()
+    protocol_resumed = pyqtSignal(str)  # Signal with protocol name, after a restart
+    doses_missed = pyqtSignal(list)  # Signal with the doses that fell due while the protocol was not running
+    dose_withheld = pyqtSignal(float, str, str)  # Signal with dose in mg, medication name and the reason
+    run_state_changed = pyqtSignal()  # A dose was scheduled or the protocol ended; checkpoint now
+
+    def __init__(self):
+        super().__init__()
+        self.protocols = {}  # Store all protocols
+        self.current_protocol = None
+        self.current_protocol_timer = None  # dose_timer, or the replay clock handle of the pending dose
+        # One timer reused for every dose, so a long session does not accumulate timer objects
+        self.dose_timer = QTimer()
+        self.dose_timer.setSingleShot(True)
+        self.dose_timer.timeout.connect(self.administer_next_dose)
+        self.step_index = 0
+        self.schedule = []
+        self.next_dose_time = None  # Absolute deadline (epoch seconds) of the pending step
+        self.clock = None  # Optional ReplayClock; when set, doses follow replayed sample time
+        self.dose_check = None  # Optional callable(dose_mg, medication) returning why a dose must be withheld
+
+    def now(self):
+        if self.clock is not None:
+            return datetime.datetime.fromtimestamp(self.clock.now())
+        return datetime.datetime.now()
+
+    def add_protocol(self, protocol_id, name, seizure_duration_threshold, steps, total_duration):
+        """Add a new protocol to the system."""
+        self.protocols[protocol_id] = {
+            "id": protocol_id,
+            "name": name,
+            "seizure_duration_threshold": seizure_duration_threshold,  # in minutes
+            "steps": steps,  # list of dicts with 'duration' in minutes, 'dose_mg', 'medication'
+            "total_duration": total_duration  # in minutes
+        }
+        print(f"Added {name} (Protocol {protocol_id}) to the system.")
+        self.protocol_updated.emit()
+
+    def start_protocol(self, protocol_id):
+        """Start the protocol when a seizure is detected."""
+        if protocol_id not in self.protocols:
+            print(f"Protocol {protocol_id} not found.")
+            return
+
+        self.stop_timer()
+        self.current_protocol = self.protocols[protocol_id]
+        self.protocol_started.emit(self.current_protocol['name'])
+        print(f"Running {self.current_protocol['name']}...")
+
+        # Create a schedule of timestamps and doses
+        self.schedule = []
+        current_time = QDateTime.fromMSecsSinceEpoch(int(self.now().timestamp() * 1000))
+        for step in self.current_protocol['steps']:
+            duration = step['duration']  # in minutes
+            dose_mg = step['dose_mg']
+            medication = step.get('medication', 'Unknown')
+            timestamp = current_time.addSecs(int(duration * 60))
+            self.schedule.append({'time': timestamp, 'dose_mg': dose_mg, 'medication': medication})
+            current_time = timestamp
+
+        # Emit the schedule
+        self.new_schedule.emit(self.schedule)
+
+        # Start administering doses
+        self.step_index = 0
+        self.administer_next_dose()
+
+    def administer_next_dose(self):
+        if self.current_protocol is None:
+            return
+        if self.step_index >= len(self.current_protocol['steps']):
+            # Protocol completed
+            self.protocol_completed.emit(self.current_protocol['name'])
+            self.current_protocol = None
+            self.current_protocol_timer = None
+            self.next_dose_time = None
+            self.run_state_changed.emit()
+            return
+
+        step = self.current_protocol['steps'][self.step_index]
+        dose_mg = step['dose_mg']
+        medication = step.get('medication', 'Unknown')
+        reason = self.dose_check(dose_mg, medication) if self.dose_check is not None else None
+        if reason:
+            # The rest of the schedule still runs; later steps are checked again when they fall due
+            self.dose_withheld.emit(dose_mg, medication, reason)
+            print(f"Withheld {dose_mg} mg of {medication}: {reason}.")
+        else:
+            self.dose_to_administer.emit(dose_mg, medication)
+            print(f"Administering {dose_mg} mg of {medication} at {self.now().strftime('%Y-%m-%d %H:%M:%S')}.")
+
+        # Schedule next dose
+        duration = step['duration']  # in minutes
+        self.step_index += 1
+        self.schedule_dose(duration * 60)
+
+    def schedule_dose(self, delay_s):
+        self.next_dose_time = self.now().timestamp() + delay_s
+        if self.clock is not None:
+            self.current_protocol_timer = self.clock.call_later(delay_s, self.administer_next_dose)
+        else:
+            self.current_protocol_timer = self.dose_timer
+            self.dose_timer.start(int(delay_s * 1000))  # Convert to milliseconds
+        self.run_state_changed.emit()
+
+    def stop_timer(self):
+        # Cancel the pending dose of a protocol that is being replaced
+        if self.current_protocol_timer is None:
+            return
+        if self.clock is not None:
+            self.clock.cancel(self.current_protocol_timer)
+        else:
+            self.current_protocol_timer.stop()
+        self.current_protocol_timer = None
+        self.next_dose_time = None
+
+    def set_clock(self, clock):
+        """Follow a ReplayClock, or the wall clock when None; a pending dose keeps its remaining delay."""
+        if clock is self.clock:
+            return
+        remaining = None
+        if self.current_protocol_timer is not None:
+            remaining = max(0.0, self.next_dose_time - self.now().timestamp())
+            self.stop_timer()
+        self.clock = clock
+        if remaining is not None:
+            self.schedule_dose(remaining)
+
+    def run_state(self):
+        """What a restart needs to continue the running protocol, or None when none is running.
+
+        A protocol on a replay clock is not resumed: its deadline is in replayed time, and a
+        replayed seizure must not go on dosing after a restart.
+        """
+        if self.current_protocol is None or self.next_dose_time is None or self.clock is not None:
+            return None
+        return {
+            'protocol': self.current_protocol,
+            'step_index': self.step_index,
+            'next_dose_time': self.next_dose_time,
+        }
+
+    def resume(self, state):
+        """Continue a protocol from run_state() at its absolute deadlines; returns the doses missed meanwhile."""
+        self.stop_timer()
+        self.current_protocol = state['protocol']
+        steps = self.current_protocol['steps']
+        self.step_index = state['step_index']
+        deadline = state['next_dose_time']
+        now = self.now().timestamp()
+        # Doses that fell due while nothing was running are reported rather than given late
+        missed = []
+        while self.step_index < len(steps) and deadline < now - MISSED_DOSE_GRACE_S:
+            step = steps[self.step_index]
+            missed.append({'due': deadline, 'dose_mg': step['dose_mg'], 'medication': step.get('medication', 'Unknown')})
+            deadline += step['duration'] * 60
+            self.step_index += 1
+        self.protocol_resumed.emit(self.current_protocol['name'])
+        print(f"Resumed {self.current_protocol['name']} at step {self.step_index + 1} of {len(steps)}.")
+
+        self.schedule = []
+        step_time = deadline
+        for step in steps[self.step_index:]:
+            self.schedule.append({'time': QDateTime.fromMSecsSinceEpoch(int(step_time * 1000)),
+                                  'dose_mg': step['dose_mg'], 'medication': step.get('medication', 'Unknown')})
+            step_time += step['duration'] * 60
+        self.new_schedule.emit(self.schedule)
+        if missed:
+            self.doses_missed.emit(missed)
+        self.schedule_dose(max(0.0, deadline - now))
+        return missed
+
+
+class ProtocolSelector(QObject):
+    """Turns detector ticks into seizure episodes and picks the protocol for how long an episode has lasted.
+
+    Protocols are kept sorted by seizure_duration_threshold, so the matching protocol is found by
+    bisection. Repeated detections of an ongoing episode only extend it; a protocol is (re)started
+    only when the episode crosses a higher threshold.
+    """
+    episode_started = pyqtSignal(float)  # Signal with the episode onset (epoch seconds)
+    episode_ended = pyqtSignal(float, float)  # Signal with the episode onset and last detection
+    protocol_selected = pyqtSignal(int, float)  # Signal with protocol id and when its threshold was crossed
+
+    def __init__(self, protocol_manager, gap_s=EPISODE_GAP_S):
+        super().__init__()
+        self.protocol_manager = protocol_manager
+        self.gap_s = gap_s
+        self.thresholds = []  # Seizure duration thresholds in seconds, ascending
+        self.protocol_ids = []  # Protocol id for each threshold
+        self.episode_start = None
+        self.last_detection = None
+        self.level = -1  # Index into thresholds of the protocol started for this episode
+        # Ends the episode once detections stop; follows the protocol manager's replay clock when it has one
+        self.gap_timer = QTimer()
+        self.gap_timer.setSingleShot(True)
+        self.gap_timer.timeout.connect(self.end_episode)
+        self.gap_handle = None  # (clock, handle) of the replay clock callback
+        protocol_manager.protocol_updated.connect(self.rebuild)
+        self.rebuild()
+
+    def rebuild(self):
+        rules = sorted((float(protocol['seizure_duration_threshold']) * 60, protocol_id)
+                       for protocol_id, protocol in self.protocol_manager.protocols.items())
+        self.thresholds = [threshold for threshold, _ in rules]
+        self.protocol_ids = [protocol_id for _, protocol_id in rules]
+
+    @property
+    def episode_active(self):
+        return self.episode_start is not None
+
+    def on_detection(self, detection_time=None, onset_time=None):
+        """Handle one detector tick; returns True when it starts a new episode.
+
+        detection_time and onset_time are sample times (epoch seconds) when the detector has them.
+        """
+        now = detection_time if detection_time is not None else time.time()
+        if self.episode_active and now - self.last_detection > self.gap_s:
+            self.end_episode()
+        started = not self.episode_active
+        if started:
+            self.episode_start = min(onset_time, now) if onset_time is not None else now
+            self.level = -1
+            self.episode_started.emit(self.episode_start)
+        self.last_detection = now
+        self.start_gap_timer()
+        self.select_protocol(now)
+        return started
+
+    def select_protocol(self, now):
+        # The protocol with the highest threshold the episode has reached
+        level = bisect.bisect_right(self.thresholds, now - self.episode_start) - 1
+        if level > self.level:
+            self.level = level
+            self.protocol_selected.emit(self.protocol_ids[level], self.episode_start + self.thresholds[level])
+
+    def duration(self):
+        return self.last_detection - self.episode_start if self.episode_active else 0.0
+
+    def start_gap_timer(self):
+        self.stop_gap_timer()
+        clock = self.protocol_manager.clock
+        if clock is not None:
+            self.gap_handle = (clock, clock.call_later(self.gap_s, self.end_episode))
+        else:
+            self.gap_timer.start(int(self.gap_s * 1000))
+
+    def stop_gap_timer(self):
+        self.gap_timer.stop()
+        if self.gap_handle is not None:
+            clock, handle = self.gap_handle
+            clock.cancel(handle)
+            self.gap_handle = None
+
+    def end_episode(self):
+        if not self.episode_active:
+            return
+        self.stop_gap_timer()
+        start, end = self.episode_start, self.last_detection
+        self.episode_start = self.last_detection = None
+        self.level = -1
+        self.episode_ended.emit(start, end)
+
+    def reset(self):
+        self.stop_gap_timer()
+        self.episode_start = self.last_detection = None
+        self.level = -1
@@ -0,0 +1,296 @@
+import argparse
+import datetime
+import heapq
+import itertools
+import json
+import os
+import sys
+import time
+
+import numpy as np
+from PyQt5.QtCore import QCoreApplication, pyqtSignal
+
+from acquisition import SampleSource
+from detection import SeizureDetector
+from protocols import DEFAULT_PROTOCOL, ProtocolSelector, SeizureProtocolManager
+
+TIMESTAMP_FORMATS = ('%Y-%m-%d %H:%M:%S.%f', '%Y-%m-%d %H:%M:%S')
+MAX_CHUNK_S = 1.0  # Samples are emitted at most this much sample time apart, so replay clock timers fire in step
+
+
+def parse_timestamp(value):
+    """Convert a recorded timestamp (string or epoch seconds) to epoch seconds."""
+    if isinstance(value, (int, float)):
+        return float(value)
+    for timestamp_format in TIMESTAMP_FORMATS:
+        try:
+            return datetime.datetime.strptime(value, timestamp_format).timestamp()
+        except ValueError:
+            continue
+    raise ValueError(f"Unrecognised timestamp: {value!r}")
+
+
+def sample_frame(entry):
+    # Multi-channel entries carry all channels; legacy entries a single value
+    return entry['channels'] if 'channels' in entry else [entry['value']]
+
+
+def recording_entries(timestamps, frames):
+    """Sample entries as streamed recordings store them, one per sample."""
+    entries = []
+    for timestamp, frame in zip(timestamps, frames):
+        entry = {
+            'timestamp': datetime.datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S.%f'),
+            'value': float(frame[0])
+        }
+        if len(frame) > 1:
+            entry['channels'] = frame.tolist()
+        entries.append(entry)
+    return entries
+
+
+def read_json_recording(path):
+    # EEG_Data_*.json: a single list of {'timestamp', 'value'} entries
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def read_jsonl_recording(path):
+    # One sample entry per line, as written by streaming recorders
+    with open(path, 'r') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+RECORDING_READERS = {
+    '.json': read_json_recording,
+    '.jsonl': read_jsonl_recording,
+}
+
+
+def load_recording(path):
+    """Load a recording as (timestamps, frames) arrays sorted by time."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in RECORDING_READERS:
+        raise ValueError(f"Unsupported recording format: {extension}")
+    entries = RECORDING_READERS[extension](path)
+    if not entries:
+        raise ValueError(f"Recording {path} contains no samples.")
+    timestamps = np.array([parse_timestamp(entry['timestamp']) for entry in entries])
+    frames = np.array([sample_frame(entry) for entry in entries], dtype=float)
+    order = np.argsort(timestamps, kind='stable')
+    return timestamps[order], frames[order]
+
+
+def load_event_timeline(path, start_time, end_time):
+    """Load seizure events recorded between start_time and end_time, oldest first."""
+    events = []
+    if not path or not os.path.exists(path):
+        return events
+    with open(path, 'r') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            event = json.loads(line)
+            event_time = parse_timestamp(event['timestamp'])
+            if start_time <= event_time <= end_time:
+                events.append((event_time, event))
+    events.sort(key=lambda item: item[0])
+    return events
+
+
+class ReplayClock:
+    """Virtual clock that follows replayed sample time instead of the wall clock."""
+
+    def __init__(self, start_time):
+        self.time = start_time
+        self.queue = []  # Heap of [deadline, sequence, callback]
+        self.sequence = itertools.count()
+
+    def now(self):
+        return self.time
+
+    def call_later(self, delay_s, callback):
+        handle = [self.time + delay_s, next(self.sequence), callback]
+        heapq.heappush(self.queue, handle)
+        return handle
+
+    def cancel(self, handle):
+        handle[2] = None
+
+    def advance(self, target_time):
+        # Fire every callback that falls due up to target_time, in deadline order
+        while self.queue and self.queue[0][0] <= target_time:
+            deadline, _, callback = heapq.heappop(self.queue)
+            if callback is not None:
+                self.time = max(self.time, deadline)
+                callback()
+        self.time = max(self.time, target_time)
+
+
+class ReplaySource(SampleSource):
+    """Feeds a saved recording through the acquisition path at real time, N x speed or as fast as possible."""
+    annotation_reached = pyqtSignal(dict)  # Signal with a recorded seizure event as replay passes it
+
+    def __init__(self, path, speed=1.0, events_path='seizure_events.json', chunk_size=1024):
+        super().__init__()
+        self.path = path
+        self.speed = speed  # 0 replays as fast as possible
+        self.chunk_size = chunk_size
+        self.timestamps, self.frames = load_recording(path)
+        self.events = load_event_timeline(events_path, self.timestamps[0], self.timestamps[-1])
+        self.clock = ReplayClock(self.timestamps[0])
+        self.position = 0
+        self.event_index = 0
+        self.running = False
+
+    def start(self):
+        self.position = 0
+        self.event_index = 0
+        self.clock = ReplayClock(self.timestamps[0])
+        self.wall_start = time.monotonic()
+        self.running = True
+        # A zero interval timer yields to the event loop between chunks
+        self.start_polling(0 if not self.speed else 20)
+        print(f"Replaying {self.path} at {'maximum' if not self.speed else f'{self.speed}x'} speed.")
+
+    def stop(self):
+        self.timer.stop()
+        self.running = False
+
+    def poll(self):
+        if not self.running:
+            return
+        if not self.speed:
+            target_end = min(self.position + self.chunk_size, len(self.timestamps))
+        else:
+            target_time = self.timestamps[0] + (time.monotonic() - self.wall_start) * self.speed
+            target_end = int(np.searchsorted(self.timestamps, target_time, side='right'))
+        while self.running and self.position < target_end:
+            # At low sample rates a chunk spans minutes; the clock must not run ahead of the samples by that much
+            end = min(target_end, int(np.searchsorted(self.timestamps, self.timestamps[self.position] + MAX_CHUNK_S,
+                                                      side='right')))
+            chunk_end_time = self.timestamps[end - 1]
+            self.clock.advance(chunk_end_time)
+            self.samples_ready.emit(self.timestamps[self.position:end], self.frames[self.position:end])
+            while self.event_index < len(self.events) and self.events[self.event_index][0] <= chunk_end_time:
+                self.annotation_reached.emit(self.events[self.event_index][1])
+                self.event_index += 1
+            self.position = end
+        if self.position >= len(self.timestamps):
+            self.stop()
+            print(f"Replay of {self.path} finished.")
+            self.finished.emit()
+
+
+def seizure_intervals(events):
+    # Pair manually marked Seizure Start/Stop events into (start, stop) intervals
+    intervals = []
+    start_time = None
+    for event_time, event in events:
+        if event.get('event') == 'Seizure Start':
+            start_time = event_time
+        elif event.get('event') == 'Seizure Stop' and start_time is not None:
+            intervals.append((start_time, event_time))
+            start_time = None
+    return intervals
+
+
+def run_regression(recording_path, events_path='seizure_events.json', speed=0, protocols_path=None,
+                   protocol_id=None, detector_interval_ms=1000):
+    """Replay a recording headless through SeizureDetector and SeizureProtocolManager and summarise the run."""
+    app = QCoreApplication.instance() or QCoreApplication(sys.argv)
+    source = ReplaySource(recording_path, speed=speed, events_path=events_path)
+    detector = SeizureDetector()
+    protocol_manager = SeizureProtocolManager()
+    if protocols_path:
+        with open(protocols_path, 'r') as f:
+            protocols = json.load(f)
+        for protocol in (protocols if isinstance(protocols, list) else [protocols]):
+            protocol_manager.add_protocol(
+                protocol_id=protocol['id'],
+                name=protocol['name'],
+                seizure_duration_threshold=protocol['seizure_duration_threshold'],
+                steps=protocol['steps'],
+                total_duration=sum(step.get('duration', 0) for step in protocol['steps'])
+            )
+    else:
+        protocol_manager.add_protocol(**DEFAULT_PROTOCOL)
+
+    # As in the monitor, detections form episodes and the episode's duration selects the protocol;
+    # protocol_id forces one protocol at the start of every episode instead
+    selector = ProtocolSelector(protocol_manager)
+    detections = []
+    episodes = []
+    doses = []
+
+    def on_seizure_detected():
+        detections.append(detector.detection_time)
+        if selector.on_detection(detector.detection_time, detector.onset_time) and protocol_id is not None:
+            protocol_manager.start_protocol(protocol_id)
+
+    def on_protocol_selected(selected_id, threshold_time):
+        if protocol_id is None:
+            protocol_manager.start_protocol(selected_id)
+
+    detector.seizure_detected.connect(on_seizure_detected)
+    selector.protocol_selected.connect(on_protocol_selected)
+    selector.episode_ended.connect(lambda start, end: episodes.append((start, end)))
+    protocol_manager.dose_to_administer.connect(
+        lambda dose_mg, medication: doses.append({'time': source.clock.now(), 'dose_mg': dose_mg, 'medication': medication}))
+    source.samples_ready.connect(detector.push_samples)
+    source.finished.connect(app.quit)
+
+    detector.start_detection(detector_interval_ms)
+    detector.timer.stop()  # Detection is driven purely by replayed samples
+    source.start()
+    # Doses follow replayed time once the clock exists
+    protocol_manager.set_clock(source.clock)
+    wall_start = time.monotonic()
+    app.exec_()
+    wall_time = time.monotonic() - wall_start
+    selector.end_episode()
+
+    intervals = seizure_intervals(source.events)
+    latencies = []
+    for start_time, stop_time in intervals:
+        hits = [t for t in detections if start_time <= t <= stop_time]
+        if hits:
+            latencies.append(hits[0] - start_time)
+    false_detections = [t for t in detections if not any(start <= t <= stop for start, stop in intervals)]
+    recording_duration = float(source.timestamps[-1] - source.timestamps[0])
+    return {
+        'recording': recording_path,
+        'samples': int(len(source.timestamps)),
+        'channels': int(source.frames.shape[1]),
+        'recording_duration_s': recording_duration,
+        'wall_time_s': wall_time,
+        'speedup': recording_duration / wall_time if wall_time else None,
+        'annotated_seizures': len(intervals),
+        'detected_seizures': len(latencies),
+        'detection_latencies_s': latencies,
+        'detections': len(detections),
+        'false_detections': len(false_detections),
+        'episodes': len(episodes),
+        'episode_durations_s': [end - start for start, end in episodes],
+        'doses': len(doses),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay a recording through the seizure detector and protocol manager.")
+    parser.add_argument('recording', help="EEG_Data_*.json or .jsonl recording")
+    parser.add_argument('--events', default='seizure_events.json', help="seizure event timeline")
+    parser.add_argument('--speed', default='max', help="replay speed multiplier, or 'max'")
+    parser.add_argument('--protocols', help="JSON file with protocols in the Load Protocol format")
+    parser.add_argument('--protocol-id', type=int, help="start this protocol on every episode instead of selecting by duration")
+    parser.add_argument('--detector-interval-ms', type=int, default=1000)
+    args = parser.parse_args()
+    summary = run_regression(
+        args.recording,
+        events_path=args.events,
+        speed=0 if args.speed == 'max' else float(args.speed),
+        protocols_path=args.protocols,
+        protocol_id=args.protocol_id,
+        detector_interval_ms=args.detector_interval_ms
+    )
+    print(json.dumps(summary, indent=4))
@@ -0,0 +1,328 @@
+import argparse
+import datetime
+import html
+import json
+import os
+import re
+import time
+
+import numpy as np
+
+OVERVIEW_BINS = 1200  # Columns of the decimated EEG overview; memory does not grow with the recording
+READ_CHUNK_BYTES = 4 << 20
+PLOT_WIDTH = 900
+PLOT_HEIGHT = 160
+# Sample entries as written by the recorder: {"timestamp": "...", "value": v, ...}
+SAMPLE_PATTERN = re.compile(rb'"timestamp": "([^"]+)", "value": (-?[0-9.eE+-]+|NaN|-?Infinity)')
+MEDICATION_COLOURS = ('#e74c3c', '#3498db', '#2ecc71', '#f39c12', '#9b59b6', '#1abc9c', '#e67e22', '#34495e')
+
+
+def local_seconds(timestamps):
+    """Recorded local timestamps (strings) as seconds on one naive scale, vectorised."""
+    return np.array(timestamps, dtype='datetime64[us]').astype(np.int64) / 1e6
+
+
+def format_time(seconds):
+    return str(np.datetime64(int(seconds * 1e6), 'us').astype('datetime64[s]')).replace('T', ' ')
+
+
+class EEGOverview:
+    """Min/max envelope of the display channel in fixed time bins, built one chunk at a time."""
+
+    def __init__(self, start, end, bins=OVERVIEW_BINS):
+        self.start = start
+        self.end = max(end, start + 1e-6)
+        self.bins = bins
+        self.minimum = np.full(bins, np.inf)
+        self.maximum = np.full(bins, -np.inf)
+        self.samples = 0
+
+    def add(self, times, values):
+        finite = np.isfinite(values)
+        times, values = times[finite], values[finite]
+        index = ((times - self.start) / (self.end - self.start) * self.bins).astype(np.int64)
+        np.clip(index, 0, self.bins - 1, out=index)
+        np.minimum.at(self.minimum, index, values)
+        np.maximum.at(self.maximum, index, values)
+        self.samples += len(values)
+
+
+def recording_span(path):
+    """First and last sample time, from the first and last entries of the file."""
+    with open(path, 'rb') as f:
+        head = f.read(64 * 1024)
+        size = f.seek(0, os.SEEK_END)
+        f.seek(max(0, size - 64 * 1024))
+        tail = f.read()
+    first = SAMPLE_PATTERN.search(head)
+    last = SAMPLE_PATTERN.findall(tail)
+    if first is None or not last:
+        raise ValueError(f"Recording {path} contains no samples.")
+    start, end = local_seconds([first.group(1).decode(), last[-1][0].decode()])
+    return float(start), float(end)
+
+
+def stream_samples(path, chunk_bytes=READ_CHUNK_BYTES):
+    """Yield (times, values) of the display channel chunk by chunk from a .json or .jsonl recording."""
+    with open(path, 'rb') as f:
+        carry = b''
+        while True:
+            data = f.read(chunk_bytes)
+            buffer = carry + data
+            # Entries end with '}'; the rest waits for the next chunk
+            cut = len(buffer) if not data else buffer.rfind(b'}') + 1
+            buffer, carry = buffer[:cut], buffer[cut:]
+            matches = SAMPLE_PATTERN.findall(buffer)
+            if matches:
+                timestamps, values = zip(*matches)
+                yield (local_seconds([timestamp.decode() for timestamp in timestamps]),
+                       np.array(values, dtype=float))
+            if not data:
+                return
+
+
+def read_journal_span(path, start, end, patient_id=None):
+    """Journal records between start and end (local seconds), optionally for one patient, oldest first."""
+    records = []
+    if not os.path.exists(path):
+        return records
+    # Timestamps sort as text, so records outside the span are skipped without converting their time
+    first, last = format_time(start - 1), format_time(end + 1)
+    with open(path, 'r') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                event = json.loads(line)
+                if not first <= str(event['timestamp'])[:19] <= last:
+                    continue
+                event_time = float(local_seconds([event['timestamp']])[0])
+            except (ValueError, KeyError, TypeError):
+                continue
+            if patient_id and event.get('patient_id') not in (patient_id, None):
+                continue
+            if start <= event_time <= end:
+                records.append((event_time, event))
+    records.sort(key=lambda record: record[0])
+    return records
+
+
+def seizure_episodes(seizure_events, end):
+    """(start, stop) of manual and detected episodes from the seizure event records."""
+    episodes = []
+    manual_start = detected_start = None
+    for event_time, event in seizure_events:
+        kind = event.get('event')
+        if kind == 'Seizure Start':
+            manual_start = event_time
+        elif kind == 'Seizure Stop' and manual_start is not None:
+            episodes.append((manual_start, event_time))
+            manual_start = None
+        elif kind == 'Seizure Detected' and detected_start is None:
+            detected_start = event_time
+        elif kind == 'Seizure Ended' and detected_start is not None:
+            duration = event.get('duration_s')
+            episodes.append((detected_start, detected_start + duration if duration is not None else event_time))
+            detected_start = None
+    # Episodes still open when the recording ends
+    for episode_start in (manual_start, detected_start):
+        if episode_start is not None:
+            episodes.append((episode_start, end))
+    return sorted(episodes)
+
+
+def svg_overview(overview, episodes, detections):
+    width, height = PLOT_WIDTH, PLOT_HEIGHT
+    x_scale = width / overview.bins
+    filled = np.isfinite(overview.minimum)
+    parts = [f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+             f'viewBox="0 0 {width} {height}"><rect width="{width}" height="{height}" fill="#ffffff"/>']
+    span = overview.end - overview.start
+    for start, stop in episodes:
+        x0 = max(0.0, (start - overview.start) / span * width)
+        x1 = min(float(width), (stop - overview.start) / span * width)
+        parts.append(f'<rect x="{x0:.1f}" y="0" width="{max(x1 - x0, 1.0):.1f}" height="{height}" '
+                     f'fill="#e74c3c" fill-opacity="0.2"/>')
+    if filled.any():
+        low, high = overview.minimum[filled].min(), overview.maximum[filled].max()
+        scale = (height - 10) / (high - low) if high > low else 0.0
+
+        def y(value):
+            return height - 5 - (value - low) * scale
+        # One vertical stroke per bin from its minimum to its maximum
+        path = ''.join(f'M{(index + 0.5) * x_scale:.1f} {y(overview.maximum[index]):.1f}'
+                       f'V{y(overview.minimum[index]) + 0.5:.1f}' for index in np.flatnonzero(filled))
+        parts.append(f'<path d="{path}" stroke="#2c3e50" stroke-width="{max(x_scale, 1.0):.2f}" fill="none"/>')
+    for detection in detections:
+        x = (detection - overview.start) / span * width
+        parts.append(f'<line x1="{x:.1f}" y1="0" x2="{x:.1f}" y2="{height}" stroke="#c0392b" stroke-width="1.5"/>')
+    parts.append('</svg>')
+    return ''.join(parts)
+
+
+def svg_dose_timeline(doses, start, end, colours):
+    width, height = PLOT_WIDTH, PLOT_HEIGHT // 2
+    span = max(end - start, 1e-6)
+    largest = max((dose_mg for _, _, dose_mg in doses), default=1.0) or 1.0
+    parts = [f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+             f'viewBox="0 0 {width} {height}"><rect width="{width}" height="{height}" fill="#ffffff"/>',
+             f'<line x1="0" y1="{height - 1}" x2="{width}" y2="{height - 1}" stroke="#7f8c8d"/>']
+    for dose_time, medication, dose_mg in doses:
+        x = (dose_time - start) / span * width
+        top = height - 2 - (height - 10) * dose_mg / largest
+        parts.append(f'<line x1="{x:.1f}" y1="{height - 1}" x2="{x:.1f}" y2="{top:.1f}" '
+                     f'stroke="{colours[medication]}" stroke-width="2"/>'
+                     f'<circle cx="{x:.1f}" cy="{top:.1f}" r="3" fill="{colours[medication]}"/>')
+    parts.append('</svg>')
+    return ''.join(parts)
+
+
+def build_report(recording_path, output_path, patient=None, seizure_events_path='seizure_events.json',
+                 medication_log_path='medication_log.json', pdf=False):
+    """Write an HTML report (and a PDF beside it when pdf is set) for one recording; returns the paths written.
+
+    Runs in a worker process: the recording is streamed in chunks, plots are rendered to SVG
+    without any display, and nothing here touches the GUI.
+    """
+    build_start = time.monotonic()
+    patient = patient or {}
+    patient_id = patient.get('id') or None
+    start, end = recording_span(recording_path)
+    overview = EEGOverview(start, end)
+    for times, values in stream_samples(recording_path):
+        overview.add(times, values)
+
+    seizure_events = read_journal_span(seizure_events_path, start, end, patient_id)
+    episodes = seizure_episodes(seizure_events, end)
+    detections = [event_time for event_time, event in seizure_events if event.get('event') == 'Seizure Detected']
+    doses = []
+    for dose_time, event in read_journal_span(medication_log_path, start, end, patient_id):
+        try:
+            doses.append((dose_time, str(event['medication']), float(event['dose_mg'])))
+        except (KeyError, TypeError, ValueError):
+            continue
+    medications = sorted({medication for _, medication, _ in doses})
+    colours = {medication: MEDICATION_COLOURS[index % len(MEDICATION_COLOURS)] for index, medication in enumerate(medications)}
+    durations = [stop - episode_start for episode_start, stop in episodes]
+
+    plots = {
+        'overview': svg_overview(overview, episodes, detections),
+        'doses': svg_dose_timeline(doses, start, end, colours),
+    }
+    stats = [
+        ("Recording", os.path.basename(recording_path)),
+        ("Start", format_time(start)),
+        ("End", format_time(end)),
+        ("Duration", f"{(end - start) / 3600:.2f} h"),
+        ("Samples", f"{overview.samples:,}"),
+        ("Seizure episodes", str(len(episodes))),
+        ("Total seizure time", f"{sum(durations) / 60:.1f} min"),
+        ("Mean episode duration", f"{np.mean(durations):.0f} s" if durations else "-"),
+        ("Longest episode", f"{max(durations):.0f} s" if durations else "-"),
+        ("Automatic detections", str(len(detections))),
+        ("Doses", str(len(doses))),
+    ]
+    totals = {}
+    for _, medication, dose_mg in doses:
+        count, total = totals.get(medication, (0, 0.0))
+        totals[medication] = (count + 1, total + dose_mg)
+
+    def page(plot_html):
+        rows = ''.join(f'<tr><th align="left">{html.escape(label)}</th><td>{html.escape(value)}</td></tr>'
+                       for label, value in stats)
+        legend = ' '.join(f'<span style="color:{colours[medication]}">&#9632;</span> {html.escape(medication)}'
+                          for medication in medications)
+        dose_rows = ''.join(
+            f'<tr><td>{format_time(dose_time)}</td><td>{html.escape(medication)}</td><td align="right">{dose_mg:g} mg</td></tr>'
+            for dose_time, medication, dose_mg in doses)
+        total_rows = ''.join(f'<tr><td>{html.escape(medication)}</td><td align="right">{count}</td>'
+                             f'<td align="right">{total:g} mg</td></tr>' for medication, (count, total) in sorted(totals.items()))
+        episode_rows = ''.join(f'<tr><td>{format_time(episode_start)}</td><td>{format_time(stop)}</td>'
+                               f'<td align="right">{stop - episode_start:.0f} s</td></tr>' for episode_start, stop in episodes)
+        return f"""<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>EEG Session Report</title>
+<style>body {{ font-family: Arial, sans-serif; font-size: 10pt; }} table {{ border-collapse: collapse; }}
+th, td {{ padding: 2px 8px; }} h2 {{ margin-top: 18px; }}</style></head><body>
+<h1>EEG Session Report</h1>
+<h2>Patient</h2>
+<table><tr><th align="left">Name</th><td>{html.escape(patient.get('name') or 'N/A')}</td></tr>
+<tr><th align="left">Age</th><td>{html.escape(patient.get('age') or 'N/A')}</td></tr>
+<tr><th align="left">ID</th><td>{html.escape(patient.get('id') or 'N/A')}</td></tr></table>
+<h2>Session</h2>
+<table>{rows}</table>
+<h2>EEG Overview</h2>
+<p>Channel 1, {overview.bins} bins from {format_time(start)} to {format_time(end)}. Shaded: seizure episodes. Lines: automatic detections.</p>
+{plot_html('overview')}
+<h2>Dose Timeline</h2>
+<p>{legend or 'No doses in this session.'}</p>
+{plot_html('doses')}
+<h2>Doses by Medication</h2>
+<table><tr><th align="left">Medication</th><th>Doses</th><th>Total</th></tr>{total_rows}</table>
+<h2>Seizure Episodes</h2>
+<table><tr><th align="left">Start</th><th align="left">End</th><th>Duration</th></tr>{episode_rows}</table>
+<h2>Medication Log</h2>
+<table><tr><th align="left">Time</th><th align="left">Medication</th><th>Dose</th></tr>{dose_rows}</table>
+<p><small>Generated {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}.</small></p>
+</body></html>
+"""
+
+    written = []
+    with open(output_path, 'w', encoding='utf-8') as f:
+        f.write(page(lambda name: plots[name]))
+    written.append(output_path)
+    if pdf:
+        pdf_path = os.path.splitext(output_path)[0] + '.pdf'
+        write_pdf(pdf_path, page(lambda name: f'<img src="{name}" width="{PLOT_WIDTH * 0.6:.0f}">'), plots)
+        written.append(pdf_path)
+    print(f"Report for {recording_path} built in {time.monotonic() - build_start:.1f} s.")
+    return written
+
+
+def write_pdf(path, page_html, plots):
+    # Qt's rich text cannot draw SVG, so plots are rasterised first and referenced as image resources
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from PyQt5.QtCore import QByteArray, QSizeF, QUrl
+    from PyQt5.QtGui import QGuiApplication, QImage, QPageSize, QPainter, QPdfWriter, QTextDocument
+    from PyQt5.QtSvg import QSvgRenderer
+
+    app = QGuiApplication.instance() or QGuiApplication(['report'])  # Fonts and painting need one, even offscreen
+    document = QTextDocument()
+    for name, svg in plots.items():
+        renderer = QSvgRenderer(QByteArray(svg.encode()))
+        size = renderer.defaultSize() * 2
+        image = QImage(size, QImage.Format_ARGB32)
+        image.fill(0xffffffff)
+        painter = QPainter(image)
+        renderer.render(painter)
+        painter.end()
+        document.addResource(QTextDocument.ImageResource, QUrl(name), image)
+    document.setHtml(page_html)
+    writer = QPdfWriter(path)
+    writer.setPageSize(QPageSize(QPageSize.A4))
+    writer.setResolution(150)
+    document.setPageSize(QSizeF(writer.width(), writer.height()))
+    document.print_(writer)
+    return app
+
+
+def report_filename(recording_path):
+    return os.path.splitext(recording_path)[0] + '_report.html'
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build an HTML (and optionally PDF) report for a recording.")
+    parser.add_argument('recording', help="EEG_Data_*.json or .jsonl recording")
+    parser.add_argument('--output', help="HTML file to write (default: next to the recording)")
+    parser.add_argument('--patient-data', help="Patient_Data_*.json with name, age and ID")
+    parser.add_argument('--events', default='seizure_events.json')
+    parser.add_argument('--medications', default='medication_log.json')
+    parser.add_argument('--pdf', action='store_true', help="also write a PDF")
+    args = parser.parse_args()
+
+    patient = None
+    if args.patient_data:
+        with open(args.patient_data, 'r') as f:
+            patient = json.load(f)
+    for written_path in build_report(args.recording, args.output or report_filename(args.recording), patient,
+                                     args.events, args.medications, args.pdf):
+        print(f"Wrote {written_path}")
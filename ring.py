@@ -0,0 +1,158 @@
+import sys
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+# Header slots (int64): samples written so far, samples being written, capacity, channel count, closed flag
+HEADER_SLOTS = 5
+WRITE_COUNT, WRITE_TARGET, CAPACITY, CHANNELS, CLOSED = range(HEADER_SLOTS)
+
+
+class RingOverrun(Exception):
+    """Raised when a reader's data was overwritten before it was consumed."""
+
+
+class SampleRing:
+    """Single-writer ring of timestamped multi-channel samples in shared memory.
+
+    Every sample is stored twice, at slot i and i + capacity, so any run of up to capacity
+    samples is contiguous and readers always get plain NumPy views, never copies.
+    """
+
+    def __init__(self, capacity, channel_count=1, name=None, create=True):
+        if create:
+            size = HEADER_SLOTS * 8 + 2 * capacity * (8 + 4 * channel_count)
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        else:
+            self.shm = attach_shared_memory(name)
+        self.header = np.ndarray((HEADER_SLOTS,), dtype=np.int64, buffer=self.shm.buf)
+        if create:
+            self.header[:] = (0, 0, capacity, channel_count, 0)
+        capacity, channel_count = int(self.header[CAPACITY]), int(self.header[CHANNELS])
+        self.capacity = capacity
+        self.channel_count = channel_count
+        self.owner = create
+        offset = HEADER_SLOTS * 8
+        self.timestamps = np.ndarray((2 * capacity,), dtype=np.float64, buffer=self.shm.buf, offset=offset)
+        offset += 2 * capacity * 8
+        self.frames = np.ndarray((2 * capacity, channel_count), dtype=np.float32, buffer=self.shm.buf, offset=offset)
+
+    @classmethod
+    def attach(cls, name):
+        """Open a ring created by another process (or thread) for reading."""
+        return cls(0, name=name, create=False)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    @property
+    def write_count(self):
+        return int(self.header[WRITE_COUNT])
+
+    @property
+    def closed(self):
+        return bool(self.header[CLOSED])
+
+    def __len__(self):
+        return min(self.write_count, self.capacity)
+
+    def write(self, timestamps, frames):
+        if not len(timestamps):
+            return
+        frames = np.asarray(frames, dtype=np.float32).reshape(len(timestamps), -1)
+        if frames.shape[1] != self.channel_count:
+            raise ValueError(f"Expected {self.channel_count} channels, got {frames.shape[1]}")
+        count = len(timestamps)
+        if count > self.capacity:  # Only the newest capacity samples can be kept
+            timestamps, frames = timestamps[-self.capacity:], frames[-self.capacity:]
+        write_count = self.write_count
+        # Announce the write first: slots of samples older than write_target - capacity are now unsafe
+        self.header[WRITE_TARGET] = write_count + count
+        position = 0
+        while position < len(frames):
+            slot = (write_count + count - len(frames) + position) % self.capacity
+            run = min(len(frames) - position, self.capacity - slot)
+            for base in (slot, slot + self.capacity):
+                self.timestamps[base:base + run] = timestamps[position:position + run]
+                self.frames[base:base + run] = frames[position:position + run]
+            position += run
+        # Publish only after the data is in place, so readers never see half-written samples
+        self.header[WRITE_COUNT] = write_count + count
+
+    def view(self, start, count):
+        # Samples start .. start + count (absolute sample numbers) as views
+        slot = start % self.capacity
+        return self.timestamps[slot:slot + count], self.frames[slot:slot + count]
+
+    def latest(self, count):
+        """The newest count samples (or fewer), oldest first, as (timestamps, frames) views."""
+        write_count = self.write_count
+        count = min(count, write_count, self.capacity)
+        return self.view(write_count - count, count)
+
+    def reader(self, from_start=False):
+        return RingReader(self, from_start)
+
+    def resized(self, capacity, channel_count=None):
+        """A new ring of the given size holding as much of this ring's history as fits."""
+        channel_count = self.channel_count if channel_count is None else channel_count
+        ring = SampleRing(capacity, channel_count)
+        if channel_count == self.channel_count:
+            timestamps, frames = self.latest(capacity)
+            ring.write(timestamps, frames)
+        return ring
+
+    def close(self):
+        if self.header is None:
+            return
+        if self.owner:
+            self.header[CLOSED] = 1
+        # Drop our views before the mapping goes away
+        self.header = self.timestamps = self.frames = None
+        try:
+            self.shm.close()
+        except BufferError:
+            pass  # A consumer still holds a view; the mapping is released with it
+        if self.owner:
+            self.shm.unlink()
+
+
+class RingReader:
+    """One consumer's cursor into a SampleRing."""
+
+    def __init__(self, ring, from_start=False):
+        self.ring = ring
+        self.cursor = max(0, ring.write_count - ring.capacity) if from_start else ring.write_count
+        self.overrun_samples = 0  # Samples lost because this reader fell more than a ring behind
+        self.last_start = self.cursor
+
+    def available(self):
+        return self.ring.write_count - self.cursor
+
+    def read(self, max_samples=None):
+        """Views of the samples written since the last read, skipping ahead past any overrun."""
+        write_count = self.ring.write_count
+        behind = write_count - self.cursor
+        if behind > self.ring.capacity:
+            lost = behind - self.ring.capacity
+            self.overrun_samples += lost
+            self.cursor += lost
+            behind = self.ring.capacity
+        count = behind if max_samples is None else min(behind, max_samples)
+        self.last_start = self.cursor
+        self.cursor += count
+        return self.ring.view(self.last_start, count)
+
+    def check(self):
+        """Raise RingOverrun if the writer has overwritten the samples returned by the last read."""
+        if self.ring.header[WRITE_TARGET] - self.last_start > self.ring.capacity:
+            raise RingOverrun(f"Writer lapped the reader at sample {self.last_start}")
+
+
+def attach_shared_memory(name):
+    shm = shared_memory.SharedMemory(name=name)
+    if sys.version_info < (3, 13):
+        # Before 3.13 the resource tracker unlinks segments that readers merely attached to
+        resource_tracker.unregister(shm._name, 'shared_memory')
+    return shm
@@ -0,0 +1,356 @@
+import datetime
+import itertools
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+
+from acquisition import SerialSource, SimulatedSource
+from artifacts import ArtifactDetector
+from detection import SeizureDetector
+from filters import FilterStage
+from instrumentation import timed_stage, tracer
+from journal import EventJournal
+from ledger import DoseLedger
+from protocols import DEFAULT_PROTOCOL, ProtocolSelector, SeizureProtocolManager
+from replay import ReplaySource, recording_entries
+from ring import SampleRing
+from settings import buffer_capacity
+
+SOURCE_KINDS = ("Simulated", "Built-in Emulator", "Serial Device", "Replay Recording")
+
+
+def create_source(kind, sample_rate_hz, path=None, channel_count=8, io_loop=None):
+    """Build a sample source by kind; returns (source, emulator) where emulator may be None.
+
+    With an io_loop, serial devices are read on that loop instead of being polled.
+    """
+    if kind == "Simulated":
+        return SimulatedSource(sample_rate_hz), None
+    if kind == "Built-in Emulator":
+        from emulator import SerialEmulator  # Needs POSIX pseudo-terminals
+        emulator = SerialEmulator(sample_rate_hz, channel_count)
+        emulator.start()
+        return serial_source(emulator.port, sample_rate_hz, io_loop), emulator
+    if kind == "Serial Device":
+        return serial_source(path, sample_rate_hz, io_loop), None
+    if kind == "Replay Recording":
+        return ReplaySource(path, speed=1.0), None
+    raise ValueError(f"Unknown source kind: {kind}")
+
+
+def serial_source(port, sample_rate_hz, io_loop=None):
+    if io_loop is None:
+        return SerialSource(port, sample_rate_hz)
+    from aio import AsyncSerialSource
+    return AsyncSerialSource(io_loop, port, sample_rate_hz)
+
+
+class PatientSession(QObject):
+    """One monitored bed: its own acquisition, buffer, detector and protocol state."""
+    status_changed = pyqtSignal(str)  # Signal with session id
+    log_entry = pyqtSignal(str, str)  # Signal with session id and log entry
+
+    def __init__(self, session_id, patient_name, patient_id, source, journal, emulator=None,
+                 sample_rate_hz=256, buffer_retention_s=60, filter_options=None, dose_ledger=None):
+        super().__init__()
+        self.session_id = session_id
+        self.patient_name = patient_name
+        self.patient_id = patient_id
+        self.source = source
+        self.emulator = emulator
+        self.journal = journal
+        # Shared-memory ring, so viewers in other processes read samples without copies
+        self.sample_ring = SampleRing(buffer_capacity(sample_rate_hz, buffer_retention_s))
+        self.filter_stage = FilterStage(sample_rate_hz, **(filter_options or {}))
+        self.artifact_detector = ArtifactDetector(sample_rate_hz)
+        self.samples_received = 0
+        self.dirty = False  # New samples since the tile was last rendered
+        self.auto_mode = False
+        self.seizure_active = False
+        self.active_trace = None  # Correlation ID of the detection awaiting its first dose
+        self.recording_file = None  # Raw samples are streamed here through the journal while recording
+        self.recorded_samples = 0
+
+        self.detector = SeizureDetector()
+        self.protocol_manager = SeizureProtocolManager()
+        self.protocol_manager.add_protocol(**DEFAULT_PROTOCOL)
+        self.protocol_selector = ProtocolSelector(self.protocol_manager)
+        # Beds of the same patient share one ledger through the session manager
+        self.dose_ledger = dose_ledger if dose_ledger is not None else DoseLedger()
+        self.protocol_manager.dose_check = lambda dose_mg, medication: self.dose_ledger.check(
+            self.patient_id, medication, dose_mg)
+
+        self.source.samples_ready.connect(self.ingest_samples)
+        self.detector.seizure_detected.connect(self.on_seizure_detected)
+        self.protocol_manager.dose_to_administer.connect(self.on_dose_to_administer)
+        self.protocol_manager.protocol_started.connect(self.on_protocol_started)
+        self.protocol_manager.protocol_completed.connect(self.on_protocol_completed)
+        self.protocol_manager.protocol_resumed.connect(self.on_protocol_resumed)
+        self.protocol_manager.doses_missed.connect(self.on_doses_missed)
+        self.protocol_manager.dose_withheld.connect(self.on_dose_withheld)
+        self.protocol_selector.protocol_selected.connect(self.on_protocol_selected)
+        self.protocol_selector.episode_ended.connect(self.on_episode_ended)
+
+    def start(self, detector_interval_ms=1000):
+        self.source.start()
+        self.detector.start_detection(detector_interval_ms)
+        # Detection is driven by the bed's samples; no per-bed simulation timer
+        self.detector.timer.stop()
+
+    def stop(self):
+        self.source.stop()
+        self.detector.stop_detection()
+        self.protocol_manager.stop_timer()
+        self.protocol_selector.end_episode()
+
+    def close(self):
+        self.stop()
+        self.stop_recording()
+        if self.emulator is not None:
+            self.emulator.close()
+            self.emulator = None
+        self.sample_ring.close()
+
+    def resize_buffer(self, capacity, channel_count=None):
+        ring = self.sample_ring.resized(capacity, channel_count)
+        self.sample_ring.close()
+        self.sample_ring = ring
+        # Viewers attached to the old ring pick up the new one from the status update
+        self.status_changed.emit(self.session_id)
+
+    @timed_stage('session_ingest')
+    def ingest_samples(self, timestamps, frames):
+        frames = np.asarray(frames, dtype=float).reshape(len(timestamps), -1)
+        # The ring, viewers and the detector all see the re-referenced, filtered stream
+        raw_frames = frames
+        frames = self.filter_stage.process(frames)
+        if frames.shape[1] != self.sample_ring.channel_count:
+            self.resize_buffer(self.sample_ring.capacity, frames.shape[1])
+        self.sample_ring.write(timestamps, frames)
+        self.samples_received += len(timestamps)
+        if self.recording_file is not None:
+            self.journal.append_batch(self.recording_file, recording_entries(timestamps, raw_frames))
+            self.recorded_samples += len(timestamps)
+        # Artifacts are screened out before they can trigger a protocol
+        timestamps, frames, mask = self.artifact_detector.process(timestamps, raw_frames, frames)
+        self.detector.push_samples(timestamps, frames, self.filter_stage.montage_mask(mask))
+        self.dirty = True
+
+    def timestamp(self):
+        return datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+    def set_auto_mode(self, enabled):
+        self.auto_mode = enabled
+        self.status_changed.emit(self.session_id)
+
+    def start_recording(self, filename=None, recorded_samples=0):
+        """Stream raw samples to filename (a new EEG_Data_*.jsonl by default), appending to it if it exists."""
+        if self.recording_file is not None:
+            return
+        if filename is None:
+            filename = f"EEG_Data_{self.patient_id}_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.jsonl"
+        self.recording_file = filename
+        self.recorded_samples = recorded_samples
+        self.status_changed.emit(self.session_id)
+        if recorded_samples:
+            self.log_entry.emit(self.session_id, f"{self.timestamp()}: Recording resumed into {filename} "
+                                                 f"after {recorded_samples} samples.")
+        else:
+            self.log_entry.emit(self.session_id, f"{self.timestamp()}: Recording into {filename}.")
+
+    def stop_recording(self):
+        if self.recording_file is None:
+            return
+        self.journal.close_file(self.recording_file)
+        self.log_entry.emit(self.session_id, f"{self.timestamp()}: Recording stopped; "
+                                             f"{self.recorded_samples} samples in {self.recording_file}.")
+        self.recording_file = None
+        self.status_changed.emit(self.session_id)
+
+    def on_seizure_detected(self):
+        # Only the first detection of an episode is journalled; the rest extend it
+        if not self.protocol_selector.on_detection(self.detector.detection_time, self.detector.onset_time):
+            return
+        self.active_trace = tracer.begin('seizure', self.detector.onset_time, session_id=self.session_id,
+                                         patient_id=self.patient_id)
+        timestamp = self.timestamp()
+        self.journal.append('seizure_events.json', {
+            'timestamp': timestamp,
+            'event': 'Seizure Detected',
+            'trace_id': self.active_trace,
+            'patient_id': self.patient_id
+        })
+        self.seizure_active = True
+        self.status_changed.emit(self.session_id)
+        self.log_entry.emit(self.session_id, f"{timestamp}: Seizure detected.")
+
+    def on_protocol_selected(self, protocol_id, threshold_time):
+        if not self.auto_mode:
+            return
+        protocol = self.protocol_manager.protocols[protocol_id]
+        if self.active_trace is not None:
+            tracer.mark(self.active_trace, 'protocol', wait=True)  # The threshold wait is not latency
+        self.log_entry.emit(self.session_id, f"{self.timestamp()}: Seizure has lasted "
+                                             f"{protocol['seizure_duration_threshold']} min.")
+        self.protocol_manager.start_protocol(protocol_id)
+
+    def on_episode_ended(self, start, end):
+        if self.active_trace is not None and self.protocol_manager.current_protocol is None:
+            tracer.discard(self.active_trace)  # The episode ended before any protocol started
+            self.active_trace = None
+        timestamp = self.timestamp()
+        self.journal.append('seizure_events.json', {
+            'timestamp': timestamp,
+            'event': 'Seizure Ended',
+            'duration_s': end - start,
+            'patient_id': self.patient_id
+        })
+        self.seizure_active = self.protocol_manager.current_protocol is not None
+        self.status_changed.emit(self.session_id)
+        self.log_entry.emit(self.session_id, f"{timestamp}: Seizure episode ended after {end - start:.0f} s.")
+
+    def on_dose_to_administer(self, dose_mg, medication):
+        timestamp = self.timestamp()
+        event = {
+            'timestamp': timestamp,
+            'dose_mg': dose_mg,
+            'medication': medication,
+            'protocol': self.protocol_manager.current_protocol['name'] if self.protocol_manager.current_protocol else 'Manual',
+            'patient_id': self.patient_id
+        }
+        self.dose_ledger.record(self.patient_id, medication, dose_mg)
+        if self.active_trace is not None:
+            tracer.mark(self.active_trace, 'dose')
+            tracer.end(self.active_trace)
+            event['trace_id'] = self.active_trace
+            self.active_trace = None
+        self.journal.append('medication_log.json', event)
+        self.log_entry.emit(self.session_id, f"{timestamp}: Administered {dose_mg} mg of {medication}.")
+
+    def on_dose_withheld(self, dose_mg, medication, reason):
+        self.log_entry.emit(self.session_id, f"{self.timestamp()}: Withheld {dose_mg} mg of {medication}: {reason}.")
+
+    def on_protocol_started(self, protocol_name):
+        self.log_entry.emit(self.session_id, f"{self.timestamp()}: Protocol '{protocol_name}' started.")
+
+    def on_protocol_resumed(self, protocol_name):
+        self.status_changed.emit(self.session_id)
+        self.log_entry.emit(self.session_id, f"{self.timestamp()}: Protocol '{protocol_name}' resumed after a restart.")
+
+    def on_doses_missed(self, missed):
+        for dose in missed:
+            due = datetime.datetime.fromtimestamp(dose['due']).strftime('%Y-%m-%d %H:%M:%S')
+            self.log_entry.emit(self.session_id, f"{self.timestamp()}: Missed dose while not running: "
+                                                 f"{dose['dose_mg']} mg of {dose['medication']} due at {due}.")
+
+    def on_protocol_completed(self, protocol_name):
+        self.seizure_active = self.protocol_selector.episode_active
+        self.status_changed.emit(self.session_id)
+        self.log_entry.emit(self.session_id, f"{self.timestamp()}: Protocol '{protocol_name}' completed.")
+
+    def snapshot_samples(self, count):
+        # Most recent count samples of the display channel, oldest first, as a view into the ring
+        return self.sample_ring.latest(count)[1][:, 0]
+
+
+class SessionManager(QObject):
+    """Supervises many patient sessions with one acquisition poller, one journal and one worker pool."""
+    session_added = pyqtSignal(str)  # Signal with session id
+    session_removed = pyqtSignal(str)
+
+    def __init__(self, journal=None, worker_pool=None, poll_ms=20, sample_rate_hz=256,
+                 buffer_retention_s=60, detector_interval_ms=1000, io_loop=None, filter_options=None,
+                 dose_ledger=None):
+        super().__init__()
+        self.sessions = {}  # Session id -> PatientSession, in bed order
+        self.journal = journal if journal is not None else EventJournal()
+        self.worker_pool = worker_pool if worker_pool is not None else ThreadPoolExecutor(max_workers=2)
+        self.io_loop = io_loop  # Event-driven serial reads for all beds, when available
+        self.sample_rate_hz = sample_rate_hz
+        self.buffer_retention_s = buffer_retention_s
+        self.detector_interval_ms = detector_interval_ms
+        self.filter_options = dict(filter_options or {})
+        self.dose_ledger = dose_ledger if dose_ledger is not None else DoseLedger()
+        self.session_ids = itertools.count(1)
+        # A single timer drains every bed's source instead of one timer per bed
+        self.poll_timer = QTimer()
+        self.poll_timer.timeout.connect(self.poll_sources)
+        self.poll_ms = poll_ms
+
+    def add_session(self, patient_name, patient_id, source, emulator=None):
+        session_id = f"bed-{next(self.session_ids)}"
+        source.shared_polling = True
+        session = PatientSession(session_id, patient_name, patient_id, source, self.journal, emulator,
+                                 self.sample_rate_hz, self.buffer_retention_s, self.filter_options, self.dose_ledger)
+        self.sessions[session_id] = session
+        session.start(self.detector_interval_ms)
+        if not self.poll_timer.isActive():
+            self.poll_timer.start(self.poll_ms)
+        self.session_added.emit(session_id)
+        print(f"Monitoring {patient_name} ({patient_id}) as {session_id}.")
+        return session
+
+    def remove_session(self, session_id):
+        session = self.sessions.pop(session_id, None)
+        if session is None:
+            return
+        session.close()
+        if not self.sessions:
+            self.poll_timer.stop()
+        self.session_removed.emit(session_id)
+        print(f"Stopped monitoring {session.patient_name} ({session.patient_id}).")
+
+    @timed_stage('session_poll')
+    def poll_sources(self):
+        for session in list(self.sessions.values()):
+            if not session.source.event_driven:
+                session.source.poll()
+
+    def set_auto_mode(self, enabled):
+        for session in self.sessions.values():
+            session.set_auto_mode(enabled)
+
+    def set_sample_rate(self, sample_rate_hz):
+        self.sample_rate_hz = sample_rate_hz
+        for session in self.sessions.values():
+            if hasattr(session.source, 'set_sample_rate'):
+                session.source.set_sample_rate(sample_rate_hz)
+            session.resize_buffer(buffer_capacity(sample_rate_hz, self.buffer_retention_s))
+            session.filter_stage.configure(sample_rate_hz=sample_rate_hz)
+            session.artifact_detector.configure(sample_rate_hz)
+
+    def set_buffer_retention(self, buffer_retention_s):
+        self.buffer_retention_s = buffer_retention_s
+        for session in self.sessions.values():
+            session.resize_buffer(buffer_capacity(self.sample_rate_hz, buffer_retention_s))
+
+    def set_filter_options(self, filter_options):
+        self.filter_options = dict(filter_options)
+        for session in self.sessions.values():
+            session.filter_stage.configure(**filter_options)
+
+    def set_detector_interval(self, interval_ms):
+        self.detector_interval_ms = interval_ms
+        for session in self.sessions.values():
+            session.detector.set_interval(interval_ms)
+
+    def save_buffers(self):
+        # Write every bed's buffered samples on the shared worker pool
+        timestamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
+        futures = []
+        for session in self.sessions.values():
+            filename = f"Ward_EEG_{session.patient_id}_{timestamp}.json"
+            samples = session.snapshot_samples(session.sample_ring.capacity).tolist()  # Copy before the ring moves on
+            futures.append(self.worker_pool.submit(self.write_samples, filename, samples))
+        return futures
+
+    def write_samples(self, filename, samples):
+        with open(filename, 'w') as f:
+            json.dump(samples, f)
+        print(f"Ward data saved to {filename}")
+
+    def close(self):
+        for session_id in list(self.sessions):
+            self.remove_session(session_id)
@@ -0,0 +1,109 @@
+import json
+import os
+
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+
+SETTINGS_FILE = "settings.json"
+MAX_BUFFER_SAMPLES = 2 ** 19  # Samples per channel held in memory, whatever the rate and retention
+BOOL_STRINGS = {'1': True, 'true': True, 'yes': True, 'on': True, '0': False, 'false': False, 'no': False, 'off': False}
+
+# Every persisted setting: key -> (type, default, minimum/choices, maximum, label)
+SETTINGS_SPEC = {
+    'sample_rate_hz': (int, 10, 1, 4000, "Sample Rate (Hz)"),
+    'buffer_retention_s': (int, 60, 1, 86400, "Buffer Retention (sec)"),
+    'render_fps': (int, 10, 1, 60, "Plot Refresh Rate (fps)"),
+    'plot_window_points': (int, 100, 10, 100000, "Plot Window (points)"),
+    'detector_interval_ms': (int, 1000, 100, 60000, "Seizure Detection Interval (ms)"),
+    'auto_mode': (bool, False, None, None, "Enable Auto Mode"),
+    'journal_fsync': (str, 'batch', ('never', 'batch', 'always'), None, "Journal fsync Policy"),
+    'worker_threads': (int, 2, 1, 16, "Worker Threads"),
+    'performance_overlay': (bool, False, None, None, "Show Performance Overlay (F12)"),
+    'enforce_dose_limits': (bool, True, None, None, "Enforce Dose Limits (dose_limits.json)"),
+    'latency_budget_ms': (int, 3000, 100, 600000, "Onset-to-Dose Latency Budget (ms)"),
+    'export_port': (int, 0, 0, 65535, "Local Export Port (0 = off)"),
+    'report_pdf': (bool, False, None, None, "Also Write PDF Reports"),
+    'archive_on_save': (bool, True, None, None, "Archive Saved Sessions"),
+    'archive_max_age_days': (int, 0, 0, 36500, "Archive Retention (days, 0 = keep)"),
+    'archive_quota_mb': (int, 0, 0, 1000000, "Archive Quota per Patient (MB, 0 = none)"),
+    'notch_hz': (str, 'off', ('off', '50', '60'), None, "Mains Notch Filter (Hz)"),
+    'highpass_hz': (float, 0.5, 0.0, 100.0, "High-pass Cutoff (Hz, 0 = off)"),
+    'lowpass_hz': (float, 70.0, 0.0, 2000.0, "Low-pass Cutoff (Hz, 0 = off)"),
+    'montage': (str, 'referential', ('referential', 'average', 'bipolar'), None, "Montage"),
+}
+
+
+def buffer_capacity(sample_rate_hz, buffer_retention_s):
+    """Samples per channel to keep in memory: the retention at this rate, capped at MAX_BUFFER_SAMPLES."""
+    return min(sample_rate_hz * buffer_retention_s, MAX_BUFFER_SAMPLES)
+
+
+class Settings(QObject):
+    """Typed application settings persisted to a JSON file."""
+    setting_changed = pyqtSignal(str, object)  # Signal with key and new value
+
+    def __init__(self, path=SETTINGS_FILE):
+        super().__init__()
+        self.path = path
+        self.values = {key: spec[1] for key, spec in SETTINGS_SPEC.items()}
+        # Coalesce bursts of changes (e.g. spinbox scrolling) into a single write
+        self.save_timer = QTimer()
+        self.save_timer.setSingleShot(True)
+        self.save_timer.timeout.connect(self.save)
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r') as f:
+                stored = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Could not read settings from {self.path}: {e}. Using defaults.")
+            return
+        for key, value in stored.items():
+            if key not in SETTINGS_SPEC:
+                continue
+            try:
+                self.values[key] = self.coerce(key, value)
+            except ValueError as e:
+                print(f"Ignoring stored setting {key}: {e}")
+
+    def save(self):
+        self.save_timer.stop()
+        # Write to a temporary file first so a crash never leaves a truncated settings file
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.values, f, indent=4)
+        os.replace(tmp_path, self.path)
+
+    def coerce(self, key, value):
+        value_type, _, minimum, maximum, _ = SETTINGS_SPEC[key]
+        if value_type is bool:
+            # bool("false") is True, so strings from hand-edited or imported files are parsed
+            if isinstance(value, str):
+                if value.strip().lower() not in BOOL_STRINGS:
+                    raise ValueError(f"{value!r} is not a boolean")
+                return BOOL_STRINGS[value.strip().lower()]
+            if value not in (0, 1):
+                raise ValueError(f"{value!r} is not a boolean")
+            return bool(value)
+        if value_type is str:
+            value = str(value)
+            if minimum is not None and value not in minimum:
+                raise ValueError(f"{value!r} is not one of {minimum}")
+            return value
+        value = value_type(value)
+        if value < minimum or value > maximum:
+            raise ValueError(f"{value} is outside the range {minimum}-{maximum}")
+        return value
+
+    def get(self, key):
+        return self.values[key]
+
+    def set(self, key, value):
+        value = self.coerce(key, value)
+        if self.values[key] == value:
+            return
+        self.values[key] = value
+        self.setting_changed.emit(key, value)
+        self.save_timer.start(500)
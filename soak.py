@@ -0,0 +1,227 @@
+import argparse
+import datetime
+import gc
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')  # Run headless unless a platform is forced
+
+import numpy as np
+from PyQt5.QtCore import QEvent, QObject, QTimer
+from PyQt5.QtWidgets import QApplication
+
+from instrumentation import tracer
+
+SOAK_HOURS = 24
+STEP_S = 10  # Simulated seconds of EEG ingested per iteration
+SAMPLE_INTERVAL_S = 3600  # Simulated seconds between metric samples
+SEIZURE_INTERVAL_S = 2 * 3600
+SEIZURE_OFFSET_S = 1800  # Seizures start half way through an hour, so samples fall between episodes
+SEIZURE_LENGTH_S = 360  # Long enough to start the default protocol
+WARMUP_FRACTION = 0.25  # Caches, pools and bounded histories fill up during the first quarter
+TOP_ALLOCATORS = 10
+# Metric -> (allowed growth as a fraction of the post-warmup value, absolute allowance)
+GROWTH_ALLOWANCE = {
+    'rss_mb': (0.10, 16.0),
+    'traced_mb': (0.10, 4.0),
+}
+COUNT_ALLOWANCE = (0.0, 4)  # Object and item counts must stay flat once warmed up
+
+
+def rss_mb():
+    """Resident set size of this process in MB."""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, ValueError):
+        import resource  # No /proc: fall back to the peak, which still shows unbounded growth
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+
+
+def eeg_block(start_time, duration_s, sample_rate_hz, channel_count, rng, seizure_since=None):
+    """Background noise and alpha rhythm, with 3 Hz spike-wave activity after seizure_since.
+
+    The spike-wave is kept small enough that the artifact detector does not mask it as motion.
+    """
+    t = start_time + np.arange(int(duration_s * sample_rate_hz)) / sample_rate_hz
+    frames = 0.5 * np.sin(2 * np.pi * 10 * t)[:, None] + rng.normal(0, 0.2, (len(t), channel_count))
+    if seizure_since is not None:
+        burst = t >= seizure_since
+        phase = 2 * np.pi * 3 * (t[burst] - seizure_since)
+        frames[burst] += (4 * np.sin(phase) ** 15 + 1.5 * np.sin(phase))[:, None]
+    return t, frames
+
+
+def seizure_start(elapsed_s, interval_s):
+    # Start of the seizure that elapsed_s falls in, or None between seizures
+    offset = (elapsed_s - SEIZURE_OFFSET_S) % interval_s
+    if elapsed_s < SEIZURE_OFFSET_S or offset >= SEIZURE_LENGTH_S:
+        return None
+    return elapsed_s - offset
+
+
+def sample_metrics(window, hours):
+    """One row of soak metrics, with the bound of each container that has one."""
+    gc.collect()
+    objects = gc.get_objects()
+    logs = window.logs_text_edit.document()
+    sample = {
+        'simulated_h': hours,
+        'rss_mb': rss_mb(),
+        'traced_mb': tracemalloc.get_traced_memory()[0] / 2 ** 20,
+        'qobjects': sum(isinstance(obj, QObject) for obj in objects),
+        'qtimers': sum(isinstance(obj, QTimer) for obj in objects),
+        'window_children': len(window.findChildren(QObject)),
+        'top_level_widgets': len(QApplication.topLevelWidgets()),
+        'log_lines': logs.blockCount(),
+        'eeg_data': len(window.eeg_data),
+        'medication_logs': len(window.medication_logs),
+        'journal_queue': window.journal.queued(),
+        'open_traces': len(tracer.open_traces),
+    }
+    limits = {
+        'log_lines': logs.maximumBlockCount() or None,  # 0 is unlimited
+        'eeg_data': getattr(window.eeg_data, 'maxlen', None),
+        'medication_logs': getattr(window.medication_logs, 'maxlen', None),
+    }
+    return sample, limits
+
+
+def unbounded_growth(samples, limits, warmup_fraction=WARMUP_FRACTION):
+    """Metrics still growing after the warmup; bounded containers only fail past their bound.
+
+    A metric grows when the peak of the second half of the settled samples exceeds the peak of
+    the first half, so a single step (an allocator arena, a cache filling) is not reported.
+    """
+    settled = samples[int(len(samples) * warmup_fraction):]
+    middle = len(settled) // 2
+    failures = []
+    for name in samples[0]:
+        if name == 'simulated_h':
+            continue
+        limit = limits.get(name)
+        if limit is not None:
+            peak = max(sample[name] for sample in settled)
+            if peak > limit:
+                failures.append(f"{name}: {peak:.4g} exceeds its bound of {limit}")
+            continue
+        earlier = max(sample[name] for sample in settled[:middle + 1])
+        later = max(sample[name] for sample in settled[middle:])
+        fraction, absolute = GROWTH_ALLOWANCE.get(name, COUNT_ALLOWANCE)
+        if later - earlier > max(fraction * earlier, absolute):
+            failures.append(f"{name}: grew from {earlier:.4g} to {later:.4g} after h{settled[middle]['simulated_h']:g}")
+    return failures
+
+
+def top_allocators(before, after, count=TOP_ALLOCATORS):
+    return [
+        {'location': f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+         'size_diff_kb': stat.size_diff / 1024, 'count_diff': stat.count_diff}
+        for stat in after.compare_to(before, 'lineno')[:count]
+    ]
+
+
+def run_soak(hours=SOAK_HOURS, step_s=STEP_S, sample_interval_s=SAMPLE_INTERVAL_S,
+             seizure_interval_s=SEIZURE_INTERVAL_S, channel_count=8, seed=0):
+    """Drive MainWindow offscreen through hours of simulated monitoring; returns the soak report."""
+    app = QApplication.instance() or QApplication(sys.argv)
+    tracemalloc.start()
+    rng = np.random.default_rng(seed)
+    samples = []
+    doses = []
+    limits = {}
+    snapshots = {}
+    with tempfile.TemporaryDirectory() as directory:
+        # Keep settings, journals and the recording written by MainWindow out of the working directory
+        previous_directory = os.getcwd()
+        os.chdir(directory)
+        try:
+            from main import MainWindow
+            from replay import ReplayClock
+            window = MainWindow()
+            window.show()
+            sample_rate_hz = window.settings.get('sample_rate_hz')
+            start = time.time()
+            # Doses and episode gaps follow simulated time; the sample times drive detection
+            clock = ReplayClock(start)
+            window.protocol_manager.set_clock(clock)
+            window.protocol_manager.dose_to_administer.connect(lambda dose_mg, medication: doses.append(medication))
+            window.auto_button.setChecked(True)
+            window.toggle_auto_mode()
+            window.toggle_recording()
+            total_s = hours * 3600
+            warmup_h = hours * WARMUP_FRACTION
+            wall_start = time.perf_counter()
+            elapsed = 0.0
+            while True:
+                if elapsed % sample_interval_s == 0:
+                    sample, limits = sample_metrics(window, elapsed / 3600)
+                    samples.append(sample)
+                    print(f"h{sample['simulated_h']:5.1f}: RSS {sample['rss_mb']:.1f} MB, traced {sample['traced_mb']:.1f} MB, "
+                          f"{sample['qobjects']} QObjects, {sample['qtimers']} QTimers, {sample['log_lines']} log lines")
+                    if 'warm' not in snapshots and sample['simulated_h'] >= warmup_h:
+                        snapshots['warm'] = tracemalloc.take_snapshot()
+                if elapsed >= total_s:
+                    break
+                seizure = seizure_start(elapsed, seizure_interval_s)
+                timestamps, frames = eeg_block(start + elapsed, step_s, sample_rate_hz, channel_count, rng,
+                                               None if seizure is None else start + seizure)
+                window.ingest_samples(timestamps, frames)
+                elapsed += step_s
+                clock.advance(start + elapsed)
+                window.update_eeg_plot()
+                app.processEvents()
+                # processEvents() leaves deleteLater() to the outer event loop, which the soak replaces
+                app.sendPostedEvents(None, QEvent.DeferredDelete)
+            wall_s = time.perf_counter() - wall_start
+            snapshots['end'] = tracemalloc.take_snapshot()
+            window.toggle_recording()
+            window.close()
+        finally:
+            os.chdir(previous_directory)
+    tracemalloc.stop()
+    return {
+        'timestamp': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'platform': platform.platform(),
+        'python': platform.python_version(),
+        'simulated_hours': hours,
+        'wall_s': wall_s,
+        'doses': len(doses),
+        'samples': samples,
+        'limits': limits,
+        'top_allocators': top_allocators(snapshots.get('warm', snapshots['end']), snapshots['end']),
+        'failures': unbounded_growth(samples, limits),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Accelerated soak test: simulated hours of monitoring, checked for memory growth.")
+    parser.add_argument('--hours', type=float, default=SOAK_HOURS, help="simulated session length")
+    parser.add_argument('--step', type=float, default=STEP_S, help="simulated seconds ingested per iteration")
+    parser.add_argument('--sample-interval', type=float, default=SAMPLE_INTERVAL_S, help="simulated seconds between samples")
+    parser.add_argument('--seizure-interval', type=float, default=SEIZURE_INTERVAL_S, help="simulated seconds between seizures")
+    parser.add_argument('--channels', type=int, default=8)
+    parser.add_argument('--output', default='soak_results.json')
+    args = parser.parse_args()
+
+    output_path = os.path.abspath(args.output)
+    report = run_soak(args.hours, args.step, args.sample_interval, args.seizure_interval, args.channels)
+    with open(output_path, 'w') as f:
+        json.dump(report, f, indent=4)
+    print(f"Simulated {report['simulated_hours']:g} h in {report['wall_s']:.0f} s; {report['doses']} doses given.")
+    print("Top allocators since the warmup:")
+    for allocator in report['top_allocators']:
+        print(f"  {allocator['location']}: {allocator['size_diff_kb']:+.1f} KB ({allocator['count_diff']:+d} blocks)")
+    print(f"Results written to {output_path}")
+    if report['failures']:
+        print("Unbounded growth:")
+        for failure in report['failures']:
+            print(f"  {failure}")
+        sys.exit(1)
+    print("No unbounded growth.")
@@ -0,0 +1,103 @@
+import datetime
+import os
+
+import pytest
+
+from analytics import SeizureAnalytics
+from journal import EventJournal
+from protocols import EPISODE_GAP_S
+
+SEIZURES = 'seizure_events.json'
+MEDICATIONS = 'medication_log.json'
+START = datetime.datetime(2024, 3, 1, 9, 0).timestamp()
+
+
+def seizure(offset_s, event='Seizure Detected', patient_id='P1', **fields):
+    timestamp = datetime.datetime.fromtimestamp(START + offset_s).strftime('%Y-%m-%d %H:%M:%S')
+    return dict(fields, timestamp=timestamp, event=event, patient_id=patient_id)
+
+
+def dose(offset_s, patient_id='P1'):
+    timestamp = datetime.datetime.fromtimestamp(START + offset_s).strftime('%Y-%m-%d %H:%M:%S')
+    return {'timestamp': timestamp, 'patient_id': patient_id, 'medication': 'Lorazepam (Ativan)', 'dose_mg': 2}
+
+
+@pytest.fixture
+def analytics(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return SeizureAnalytics(str(tmp_path / "seizure_analytics.json"))
+
+
+@pytest.fixture
+def journals():
+    # Two writers on the same journals, as the GUI and the daemon
+    journals = EventJournal('never'), EventJournal('never')
+    yield journals
+    for journal in journals:
+        journal.close()
+
+
+def test_catch_up_reads_another_writers_records(analytics, journals):
+    gui, daemon = journals
+    gui.append_batch(SEIZURES, [seizure(0), seizure(30, 'Seizure Ended', duration_s=30)])
+    assert analytics.catch_up() == {'P1'}
+    daemon.append_batch(SEIZURES, [seizure(1000, patient_id='P2'), seizure(1040, 'Seizure Ended', 'P2', duration_s=40)])
+    daemon.append_batch(MEDICATIONS, [dose(1010, 'P2')])
+    assert analytics.catch_up() == {'P2'}
+    assert analytics.catch_up() == set()
+    assert analytics.offsets == {SEIZURES: os.path.getsize(SEIZURES), MEDICATIONS: os.path.getsize(MEDICATIONS)}
+    assert analytics.summary('P1')['episodes'] == 1
+    summary = analytics.summary('P2')
+    assert summary['episodes'] == 1 and summary['mean_duration_s'] == 40
+    assert summary['medications']['Lorazepam (Ativan)']['during_episode'] == 1
+
+
+def test_index_events_catches_up_past_an_interleaved_writer(analytics, journals):
+    gui, daemon = journals
+    batches = [(gui, [seizure(0), seizure(20, 'Seizure Ended', duration_s=20)]),
+               (daemon, [seizure(500), seizure(510, 'Seizure Ended', duration_s=10)]),
+               (gui, [seizure(1000), seizure(1005, 'Seizure Ended', duration_s=5)])]
+    for journal, events in batches:
+        offsets = journal.append_batch(SEIZURES, events)
+        if journal is gui:  # Only this process's listener sees its batches
+            analytics.index_events(SEIZURES, events, offsets)
+    assert analytics.offsets[SEIZURES] == os.path.getsize(SEIZURES)
+    summary = analytics.summary('P1')
+    assert summary['episodes'] == 3 and summary['total_duration_s'] == 35
+
+
+def test_partial_record_is_left_for_the_next_read(analytics, journals):
+    journals[0].append_batch(SEIZURES, [seizure(0)])
+    complete = os.path.getsize(SEIZURES)
+    with open(SEIZURES, 'a') as f:
+        f.write('{"timestamp": "2024-03')
+    analytics.catch_up()
+    assert analytics.offsets[SEIZURES] == complete
+
+
+def test_saved_statistics_are_not_applied_twice(analytics, journals):
+    journals[0].append_batch(SEIZURES, [seizure(0), seizure(60, 'Seizure Ended', duration_s=60)])
+    analytics.catch_up()
+    journals[1].append_batch(SEIZURES, [seizure(900), seizure(930, 'Seizure Ended', duration_s=30)])
+    reopened = SeizureAnalytics(analytics.path)
+    assert reopened.catch_up() == {'P1'}
+    assert reopened.summary('P1')['episodes'] == 2
+
+
+def test_detections_split_at_the_protocol_gap(analytics, journals):
+    # Older journals: a detection per tick and no 'Seizure Ended'
+    events = [seizure(0), seizure(10), seizure(20), seizure(20 + EPISODE_GAP_S + 1), seizure(30 + EPISODE_GAP_S)]
+    journals[0].append_batch(SEIZURES, events)
+    analytics.catch_up()
+    summary = analytics.summary('P1')
+    assert summary['episodes'] == 1 and summary['episode_open']
+    assert summary['max_duration_s'] == 20
+
+
+def test_seizure_ended_closes_long_episodes(analytics, journals):
+    # Only the first detection is journalled; the episode lasts well past the gap
+    journals[0].append_batch(SEIZURES, [seizure(0), seizure(5 * EPISODE_GAP_S, 'Seizure Ended',
+                                                                 duration_s=5 * EPISODE_GAP_S)])
+    analytics.catch_up()
+    summary = analytics.summary('P1')
+    assert summary['episodes'] == 1 and summary['mean_duration_s'] == 5 * EPISODE_GAP_S
@@ -0,0 +1,119 @@
+import datetime
+import json
+import struct
+import zlib
+
+import numpy as np
+import pytest
+
+from archive import (BLOCK_SAMPLES, LEGACY_BLOCK_HEADER, EEGArchive, decode_block, encode_block, shuffle_bytes,
+                     write_recording)
+from replay import load_recording
+
+START = datetime.datetime(2024, 3, 1, 9, 0).timestamp()
+
+
+def signal(count, channel_count=3, rate_hz=256.0):
+    timestamps = START + np.arange(count) / rate_hz
+    phases = np.arange(channel_count)[None, :]
+    frames = 40 * np.sin(2 * np.pi * 7 * (timestamps[:, None] - START) + phases)
+    return timestamps, frames
+
+
+def assert_bit_exact(actual, expected):
+    assert actual.dtype == expected.dtype and actual.shape == expected.shape
+    np.testing.assert_array_equal(actual.view(np.uint64), expected.view(np.uint64))
+
+
+def test_round_trip_is_bit_exact():
+    timestamps, frames = signal(1000)
+    decoded_timestamps, decoded_frames = decode_block(encode_block(timestamps, frames))
+    assert_bit_exact(decoded_timestamps, timestamps)
+    assert_bit_exact(decoded_frames, frames)
+
+
+def test_round_trip_keeps_non_finite_samples():
+    timestamps, frames = signal(200, channel_count=2)
+    frames[10, 0] = np.nan
+    frames[11, 1] = np.inf
+    frames[12, 1] = -np.inf
+    frames[13, 0] = -0.0
+    _, decoded = decode_block(encode_block(timestamps, frames))
+    assert_bit_exact(decoded, frames)
+
+
+def test_float32_values_are_stored_narrow():
+    timestamps, frames = signal(2000)
+    narrow = frames.astype(np.float32).astype(np.float64)
+    wide_payload = encode_block(timestamps, frames)
+    narrow_payload = encode_block(timestamps, narrow)
+    assert len(narrow_payload) < len(wide_payload)
+    assert_bit_exact(decode_block(narrow_payload)[1], narrow)
+
+
+def test_non_finite_timestamps_are_rejected():
+    timestamps, frames = signal(10, channel_count=1)
+    timestamps[4] = np.nan
+    with pytest.raises(ValueError):
+        encode_block(timestamps, frames)
+
+
+def test_legacy_quantised_blocks_still_decode():
+    quantum = 0.01
+    first_us = int(START * 1e6)
+    timestamps_us = first_us + np.array([0, 3906, 7813, 11719], dtype=np.int64)
+    levels = np.array([[0, 5], [12, -3], [-7, 100], [4, 4]], dtype=np.int32)
+    deltas = np.diff(levels, axis=0, prepend=np.zeros((1, 2), dtype=np.int32))
+    header = LEGACY_BLOCK_HEADER.pack(len(levels), 2, quantum, first_us)
+    payload = zlib.compress(header + shuffle_bytes(np.diff(timestamps_us)) + shuffle_bytes(deltas.ravel()))
+    timestamps, frames = decode_block(payload, codec=1)
+    np.testing.assert_allclose(timestamps, timestamps_us / 1e6)
+    np.testing.assert_allclose(frames, levels * quantum)
+
+
+def test_block_header_records_sample_width():
+    timestamps, frames = signal(5, channel_count=2)
+    data = zlib.decompress(encode_block(timestamps, frames))
+    assert struct.unpack_from('<IHB', data) == (5, 2, 8)
+
+
+@pytest.fixture
+def archived(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    timestamps, frames = signal(3 * BLOCK_SAMPLES + 100)
+    recording = tmp_path / "EEG_Data_P1_20240301_090000.json"
+    write_recording(recording, timestamps, frames)
+    seizure = {'timestamp': datetime.datetime.fromtimestamp(START + 30).strftime('%Y-%m-%d %H:%M:%S'),
+               'event': 'Seizure Detected', 'patient_id': 'P1'}
+    other_bed = dict(seizure, patient_id='P2')
+    with open("seizure_events.json", 'w') as f:
+        f.write(json.dumps(seizure) + '\n' + json.dumps(other_bed) + '\n')
+    archive = EEGArchive(str(tmp_path / "archive"))
+    entry = archive.archive_session(str(recording), 'P1')
+    return archive, entry, recording
+
+
+def test_archived_session_round_trips(archived):
+    archive, entry, recording = archived
+    timestamps, frames = load_recording(str(recording))
+    assert entry['samples'] == len(timestamps) and len(entry['blocks']) == 4
+    queried_timestamps, queried_frames, _ = archive.query('P1', entry['start'], entry['end'])
+    assert_bit_exact(queried_timestamps, timestamps)
+    assert_bit_exact(queried_frames, frames)
+
+
+def test_query_returns_only_the_requested_range(archived):
+    archive, entry, _ = archived
+    start, end = START + 20, START + 35
+    timestamps, frames, events = archive.query('P1', start, end)
+    assert len(timestamps) == len(frames) > 0
+    assert timestamps[0] >= start and timestamps[-1] <= end
+    assert timestamps[0] - start < 1 / 256 + 1e-6 and end - timestamps[-1] < 1 / 256 + 1e-6
+    assert np.all(np.diff(timestamps) > 0)
+    assert [event['patient_id'] for event in events] == ['P1']
+
+
+def test_query_outside_sessions_is_empty(archived):
+    archive, entry, _ = archived
+    timestamps, frames, events = archive.query('P1', entry['end'] + 10, entry['end'] + 20)
+    assert len(timestamps) == 0 and frames.shape == (0, 1) and events == []
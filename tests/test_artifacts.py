@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+
+from artifacts import ArtifactDetector
+
+RATE_HZ = 256.0
+EPOCH = 64  # Samples per 0.25 s epoch at RATE_HZ
+
+
+@pytest.fixture
+def eeg():
+    rng = np.random.default_rng(1)
+    return rng.normal(scale=20.0, size=(40 * EPOCH, 4))
+
+
+def run(detector, frames, block_samples=100):
+    timestamps = np.arange(len(frames)) / RATE_HZ
+    masks = []
+    for start in range(0, len(frames), block_samples):
+        block = slice(start, start + block_samples)
+        _, _, mask = detector.process(timestamps[block], frames[block], frames[block])
+        masks.append(mask)
+    return np.concatenate(masks)
+
+
+def test_samples_are_released_per_epoch(eeg):
+    detector = ArtifactDetector(RATE_HZ)
+    timestamps = np.arange(100) / RATE_HZ
+    released, filtered, mask = detector.process(timestamps, eeg[:100], eeg[:100])
+    assert len(released) == len(filtered) == len(mask) == EPOCH
+    released, _, _ = detector.process(timestamps[:28] + 1, eeg[100:128], eeg[100:128])
+    np.testing.assert_array_equal(released, np.concatenate([timestamps[EPOCH:], timestamps[:28] + 1]))
+
+
+def test_clean_signal_is_not_flagged(eeg):
+    detector = ArtifactDetector(RATE_HZ)
+    mask = run(detector, eeg)
+    assert not mask.any()
+    assert detector.quality_summary() == "Signal quality: 100%"
+
+
+def test_flatline_is_flagged(eeg):
+    eeg[20 * EPOCH:24 * EPOCH, 1] = 3.0
+    detector = ArtifactDetector(RATE_HZ)
+    mask = run(detector, eeg)
+    assert mask[20 * EPOCH:24 * EPOCH, 1].all()
+    assert not mask[:, [0, 2, 3]].any()
+    assert detector.artifact_counts['flatline'] == 4
+
+
+def test_clipping_is_flagged(eeg):
+    eeg[20 * EPOCH + 10:20 * EPOCH + 20, 2] = eeg[20 * EPOCH:21 * EPOCH, 2].max() + 50
+    detector = ArtifactDetector(RATE_HZ)
+    mask = run(detector, eeg)
+    assert mask[20 * EPOCH:21 * EPOCH, 2].all()
+    assert detector.artifact_counts['clipping'] == 1
+
+
+def test_pop_is_flagged_on_its_channel_only(eeg):
+    eeg[20 * EPOCH + 30, 0] += 2000
+    detector = ArtifactDetector(RATE_HZ)
+    mask = run(detector, eeg)
+    assert mask[20 * EPOCH:21 * EPOCH, 0].all()
+    assert not mask[20 * EPOCH:21 * EPOCH, 1:].any()
+
+
+def test_motion_flags_every_channel(eeg):
+    eeg[20 * EPOCH:21 * EPOCH, :3] *= 50
+    detector = ArtifactDetector(RATE_HZ)
+    mask = run(detector, eeg)
+    assert mask[20 * EPOCH:21 * EPOCH].all()
+    assert detector.artifact_counts['motion'] >= 1
+
+
+def test_channel_count_change_restarts(eeg):
+    detector = ArtifactDetector(RATE_HZ)
+    run(detector, eeg)
+    run(detector, eeg[:, :2])
+    assert detector.channel_count == 2 and len(detector.signal_quality) == 2
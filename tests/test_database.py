@@ -0,0 +1,95 @@
+import json
+import sqlite3
+
+import pytest
+
+from database import EventDatabase
+from journal import EventJournal
+
+MEDICATION_JOURNAL = 'medication_log.json'
+SEIZURE_JOURNAL = 'seizure_events.json'
+
+
+def dose(second=0, patient_id='P1', dose_mg=500):
+    return {'timestamp': f"2024-03-01 09:00:{second:02d}", 'patient_id': patient_id,
+            'medication': 'Levetiracetam (Keppra)', 'dose_mg': dose_mg, 'protocol': 'Protocol 1'}
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    database = EventDatabase(str(tmp_path / "monitor.db"))
+    yield database
+    database.close()
+
+
+def count(database, table):
+    return database.query(f"SELECT COUNT(*) AS n FROM {table}")[0]['n']
+
+
+def test_reimport_adds_nothing(database, tmp_path):
+    with open("Patient_Data_P1.json", 'w') as f:
+        json.dump({'id': 'P1', 'name': 'Test Patient', 'age': '40'}, f)
+    with open(SEIZURE_JOURNAL, 'w') as f:
+        for second in range(3):
+            f.write(json.dumps({'timestamp': f"2024-03-01 09:00:{second:02d}", 'event': 'Seizure Detected',
+                                'patient_id': 'P1'}) + '\n')
+    with open(MEDICATION_JOURNAL, 'w') as f:
+        for second in range(4):
+            f.write(json.dumps(dose(second)) + '\n')
+
+    first = database.import_files(str(tmp_path))
+    assert first == {'patients': 1, 'seizure_events': 3, 'medication_events': 4, 'sessions': 0}
+    second = database.import_files(str(tmp_path))
+    assert second['seizure_events'] == second['medication_events'] == 0
+    assert count(database, 'seizure_events') == 3 and count(database, 'medication_events') == 4
+    assert database.patient('P1')['name'] == 'Test Patient'
+
+
+def test_identical_doses_are_kept(database):
+    with open(MEDICATION_JOURNAL, 'w') as f:
+        f.write(json.dumps(dose()) + '\n' + json.dumps(dose()) + '\n')
+    assert database.import_journal(MEDICATION_JOURNAL) == 2
+    assert database.import_journal(MEDICATION_JOURNAL) == 0
+    assert len(database.medications_for('P1')) == 2
+
+
+def test_live_offsets_match_import(database):
+    # Two writers, as the GUI and the daemon, appending to the same journal in turn
+    journals = EventJournal('never'), EventJournal('never')
+    for second in range(6):
+        events = [dose(second), dose(second)]
+        offsets = journals[second % 2].append_batch(MEDICATION_JOURNAL, events)
+        assert database.index_events(MEDICATION_JOURNAL, events, offsets=offsets) == 2
+    for journal in journals:
+        journal.close()
+    assert database.import_journal(MEDICATION_JOURNAL) == 0
+    assert count(database, 'medication_events') == 12
+
+
+def test_records_without_patient_take_the_default(database):
+    with open(SEIZURE_JOURNAL, 'w') as f:
+        f.write(json.dumps({'timestamp': "2024-03-01 09:00:00", 'event': 'Seizure Detected'}) + '\n')
+        f.write("not json\n")
+    assert database.import_journal(SEIZURE_JOURNAL, default_patient_id='P7') == 1
+    assert [row['event'] for row in database.seizures_for('P7')] == ['Seizure Detected']
+
+
+def test_outdated_medication_index_is_rebuilt(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    path = str(tmp_path / "old.db")
+    with open(MEDICATION_JOURNAL, 'w') as f:
+        f.write(json.dumps(dose()) + '\n' + json.dumps(dose()) + '\n')
+    connection = sqlite3.connect(path)
+    connection.execute("CREATE TABLE medication_events (id INTEGER PRIMARY KEY, patient_id TEXT, time REAL, "
+                       "timestamp TEXT, medication TEXT, dose_mg REAL, protocol TEXT, "
+                       "UNIQUE (patient_id, time, medication, dose_mg))")
+    connection.execute("INSERT INTO medication_events (patient_id, time, timestamp, medication, dose_mg) "
+                       "VALUES ('P1', 0, '', 'x', 1)")
+    connection.commit()
+    connection.close()
+    database = EventDatabase(path)
+    try:
+        assert [row['dose_mg'] for row in database.medications_for('P1')] == [500, 500]
+    finally:
+        database.close()
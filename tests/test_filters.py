@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+
+from filters import CHUNK_SAMPLES, FilterStage, SOSFilter, design_sos, montage_matrix
+
+RATE_HZ = 256.0
+
+
+def lfilter(b, a, x):
+    # Direct form I difference equation, one sample at a time
+    y = np.zeros_like(x)
+    for n in range(len(x)):
+        y[n] = sum(b[k] * x[n - k] for k in range(3) if n >= k)
+        y[n] -= sum(a[k] * y[n - k] for k in range(1, 3) if n >= k)
+    return y
+
+
+def sosfilt(sos, x):
+    for b0, b1, b2, a0, a1, a2 in sos:
+        x = np.stack([lfilter((b0, b1, b2), (a0, a1, a2), channel) for channel in x.T], axis=1)
+    return x
+
+
+@pytest.fixture
+def noisy():
+    rng = np.random.default_rng(0)
+    t = np.arange(700) / RATE_HZ
+    return np.stack([np.sin(2 * np.pi * 10 * t) + np.sin(2 * np.pi * 50 * t), rng.normal(size=len(t)),
+                     np.ones(len(t))], axis=1)
+
+
+@pytest.mark.parametrize('block_samples', [1, 7, CHUNK_SAMPLES, 150, 700])
+def test_block_filtering_matches_reference(noisy, block_samples):
+    sos = design_sos(RATE_HZ, notch_hz=50, highpass_hz=0.5, lowpass_hz=40)
+    sos_filter = SOSFilter(sos, noisy.shape[1])
+    output = np.concatenate([sos_filter.process(noisy[start:start + block_samples])
+                             for start in range(0, len(noisy), block_samples)])
+    np.testing.assert_allclose(output, sosfilt(sos, noisy), atol=1e-9)
+
+
+def test_reset_clears_state(noisy):
+    sos_filter = SOSFilter(design_sos(RATE_HZ, lowpass_hz=30), noisy.shape[1])
+    first = sos_filter.process(noisy)
+    sos_filter.reset()
+    np.testing.assert_allclose(sos_filter.process(noisy), first)
+
+
+def test_notch_removes_mains():
+    t = np.arange(4096) / RATE_HZ
+    mains = np.sin(2 * np.pi * 50 * t)[:, None]
+    output = SOSFilter(design_sos(RATE_HZ, notch_hz=50), 1).process(mains)
+    assert np.abs(output[-1024:]).max() < 0.01
+
+
+def test_cutoffs_at_or_above_nyquist_are_left_out():
+    assert design_sos(RATE_HZ, notch_hz=200, lowpass_hz=128).shape == (0, 6)
+    assert len(design_sos(RATE_HZ, notch_hz=50, highpass_hz=1, lowpass_hz=40)) == 5
+
+
+def test_no_sections_passes_samples_through(noisy):
+    np.testing.assert_array_equal(SOSFilter(design_sos(RATE_HZ), 3).process(noisy), noisy)
+
+
+def test_montages():
+    frames = np.array([[1.0, 2.0, 6.0]])
+    assert montage_matrix('referential', 3) is None
+    np.testing.assert_allclose(frames @ montage_matrix('average', 3).T, [[-2.0, -1.0, 3.0]])
+    np.testing.assert_allclose(frames @ montage_matrix('bipolar', 3).T, [[-1.0, -4.0]])
+    with pytest.raises(ValueError):
+        montage_matrix('laplacian', 3)
+
+
+def test_stage_applies_montage_before_filtering(noisy):
+    stage = FilterStage(RATE_HZ, highpass_hz=1, montage='bipolar')
+    output = stage.process(noisy)
+    assert output.shape == (len(noisy), 2)
+    reference = sosfilt(design_sos(RATE_HZ, highpass_hz=1), noisy @ montage_matrix('bipolar', 3).T)
+    np.testing.assert_allclose(output, reference, atol=1e-9)
+    np.testing.assert_array_equal(stage.montage_mask(np.array([[True, False, False]])), [[True, False]])
@@ -0,0 +1,72 @@
+import datetime
+import json
+
+import pytest
+
+from ledger import DAY_S, HOUR_S, DoseLedger, RollingSum, read_recent_events
+
+KEPPRA = 'Levetiracetam (Keppra)'
+NOW = datetime.datetime(2024, 3, 2, 12, 0).timestamp()
+
+
+def test_rolling_sum_expires_old_values():
+    rolling_sum = RollingSum(60)
+    rolling_sum.add(0, 1.0)
+    rolling_sum.add(30, 2.0)
+    rolling_sum.add(59, 4.0)
+    assert rolling_sum.value(59) == 7.0
+    assert rolling_sum.value(60) == 6.0  # A value exactly window_s old has left the window
+    assert rolling_sum.value(90) == 4.0
+    assert rolling_sum.value(119) == 0.0
+    assert not rolling_sum.entries
+
+
+def test_rolling_sum_stays_bounded_without_reads():
+    rolling_sum = RollingSum(10)
+    for second in range(1000):
+        rolling_sum.add(second, 0.1)
+    assert len(rolling_sum.entries) == 10
+    assert rolling_sum.value(999) == pytest.approx(1.0)
+
+
+def test_rolling_sum_drops_rounding_error_when_empty():
+    rolling_sum = RollingSum(10)
+    for value in (0.1, 0.2, 0.3):
+        rolling_sum.add(0, value)
+    assert rolling_sum.value(10) == 0.0
+
+
+def test_hour_and_day_limits():
+    ledger = DoseLedger({KEPPRA: {'max_1h_mg': 1000, 'max_24h_mg': 2000}})
+    ledger.record('P1', KEPPRA, 750, NOW - 2 * HOUR_S)
+    ledger.record('P1', KEPPRA, 500, NOW - 600)
+    assert ledger.totals('P1', KEPPRA, NOW) == (500, 1250)
+    assert ledger.check('P1', KEPPRA, 500, NOW) is None
+    assert 'mg/h' in ledger.check('P1', KEPPRA, 600, NOW)
+    assert ledger.check('P1', KEPPRA, 300, NOW + 3000) is None  # The last hour has moved past the 500 mg
+    ledger.record('P1', KEPPRA, 300, NOW + 3000)
+    assert 'mg/24 h' in ledger.check('P1', KEPPRA, 500, NOW + 3000)
+    assert ledger.check('P2', KEPPRA, 1000, NOW) is None  # Limits are per patient
+
+
+def test_unlimited_medications_and_disabled_ledger():
+    ledger = DoseLedger({KEPPRA: {'max_1h_mg': 10}})
+    assert ledger.check('P1', 'Unlisted', 1e6, NOW) is None
+    ledger.enabled = False
+    assert ledger.check('P1', KEPPRA, 100, NOW) is None
+
+
+def test_rebuild_loads_only_the_last_day(tmp_path, monkeypatch):
+    monkeypatch.setattr('ledger.READ_BLOCK_BYTES', 256)  # Several blocks, so the backwards scan stops early
+    path = tmp_path / "medication_log.json"
+    with open(path, 'w') as f:
+        for hours_ago in range(48, -1, -1):
+            timestamp = datetime.datetime.fromtimestamp(NOW - hours_ago * HOUR_S - 1).strftime('%Y-%m-%d %H:%M:%S')
+            f.write(json.dumps({'timestamp': timestamp, 'patient_id': 'P1', 'medication': KEPPRA, 'dose_mg': 100})
+                    + '\n')
+        f.write("not json\n")
+    ledger = DoseLedger({})
+    assert ledger.rebuild(str(path), NOW) == 24
+    assert ledger.totals('P1', KEPPRA, NOW) == (100, 2400)
+    events = read_recent_events(str(path), NOW - DAY_S)
+    assert 24 <= len(events) < 49
@@ -0,0 +1,87 @@
+from multiprocessing import resource_tracker
+
+import numpy as np
+import pytest
+
+from ring import RingOverrun, SampleRing
+
+
+@pytest.fixture
+def ring():
+    ring = SampleRing(8, channel_count=2)
+    yield ring
+    ring.close()
+
+
+def samples(start, count):
+    timestamps = np.arange(start, start + count, dtype=float)
+    frames = np.stack([timestamps, -timestamps], axis=1)
+    return timestamps, frames
+
+
+def test_latest_after_wraparound(ring):
+    for start in range(0, 20, 3):
+        ring.write(*samples(start, 3))
+    timestamps, frames = ring.latest(8)
+    assert len(ring) == 8
+    assert ring.write_count == 21
+    np.testing.assert_array_equal(timestamps, np.arange(13, 21))
+    np.testing.assert_array_equal(frames[:, 1], -np.arange(13, 21))
+
+
+def test_write_longer_than_capacity_keeps_newest(ring):
+    ring.write(*samples(0, 20))
+    timestamps, _ = ring.latest(100)
+    np.testing.assert_array_equal(timestamps, np.arange(12, 20))
+
+
+def test_views_are_contiguous_across_the_wrap(ring):
+    ring.write(*samples(0, 6))
+    reader = ring.reader()
+    ring.write(*samples(6, 5))  # Slots 6, 7, 0, 1, 2
+    timestamps, frames = reader.read()
+    np.testing.assert_array_equal(timestamps, np.arange(6, 11))
+    assert np.shares_memory(frames, ring.frames)
+    reader.check()
+
+
+def test_reader_skips_overrun_samples(ring):
+    reader = ring.reader(from_start=True)
+    ring.write(*samples(0, 5))
+    ring.write(*samples(5, 7))
+    timestamps, _ = reader.read()
+    assert reader.overrun_samples == 4
+    np.testing.assert_array_equal(timestamps, np.arange(4, 12))
+    assert reader.available() == 0
+
+
+def test_check_detects_lapped_reader(ring):
+    reader = ring.reader()
+    ring.write(*samples(0, 4))
+    reader.read()
+    ring.write(*samples(4, 8))
+    with pytest.raises(RingOverrun):
+        reader.check()
+
+
+def test_attached_ring_sees_writes(ring):
+    attached = SampleRing.attach(ring.name)
+    # Attaching unregisters the segment from this process's tracker, which the owner still unlinks
+    resource_tracker.register(ring.shm._name, 'shared_memory')
+    try:
+        ring.write(*samples(0, 10))
+        timestamps, _ = attached.latest(3)
+        np.testing.assert_array_equal(timestamps, [7, 8, 9])
+        assert attached.capacity == 8 and attached.channel_count == 2
+    finally:
+        attached.close()
+
+
+def test_resized_keeps_history(ring):
+    ring.write(*samples(0, 10))
+    resized = ring.resized(4)
+    try:
+        timestamps, _ = resized.latest(4)
+        np.testing.assert_array_equal(timestamps, [6, 7, 8, 9])
+    finally:
+        resized.close()
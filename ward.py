@@ -0,0 +1,245 @@
+import math
+import time
+
+import pyqtgraph as pg
+from PyQt5.QtCore import Qt, QTimer
+from PyQt5.QtGui import QFont
+from PyQt5.QtWidgets import (
+    QCheckBox, QComboBox, QDialog, QDialogButtonBox, QFileDialog, QFormLayout, QFrame, QGridLayout,
+    QHBoxLayout, QLabel, QLineEdit, QMessageBox, QPushButton, QSpinBox, QTextEdit, QVBoxLayout, QWidget
+)
+
+from instrumentation import timed_stage
+from sessions import SOURCE_KINDS, create_source
+
+
+class AddBedDialog(QDialog):
+    def __init__(self):
+        super().__init__()
+        self.setWindowTitle("Add Bed")
+        self.init_ui()
+
+    def init_ui(self):
+        layout = QFormLayout()
+
+        self.patient_name_input = QLineEdit()
+        layout.addRow("Patient Name:", self.patient_name_input)
+
+        self.patient_id_input = QLineEdit()
+        layout.addRow("Patient ID:", self.patient_id_input)
+
+        self.source_input = QComboBox()
+        self.source_input.addItems(SOURCE_KINDS)
+        layout.addRow("Source:", self.source_input)
+
+        # Device path or recording file, depending on the source
+        path_layout = QHBoxLayout()
+        self.path_input = QLineEdit()
+        browse_button = QPushButton("Browse...")
+        browse_button.clicked.connect(self.browse_recording)
+        path_layout.addWidget(self.path_input)
+        path_layout.addWidget(browse_button)
+        layout.addRow("Device / Recording:", path_layout)
+
+        self.channel_count_input = QSpinBox()
+        self.channel_count_input.setRange(1, 256)
+        self.channel_count_input.setValue(8)
+        layout.addRow("Emulated Channels:", self.channel_count_input)
+
+        # Dialog buttons
+        buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        buttons.accepted.connect(self.accept)
+        buttons.rejected.connect(self.reject)
+        layout.addWidget(buttons)
+
+        self.setLayout(layout)
+
+    def browse_recording(self):
+        path, _ = QFileDialog.getOpenFileName(self, "Replay Recording", "", "EEG Recordings (*.json *.jsonl)")
+        if path:
+            self.path_input.setText(path)
+
+
+class BedTile(QFrame):
+    """Compact view of one bed: patient, status and a decimated EEG trace."""
+
+    def __init__(self, session, on_remove):
+        super().__init__()
+        self.session = session
+        self.setFrameShape(QFrame.StyledPanel)
+        layout = QVBoxLayout()
+
+        header_layout = QHBoxLayout()
+        title_label = QLabel(f"{session.patient_name} ({session.patient_id})")
+        title_label.setFont(QFont('Arial', 10, QFont.Bold))
+        self.status_label = QLabel()
+        remove_button = QPushButton("Remove")
+        remove_button.clicked.connect(lambda: on_remove(session.session_id))
+        header_layout.addWidget(title_label)
+        header_layout.addStretch(1)
+        header_layout.addWidget(self.status_label)
+        header_layout.addWidget(remove_button)
+        layout.addLayout(header_layout)
+
+        self.plot_widget = pg.PlotWidget()
+        self.plot_widget.setBackground('k')
+        self.plot_widget.setMouseEnabled(False, False)
+        # No axes and a fixed x range: tiles skip tick layout and x autoranging on every frame
+        self.plot_widget.hideAxis('bottom')
+        self.plot_widget.hideAxis('left')
+        self.plot_widget.enableAutoRange(axis='x', enable=False)
+        self.plot_widget.setMinimumHeight(80)
+        self.curve = self.plot_widget.plot(pen=pg.mkPen(color=(0, 255, 0), width=1))
+        # Peak decimation keeps spikes visible while drawing at most a few points per pixel
+        self.curve.setDownsampling(auto=True, method='peak')
+        self.curve.setClipToView(True)
+        self.window_points = None
+        layout.addWidget(self.plot_widget)
+
+        self.setLayout(layout)
+        self.update_status()
+
+    def render(self, points):
+        if points != self.window_points:
+            self.window_points = points
+            self.plot_widget.setXRange(0, points, padding=0)
+        self.curve.setData(self.session.snapshot_samples(points))
+
+    def update_status(self):
+        if self.session.seizure_active:
+            self.status_label.setText("Active Seizure")
+            self.setStyleSheet("QFrame { border: 2px solid #e67e22; }")
+        else:
+            self.status_label.setText("Auto" if self.session.auto_mode else "Monitoring")
+            self.setStyleSheet("")
+
+
+class WardDashboard(QWidget):
+    """Grid of all monitored beds, drawn by a single render loop."""
+
+    def __init__(self, session_manager, settings):
+        super().__init__()
+        self.setWindowTitle("Ward Dashboard")
+        self.setGeometry(150, 150, 1400, 900)
+        self.session_manager = session_manager
+        self.settings = settings
+        self.tiles = {}  # Session id -> BedTile
+        self.render_cursor = 0  # Where the next frame starts, so deferred tiles go first
+        self.init_ui()
+
+        self.session_manager.session_added.connect(self.add_tile)
+        self.session_manager.session_removed.connect(self.remove_tile)
+        for session_id in self.session_manager.sessions:
+            self.add_tile(session_id)
+
+        self.render_timer = QTimer()
+        self.render_timer.timeout.connect(self.render_frame)
+        self.render_timer.start(1000 // self.settings.get('render_fps'))
+
+    def init_ui(self):
+        layout = QVBoxLayout()
+
+        controls_layout = QHBoxLayout()
+        add_bed_button = QPushButton("Add Bed")
+        add_bed_button.clicked.connect(self.add_bed_dialog)
+        save_button = QPushButton("Save All Beds")
+        save_button.clicked.connect(self.session_manager.save_buffers)
+        self.auto_mode_checkbox = QCheckBox("Auto Mode (all beds)")
+        self.auto_mode_checkbox.stateChanged.connect(
+            lambda state: self.session_manager.set_auto_mode(state == Qt.Checked))
+        controls_layout.addWidget(add_bed_button)
+        controls_layout.addWidget(save_button)
+        controls_layout.addWidget(self.auto_mode_checkbox)
+        controls_layout.addStretch(1)
+        layout.addLayout(controls_layout)
+
+        self.grid_layout = QGridLayout()
+        layout.addLayout(self.grid_layout, 1)
+
+        layout.addWidget(QLabel("Ward Log:"))
+        self.ward_log_text_edit = QTextEdit()
+        self.ward_log_text_edit.setReadOnly(True)
+        self.ward_log_text_edit.setMaximumHeight(120)
+        layout.addWidget(self.ward_log_text_edit)
+
+        self.setLayout(layout)
+
+    def add_bed_dialog(self):
+        dialog = AddBedDialog()
+        if dialog.exec_() != QDialog.Accepted:
+            return
+        patient_name = dialog.patient_name_input.text()
+        patient_id = dialog.patient_id_input.text()
+        if not patient_name or not patient_id:
+            QMessageBox.warning(self, "Add Bed", "Please fill in the patient name and ID.")
+            return
+        try:
+            source, emulator = create_source(
+                dialog.source_input.currentText(),
+                self.settings.get('sample_rate_hz'),
+                path=dialog.path_input.text(),
+                channel_count=dialog.channel_count_input.value(),
+                io_loop=self.session_manager.io_loop
+            )
+            session = self.session_manager.add_session(patient_name, patient_id, source, emulator)
+        except Exception as e:
+            QMessageBox.warning(self, "Add Bed", f"Could not start monitoring:\n{e}")
+            return
+        session.set_auto_mode(self.auto_mode_checkbox.isChecked())
+
+    def add_tile(self, session_id):
+        session = self.session_manager.sessions[session_id]
+        tile = BedTile(session, self.session_manager.remove_session)
+        session.status_changed.connect(lambda _: tile.update_status())
+        session.log_entry.connect(self.append_ward_log)
+        self.tiles[session_id] = tile
+        self.layout_tiles()
+
+    def remove_tile(self, session_id):
+        tile = self.tiles.pop(session_id, None)
+        if tile is None:
+            return
+        self.grid_layout.removeWidget(tile)
+        tile.setParent(None)
+        tile.deleteLater()
+        self.layout_tiles()
+
+    def layout_tiles(self):
+        # Near-square grid: 16 beds become 4 x 4
+        columns = max(1, math.ceil(math.sqrt(len(self.tiles))))
+        for index, tile in enumerate(self.tiles.values()):
+            self.grid_layout.addWidget(tile, index // columns, index % columns)
+
+    def append_ward_log(self, session_id, log_entry):
+        session = self.session_manager.sessions.get(session_id)
+        bed = f"{session.patient_name} ({session.patient_id})" if session else session_id
+        self.ward_log_text_edit.append(f"[{bed}] {log_entry}")
+
+    @timed_stage('ward_render')
+    def render_frame(self):
+        # Redraw only beds with new samples, within half a frame of time; the rest go first next frame
+        if not self.tiles:
+            return
+        budget_s = 0.5 / self.settings.get('render_fps')
+        points = self.settings.get('plot_window_points')
+        tiles = list(self.tiles.values())
+        start = time.perf_counter()
+        for offset in range(len(tiles)):
+            tile = tiles[(self.render_cursor + offset) % len(tiles)]
+            if not tile.session.dirty:
+                continue
+            tile.session.dirty = False
+            tile.render(points)
+            if time.perf_counter() - start > budget_s:
+                self.render_cursor = (self.render_cursor + offset + 1) % len(tiles)
+                return
+        self.render_cursor = 0
+
+    def closeEvent(self, event):
+        # Beds keep being monitored; only the view closes
+        self.render_timer.stop()
+        event.accept()
+
+    def showEvent(self, event):
+        self.render_timer.start(1000 // self.settings.get('render_fps'))
+        super().showEvent(event)